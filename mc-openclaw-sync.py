@@ -6,27 +6,94 @@ Watches Mission Control's subagents.json and syncs any changes directly into
 the OpenClaw container's workspace files.
 
 What it does:
-  - Polls subagents.json every POLL_SECS seconds for changes (via hash check).
+  - Watches subagents.json for changes with inotify (debounced), falling back
+    to stat polling every POLL_SECS seconds; the file is only hashed when its
+    stat changes.
   - On change: for every agent in the file, updates their SOUL.md inside the
-    OpenClaw container (via docker exec).
-  - If an agent is new (no workspace found), creates the workspace directory and
-    all required scaffold files, then adds the agent to openclaw.json.
+    OpenClaw container. By default all container operations share one
+    persistent `docker exec -i` session (see ContainerSession); alternatively
+    they can go straight to the Docker Engine API socket (EngineAPIClient)
+    or, for a target whose volume is mounted on the host, to the filesystem
+    (HostVolume).
+    Files whose rendered content matches what was last pushed are skipped
+    (see WriteCache).
+  - If an agent is new (no workspace found), creates the workspace directory,
+    all required scaffold files and shared links — streamed in as one tar
+    archive per cycle — then adds the agent to openclaw.json.
   - If an agent's model changes, updates openclaw.json accordingly.
   - Handles the special case of Atlas → "main" agent (workspace: /data/.openclaw/workspace).
+  - Records each fully applied sync in MANIFEST_FILE and diffs every new
+    roster against it by agent id: only agents whose synced fields changed
+    are rebuilt (a status-only edit writes nothing), and renamed or removed
+    agents have their workspaces moved and openclaw.json entries updated.
+  - Serves Prometheus metrics (cycle/agent durations, container ops, files
+    written vs. skipped, failures by agent, sync lag) on METRICS_LISTEN.
+  - Paces each target's container operations with a token bucket, most
+    urgent first: openclaw.json and Atlas's roster, then agents whose SOUL.md
+    changed, then repairs. Drift fixes (reconciles, forced rebuilds) run on
+    a slower background lane once the changes themselves have landed.
+  - Serves a local control API (CONTROL_LISTEN) through which the Mission
+    Control backend can have an agent synced the moment it saves it, force
+    a full reconcile, or read each agent's last sync, output hashes and
+    last error.
+  - Renders workspace files from templates compiled once and memoized; any
+    of them can be overridden by a file of the same name in TEMPLATE_DIR
+    (Atlas's SOUL.md is ATLAS-SOUL.md), reloaded when its mtime changes.
+  - Follows each container's lifecycle events: while it is down, container
+    work is paused; once it (re)starts, one remote state probe finds the
+    workspaces that no longer match the last sync (e.g. a reset or rolled
+    back /data volume) and only those are pushed again.
+  - Can fan the roster out to several OpenClaw containers or base paths
+    (MC_SYNC_TARGETS); each target has its own sync loop, manifest and
+    metrics, so a slow or stopped one doesn't hold up the rest.
 
 Usage:
-  python3 /docker/missioncontrol/mc-openclaw-sync.py
+  python3 /docker/missioncontrol/mc-openclaw-sync.py [--trace [DIR]]
+
+  --trace writes a Chrome/Perfetto trace-event file for every sync cycle
+  (open it in ui.perfetto.dev or chrome://tracing) to DIR.
 
 Run as a systemd service for automatic startup — see mc-openclaw-sync.service.
 """
 
+import argparse
+import asyncio
+import atexit
+import base64
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import ctypes
+import ctypes.util
 import json
 import subprocess
+import threading
 import hashlib
+import heapq
+import http.client
+import http.server
+import io
+import itertools
 import logging
+import math
 import time
+import select
+import shutil
+import socketserver
+import stat
+import struct
 import sys
 import os
+import posixpath
+import random
+import re
+import socket
+import string
+import tarfile
+import tempfile
+import urllib.parse
+from typing import Callable, Generator, Iterator
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -36,48 +103,1563 @@ SUBAGENTS_FILE  = "/docker/missioncontrol/server/data/subagents.json"
 CONTAINER       = "openclaw-fndc-openclaw-1"
 OPENCLAW_BASE   = "/data/.openclaw"
 OPENCLAW_JSON   = f"{OPENCLAW_BASE}/openclaw.json"
-POLL_SECS       = 5          # How often to check for changes
+POLL_SECS       = 5          # Backstop stat check (the poll interval when inotify is unavailable)
 LOG_LEVEL       = logging.INFO
 
+# Overridable from the environment (e.g. the systemd unit)
+WATCH_MODE      = os.environ.get("MC_SYNC_WATCH", "auto")                 # "auto" (inotify if available) or "poll"
+DEBOUNCE_SECS   = float(os.environ.get("MC_SYNC_DEBOUNCE_SECS", "0.25"))  # Quiet period that ends a burst of saves
+DEBOUNCE_MAX_SECS = float(os.environ.get("MC_SYNC_DEBOUNCE_MAX_SECS", "2"))  # Longest a steady stream of saves can hold off a sync
+TRANSPORT       = os.environ.get("MC_SYNC_TRANSPORT", "session")          # "session", "exec" (one docker exec per op) or "api"; per target also "volume"
+DOCKER_SOCKET   = os.environ.get("MC_SYNC_DOCKER_SOCKET", "/var/run/docker.sock")  # Engine API socket ("api" transport)
+MANIFEST_FILE   = os.environ.get("MC_SYNC_MANIFEST", "/docker/missioncontrol/mc-openclaw-sync.manifest.json")  # Last applied sync
+TEMPLATE_DIR    = os.environ.get("MC_SYNC_TEMPLATE_DIR", "/docker/missioncontrol/mc-openclaw-sync-templates")  # Template overrides
+METRICS_LISTEN  = os.environ.get("MC_SYNC_METRICS", "127.0.0.1:9464")   # "host:port", "unix:/path", or "" to disable
+SYNC_WORKERS    = int(os.environ.get("MC_SYNC_WORKERS", "4"))             # Agents synced concurrently (1 = sequential)
+ENGINE          = os.environ.get("MC_SYNC_ENGINE", "threads")             # "threads" or "asyncio"
+OP_TIMEOUT_SECS = float(os.environ.get("MC_SYNC_OP_TIMEOUT_SECS", "30"))  # Timeout per container op (asyncio engine, "api" transport)
+TARGETS_SPEC    = os.environ.get("MC_SYNC_TARGETS", "")                   # JSON list (or a file holding one) of targets; see load_targets
+RETRY_BASE_SECS = float(os.environ.get("MC_SYNC_RETRY_BASE_SECS", "2"))   # First retry delay for a failed agent (doubles per failure)
+RETRY_MAX_SECS  = float(os.environ.get("MC_SYNC_RETRY_MAX_SECS", "300"))  # Cap on retry and circuit-breaker delays
+OPS_PER_SEC     = float(os.environ.get("MC_SYNC_OPS_PER_SEC", "50"))     # Container ops per second, per target (0 = unlimited)
+OPS_BURST       = float(os.environ.get("MC_SYNC_OPS_BURST", "100"))      # Ops that may go at once after an idle spell
+BACKGROUND_OPS_PER_SEC = float(os.environ.get("MC_SYNC_BACKGROUND_OPS_PER_SEC", "5"))  # Further cap on drift fixes (0 = none)
+TRACE_DIR       = os.environ.get("MC_SYNC_TRACE_DIR", "")                # Chrome trace file per sync cycle ("" = off; see --trace)
+CONTROL_LISTEN  = os.environ.get("MC_SYNC_CONTROL", f"unix:{os.path.dirname(SUBAGENTS_FILE)}/mc-openclaw-sync.sock")  # Control API; "" to disable
+EVENTS          = os.environ.get("MC_SYNC_EVENTS", "on")                  # Follow container start/restart/die events: "on" or "off"
+
 # ---------------------------------------------------------------------------
 # Logging
 # ---------------------------------------------------------------------------
 
+# Name of the agent the current thread is syncing, prefixed to its log lines
+# so output from parallel workers stays attributable. With more than one
+# target, the target's name is prefixed too.
+log_agent:  contextvars.ContextVar[str] = contextvars.ContextVar("log_agent", default="")
+log_target: contextvars.ContextVar[str] = contextvars.ContextVar("log_target", default="")
+
+
+class _AgentLogFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.agent = "".join(f"[{name}] " for name in (log_target.get(), log_agent.get()) if name)
+        return True
+
+
 logging.basicConfig(
     level=LOG_LEVEL,
-    format="%(asctime)s [mc-openclaw-sync] %(levelname)s  %(message)s",
+    format="%(asctime)s [mc-openclaw-sync] %(levelname)s  %(agent)s%(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
 )
+for _handler in logging.getLogger().handlers:
+    _handler.addFilter(_AgentLogFilter())
 log = logging.getLogger(__name__)
 
+
+class _AgentErrorFilter(logging.Filter):
+    """Keeps the first error logged for each agent in a cycle, for the control API's status."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        name = log_agent.get()
+        tgt = current_target.get(None)
+        if record.levelno >= logging.ERROR and name and tgt is not None:
+            tgt.agent_errors.setdefault(name, record.getMessage())
+        return True
+
+
+log.addFilter(_AgentErrorFilter())
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+class _Metric:
+    """A metric family, rendered in the Prometheus text exposition format."""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name   = name
+        self.help   = help
+        self.labels = labels
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @staticmethod
+    def _labels(pairs: list[tuple[str, str]]) -> str:
+        if not pairs:
+            return ""
+        def escape(v: str) -> str:
+            return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._samples(list(zip(self.labels, key)), value))
+        return lines
+
+    def _samples(self, pairs: list[tuple[str, str]], value) -> list[str]:
+        return [f"{self.name}{self._labels(pairs)} {value:g}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...],
+                 labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key, ((0,) * len(self.buckets), 0.0, 0))
+            counts = tuple(c + (value <= b) for c, b in zip(counts, self.buckets))
+            self._values[key] = (counts, total + value, n + 1)
+
+    def _samples(self, pairs: list[tuple[str, str]], value) -> list[str]:
+        counts, total, n = value
+        lines = [
+            f"{self.name}_bucket{self._labels(pairs + [('le', f'{b:g}')])} {c}"
+            for b, c in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_bucket{self._labels(pairs + [('le', '+Inf')])} {n}")
+        lines.append(f"{self.name}_sum{self._labels(pairs)} {total:g}")
+        lines.append(f"{self.name}_count{self._labels(pairs)} {n}")
+        return lines
+
+
+METRICS: list[_Metric] = []
+
+# Every series is labelled with the target it describes
+CYCLE_SECONDS = Histogram(
+    "mc_sync_cycle_duration_seconds", "Duration of a full or partial sync cycle.",
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60), ("target",),
+)
+AGENT_SECONDS = Histogram(
+    "mc_sync_agent_duration_seconds", "Duration of one agent's workspace sync.",
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5), ("target",),
+)
+CYCLES         = Counter("mc_sync_cycles_total", "Sync cycles by outcome (applied or failed).", ("target", "result"))
+CONTAINER_OPS  = Counter("mc_sync_container_ops_total", "Container operations sent, by type.", ("target", "op"))
+FILES          = Counter("mc_sync_files_total", "Workspace file writes by result (written, skipped, failed).", ("target", "result"))
+AGENT_FAILURES = Counter("mc_sync_agent_failures_total", "Failed agent syncs, by agent.", ("target", "agent"))
+SYNC_LAG       = Gauge(
+    "mc_sync_lag_seconds",
+    "Time from the subagents.json mtime to the end of the sync that applied it.",
+    ("target",),
+)
+RETRY_PENDING  = Gauge("mc_sync_retry_pending", "Failed agents waiting for a retry.", ("target",))
+THROTTLED      = Counter(
+    "mc_sync_throttled_seconds_total",
+    "Time container batches waited for the rate limiter, by lane (foreground or background).",
+    ("target", "lane"),
+)
+CIRCUIT_OPEN   = Gauge("mc_sync_circuit_open", "1 while container work is paused because the container is unreachable.", ("target",))
+CONTAINER_EVENTS = Counter("mc_sync_container_events_total", "Container lifecycle events seen (start, restart, die).", ("target", "event"))
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format: str, *args) -> None:
+        log.debug("metrics: " + format, *args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+def serve_http(listen: str, handler: type, what: str) -> socketserver.BaseServer | None:
+    """Serve handler on "host:port" or "unix:/path" from a daemon thread."""
+    if not listen:
+        return None
+    try:
+        if listen.startswith("unix:"):
+            server = _UnixHTTPServer(listen[len("unix:"):], handler)
+        else:
+            host, _, port = listen.rpartition(":")
+            server = http.server.ThreadingHTTPServer((host or "127.0.0.1", int(port)), handler)
+    except (OSError, ValueError) as e:
+        log.warning("%s endpoint disabled — cannot listen on %s: %s", what.capitalize(), listen, e)
+        return None
+    threading.Thread(target=server.serve_forever, name=f"mc-sync-{what}", daemon=True).start()
+    log.info("%s: %s", what.capitalize(), listen)
+    return server
+
+
+def start_metrics_server(listen: str) -> socketserver.BaseServer | None:
+    """Serve /metrics on METRICS_LISTEN."""
+    return serve_http(listen, _MetricsHandler, "metrics")
+
+# ---------------------------------------------------------------------------
+# Tracing
+# ---------------------------------------------------------------------------
+#
+# With TRACE_DIR set (--trace), every sync cycle records nested spans —
+# sync_all, its phases, each agent's sync and the container batches they
+# send — and saves them as a Chrome trace-event file. Otherwise span() hands
+# back a shared no-op, so instrumented code pays one check per span.
+
+class CycleTrace:
+    """The spans of one sync cycle, saved to TRACE_DIR in the trace-event format."""
+
+    _saved = itertools.count(1)
+
+    def __init__(self, name: str) -> None:
+        self.name   = name
+        self.origin = time.perf_counter()
+        self.events: list[dict] = [{
+            "name": "process_name", "ph": "M", "pid": os.getpid(),
+            "args": {"name": f"mc-openclaw-sync {name}"},
+        }]
+        self._tids: dict[object, int] = {}
+        self._lock = threading.Lock()
+
+    def tid(self) -> int:
+        """A track per thread, and per asyncio task, so concurrent spans nest properly."""
+        try:
+            key = asyncio.current_task()
+        except RuntimeError:
+            key = None
+        key = key or threading.current_thread()
+        with self._lock:
+            tid = self._tids.get(key)
+            if tid is None:
+                tid = self._tids[key] = len(self._tids) + 1
+                label = key.name if isinstance(key, threading.Thread) else f"task {log_agent.get() or tid}"
+                self.events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(),
+                                    "tid": tid, "args": {"name": label}})
+        return tid
+
+    def add(self, span: "_Span", end: float) -> None:
+        event = {
+            "name": span.name, "cat": span.cat, "ph": "X", "pid": os.getpid(), "tid": span.tid,
+            "ts":  round((span.start - self.origin) * 1e6, 1),
+            "dur": round((end - span.start) * 1e6, 1),
+            "args": span.args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def save(self) -> None:
+        path = os.path.join(TRACE_DIR, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}-"
+                                       f"{next(self._saved):04d}.json")
+        try:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        except OSError as e:
+            log.warning("Could not save trace %s: %s", path, e)
+            return
+        log.info("Trace of the cycle saved to %s", path)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "cat", "args", "start", "tid")
+
+    def __init__(self, trace: CycleTrace, name: str, cat: str, args: dict) -> None:
+        self.trace = trace
+        self.name  = name
+        self.cat   = cat
+        self.args  = args
+
+    def __enter__(self) -> "_Span":
+        self.tid   = self.trace.tid()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.trace.add(self, time.perf_counter())
+
+    def set(self, **args) -> None:
+        self.args.update(args)
+
+
+class _NoSpan:
+    """What span() returns when not tracing. Falsy, so callers can skip
+    working out arguments nobody will see.
+    """
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def __bool__(self) -> bool:
+        return False
+
+    def set(self, **args) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, cat: str = "sync", **args) -> "_Span | _NoSpan":
+    """A span in the current target's cycle trace, tagged with the agent being
+    synced (a no-op unless the cycle is traced).
+    """
+    if not TRACE_DIR:
+        return _NO_SPAN
+    tgt = current_target.get(None)
+    if tgt is None or tgt.trace is None:
+        return _NO_SPAN
+    agent = log_agent.get()
+    if agent:
+        args["agent"] = agent
+    return _Span(tgt.trace, name, cat, args)
+
+
+@contextlib.contextmanager
+def traced_cycle(agents: list, diff: "RosterDiff | None"):
+    """Trace the enclosed sync cycle of the current target, if tracing."""
+    if not TRACE_DIR:
+        yield
+        return
+    tgt = target()
+    tgt.trace = CycleTrace(tgt.name)
+    try:
+        with span("sync_all", "cycle", agents=len(agents),
+                  diff=diff.summary() if diff is not None else "full sync",
+                  lane="background" if op_priority.get() >= PRIORITY_BACKGROUND else "foreground"):
+            yield
+    finally:
+        trace, tgt.trace = tgt.trace, None
+        trace.save()
+
+
+def _payload_size(op: tuple) -> int:
+    """Bytes an op carries to the container (paths, file content, archive, script)."""
+    return sum(len(part) for part in op[1:] if isinstance(part, (str, bytes)))
+
+
+def docker_span(ops: list[tuple], lowered: list[tuple]) -> "_Span | _NoSpan":
+    """A span for one container batch, named for the kinds of op in it, with
+    the number of ops the container runs and the bytes they carry.
+    """
+    sp = span("docker", "docker")
+    if sp:
+        sp.name = "docker " + "+".join(dict.fromkeys(op[0] for op in ops))
+        sp.set(ops=len(lowered), bytes=sum(map(_payload_size, lowered)), transport=target().transport)
+    return sp
+
+# ---------------------------------------------------------------------------
+# Targets
+# ---------------------------------------------------------------------------
+
+def backoff_secs(attempt: int) -> float:
+    """Delay before retry number attempt (1-based): exponential, capped, with jitter."""
+    delay = min(RETRY_MAX_SECS, RETRY_BASE_SECS * 2 ** min(attempt - 1, 32))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class RetryQueue:
+    """What failed in a target's recent cycles, and when to try it again.
+
+    Keys are agent keys, plus "openclaw.json" for a failed commit of the
+    shared config. A retry is just another sync: agents that failed keep their
+    previous manifest record, so the diff it runs covers only them.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._due: dict[str, tuple[int, float]] = {}   # key -> (failures, monotonic due time)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def update(self, outcomes: dict[str, bool | None], keys: set[str]) -> None:
+        """Apply a cycle's outcomes (None: abandoned, left as-is); forget keys no longer in use."""
+        now = time.monotonic()
+        with self._lock:
+            for key, ok in outcomes.items():
+                if ok:
+                    self._due.pop(key, None)
+                elif ok is False:
+                    failures = self._due.get(key, (0, 0.0))[0] + 1
+                    self._due[key] = (failures, now + backoff_secs(failures))
+            for key in [k for k in self._due if k not in keys]:
+                del self._due[key]
+            RETRY_PENDING.set(len(self._due), target=self.name)
+            due = min((d for _, d in self._due.values()), default=None)
+        if due is not None:
+            log.info("%d failed item(s) queued for retry; next attempt in %.1fs.",
+                     len(self._due), due - now)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._due
+
+    def wait(self) -> float | None:
+        """Seconds until the next retry is due (None if nothing is queued)."""
+        with self._lock:
+            due = min((d for _, d in self._due.values()), default=None)
+        return None if due is None else max(0.0, due - time.monotonic())
+
+
+# Errors from the docker CLI (exec transport) or Engine API that mean the
+# container itself can't be reached, as opposed to an operation failing in it
+_UNREACHABLE = re.compile(
+    r"No such container|is not running|is restarting|is paused|Cannot connect to the Docker daemon"
+)
+
+
+class CircuitBreaker:
+    """Pauses a target's container work while its container is unreachable.
+
+    Opens on the first unreachable error; until the cooldown (backoff_secs,
+    growing with each failed trial) ends, container ops fail fast without
+    touching docker. After it, ops go through as a trial: one that reaches
+    the container closes the breaker, another unreachable error reopens it.
+    When the container's lifecycle events say it has stopped, hold() keeps
+    the breaker open, with no trials, until release() on its next start.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name   = name
+        self.trips  = 0
+        self.held   = False
+        self._until = 0.0
+        self._cond  = threading.Condition()
+
+    def remaining(self) -> float:
+        """Seconds left in the current cooldown (0 when ops may go through,
+        inf while held).
+        """
+        if self.held:
+            return math.inf
+        return max(0.0, self._until - time.monotonic())
+
+    def wait(self) -> None:
+        """Block until container ops may go through."""
+        with self._cond:
+            while left := self.remaining():
+                self._cond.wait(None if left == math.inf else left)
+
+    async def wait_async(self) -> None:
+        """asyncio wait (polls, since release() comes from the event thread)."""
+        while left := self.remaining():
+            await asyncio.sleep(min(left, 1.0))
+
+    def trip(self, reason: str) -> None:
+        with self._cond:
+            if self.remaining():
+                return  # already open (e.g. another worker's batch in the same trial)
+            self.trips += 1
+            delay = backoff_secs(self.trips)
+            self._until = time.monotonic() + delay
+        CIRCUIT_OPEN.set(1, target=self.name)
+        log.warning("Container unreachable (%s) — pausing container work for %.1fs",
+                    reason.strip().splitlines()[0] if reason.strip() else "no response", delay)
+
+    def reset(self) -> None:
+        with self._cond:
+            if not self.trips or self.held:
+                return
+            self.trips  = 0
+            self._until = 0.0
+        CIRCUIT_OPEN.set(0, target=self.name)
+        log.info("Container reachable again — resuming container work.")
+
+    def hold(self, reason: str) -> None:
+        """Keep container work paused until release() (the container is down)."""
+        with self._cond:
+            if self.held:
+                return
+            self.held = True
+        CIRCUIT_OPEN.set(1, target=self.name)
+        log.warning("Container %s — pausing container work until it starts again.", reason)
+
+    def release(self, reason: str) -> None:
+        """End a hold, and any cooldown: the container is up again."""
+        with self._cond:
+            paused = self.held or self.trips
+            self.held   = False
+            self.trips  = 0
+            self._until = 0.0
+            self._cond.notify_all()
+        if paused:
+            CIRCUIT_OPEN.set(0, target=self.name)
+            log.info("Container %s — resuming container work.", reason)
+
+    def observe(self, results: list[tuple[int, str, str]]) -> None:
+        """Trip or reset from the results of a batch that was sent."""
+        for rc, _, err in results:
+            if rc != 0 and _UNREACHABLE.search(err):
+                self.trip(err)
+                return
+        self.reset()
+
+
+# Priorities of container work, most urgent first (see OpScheduler). Work for
+# the cycle as a whole — reading and committing openclaw.json, probing and
+# creating workspaces — runs at PRIORITY_ROSTER; each agent's at its
+# sync_priority; a drift-fixing pass entirely on the background lane. Within
+# a cycle, openclaw.json and the PRIORITY_ROSTER and PRIORITY_CONTENT agents'
+# files are committed before any PRIORITY_REPAIR agent starts (see sync_all).
+PRIORITY_ROSTER     = 0   # openclaw.json (agents, models) and Atlas's roster
+PRIORITY_CONTENT    = 1   # new agents and agents whose SOUL.md fields changed
+PRIORITY_REPAIR     = 2   # the rest: re-rendered templates, link and scaffold repairs
+PRIORITY_BACKGROUND = 3   # the background lane: drift fixes
+
+op_priority: contextvars.ContextVar[int] = contextvars.ContextVar("op_priority", default=PRIORITY_ROSTER)
+
+
+@contextlib.contextmanager
+def background_lane():
+    """Send the container work of the enclosed code on the background lane."""
+    token = op_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        op_priority.reset(token)
+
+
+class TokenBucket:
+    """rate tokens a second, holding at most depth; a rate of 0 means unlimited."""
+
+    def __init__(self, rate: float, depth: float) -> None:
+        self.rate   = rate
+        self.depth  = max(1.0, depth)
+        self.tokens = self.depth
+        self.stamp  = time.monotonic()
+
+    def shortfall(self, cost: int, now: float) -> float:
+        """Seconds until cost tokens (at most a full bucket) are there; 0 if they are."""
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.depth, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp  = now
+        return max(0.0, (min(cost, self.depth) - self.tokens) / self.rate)
+
+    def take(self, cost: int) -> None:
+        if self.rate:
+            self.tokens -= cost
+
+
+class OpScheduler:
+    """Rate-limits a target's container operations and admits them by priority.
+
+    Every op sent draws a token from a bucket refilled at OPS_PER_SEC (up to
+    OPS_BURST); a batch bigger than the bucket goes once it is full and leaves
+    it in debt. Batches waiting for tokens go in op_priority order, first come
+    first served within one, so latency-critical work is sent ahead of the
+    rest while the container never sees more than the configured rate. Batches
+    on the background lane also draw on their own BACKGROUND_OPS_PER_SEC
+    bucket, and only go when nothing more urgent is waiting. This only paces
+    sends; when the results become visible is up to the cycle's commits.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._limit      = TokenBucket(OPS_PER_SEC, OPS_BURST)
+        self._background = TokenBucket(BACKGROUND_OPS_PER_SEC, BACKGROUND_OPS_PER_SEC)
+        self._waiting: list[tuple[int, int]] = []   # heap of (priority, ticket)
+        self._tickets = itertools.count()
+        self._cond = threading.Condition()
+
+    def _unlimited(self, priority: int) -> bool:
+        return not (self._limit.rate or priority >= PRIORITY_BACKGROUND and self._background.rate)
+
+    def _poll(self, entry: tuple[int, int], cost: int) -> float | None:
+        """With the lock held: admit entry if it is next and its tokens are
+        there (0.0); otherwise the seconds until they will be, or None while
+        others go first.
+        """
+        if self._waiting[0] != entry:
+            return None
+        buckets = [self._limit]
+        if entry[0] >= PRIORITY_BACKGROUND:
+            buckets.append(self._background)
+        now = time.monotonic()
+        wait = max(bucket.shortfall(cost, now) for bucket in buckets)
+        if wait:
+            return wait
+        for bucket in buckets:
+            bucket.take(cost)
+        heapq.heappop(self._waiting)
+        self._cond.notify_all()
+        return 0.0
+
+    def _enqueue(self, priority: int) -> tuple[int, int]:
+        entry = (priority, next(self._tickets))
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+        return entry
+
+    def _withdraw(self, entry: tuple[int, int]) -> None:
+        with self._cond:
+            if entry in self._waiting:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _throttled(self, entry: tuple[int, int], secs: float) -> None:
+        if secs > 0.001:
+            THROTTLED.inc(secs, target=self.name,
+                          lane="background" if entry[0] >= PRIORITY_BACKGROUND else "foreground")
+
+    def acquire(self, cost: int) -> None:
+        """Wait until a batch of cost ops may be sent, at the current op_priority."""
+        priority = op_priority.get()
+        if self._unlimited(priority):
+            return
+        start = time.monotonic()
+        entry = self._enqueue(priority)
+        try:
+            with self._cond:
+                while (wait := self._poll(entry, cost)) != 0.0:
+                    self._cond.wait(wait)
+        except BaseException:
+            self._withdraw(entry)
+            raise
+        self._throttled(entry, time.monotonic() - start)
+
+    async def acquire_async(self, cost: int) -> None:
+        """asyncio acquire (polls, since waiters may be threads as well as tasks)."""
+        priority = op_priority.get()
+        if self._unlimited(priority):
+            return
+        start = time.monotonic()
+        entry = self._enqueue(priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._poll(entry, cost)
+                if wait == 0.0:
+                    break
+                await asyncio.sleep(0.01 if wait is None else wait)
+        except BaseException:
+            self._withdraw(entry)
+            raise
+        self._throttled(entry, time.monotonic() - start)
+
+
+class Target:
+    """One OpenClaw instance the roster is pushed to, with all of its sync state.
+
+    Everything that talks to or remembers the remote side (sessions, the write
+    cache, the staged openclaw.json, the manifest, the pending-sync queue)
+    lives here, so each target syncs, fails and lags on its own. Rendering
+    isn't per target: the Template memo serves every target the same output.
+    """
+
+    def __init__(self, name: str, container: str, base: str, manifest_file: str,
+                 transport: str = TRANSPORT, host_base: str | None = None) -> None:
+        self.name          = name
+        self.container     = container
+        self.base          = base
+        self.openclaw_json = f"{base}/openclaw.json"
+        self.transport     = transport
+        self.volume        = HostVolume(base, host_base) if transport == "volume" else None
+        self.sessions        = SessionPool(lambda: ContainerSession(container))
+        self.api_clients     = SessionPool(lambda: EngineAPIClient(DOCKER_SOCKET, container))
+        self.async_sessions  = AsyncSessionPool(container)
+        self.write_cache     = WriteCache()
+        self.openclaw_config = OpenclawConfig(self.openclaw_json)
+        self.manifest        = SyncManifest(manifest_file)
+        # The initial sync on startup is queued like any other change; the
+        # container may have been recreated meanwhile, so it is checked too
+        self.queue           = SyncQueue(pending=True, restarted=True)
+        self.stage: StagedCommit | None = None   # The running cycle's staged outputs
+        self.trace: CycleTrace | None = None     # The running cycle's trace (see TRACE_DIR)
+        self.retries         = RetryQueue(name)
+        self.breaker         = CircuitBreaker(name)
+        self.scheduler       = OpScheduler(name)
+        self.roster_mtime: float | None = None   # mtime of the subagents.json being applied
+        self.lag_mtime:    float | None = None   # mtime of the last roster SYNC_LAG was measured for
+        self.last_applied: float | None = None   # When a roster was last fully applied
+        self.last_error:   str | None   = None
+        self.agents: dict[str, dict] = {}        # agent key -> its last sync and error (see record_outcomes)
+        self.agent_errors: dict[str, str] = {}   # agent name -> first error logged for it this cycle
+        self._executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """The long-lived worker pool (threads, and their sessions, persist across cycles)."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=SYNC_WORKERS, thread_name_prefix=f"mc-sync-{self.name}",
+                )
+            return self._executor
+
+    @contextlib.contextmanager
+    def activated(self):
+        """Make this the current target (see target()) for the enclosed code."""
+        token = current_target.set(self)
+        log_token = log_target.set(self.name if len(targets) > 1 else "")
+        try:
+            yield self
+        finally:
+            log_target.reset(log_token)
+            current_target.reset(token)
+
+    def close(self) -> None:
+        self.sessions.close()
+        self.api_clients.close()
+        self.async_sessions.close()
+
+
+current_target: contextvars.ContextVar[Target] = contextvars.ContextVar("current_target")
+
+
+def target() -> Target:
+    """The target being synced by this thread or task (see Target.activated)."""
+    try:
+        return current_target.get()
+    except LookupError:
+        raise RuntimeError("no sync target is active here") from None
+
+
+class TargetAttr:
+    """Module-level stand-in for a per-target object (write_cache, sessions, ...):
+    attribute access goes to the current target's instance.
+    """
+
+    def __init__(self, attr: str) -> None:
+        object.__setattr__(self, "_attr", attr)
+
+    def __getattr__(self, name: str):
+        return getattr(getattr(target(), self._attr), name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(getattr(target(), self._attr), name, value)
+
+
+TRANSPORTS = ("session", "exec", "api", "volume")
+
+
+def load_targets(spec: str) -> list[Target]:
+    """Parse MC_SYNC_TARGETS: a JSON list, or the path of a file holding one, of
+    {"name": ..., "container": ..., "base": ...} objects. "base" defaults to
+    OPENCLAW_BASE and "name" to the container. "transport" overrides
+    TRANSPORT; "volume" also needs "host_base", the host path mounted at
+    base. An empty spec means the single CONTAINER / OPENCLAW_BASE target.
+
+    With one target the manifest is MANIFEST_FILE; with several, each gets its
+    own alongside it (<manifest>.<name>.json). Raises ValueError if invalid.
+    """
+    if not spec.strip():
+        if TRANSPORT not in TRANSPORTS or TRANSPORT == "volume":
+            raise ValueError(f"MC_SYNC_TRANSPORT={TRANSPORT} needs a target list with host_base")
+        return [Target(CONTAINER, CONTAINER, OPENCLAW_BASE, MANIFEST_FILE)]
+    if spec.lstrip().startswith("["):
+        text = spec
+    else:
+        try:
+            with open(spec, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError as e:
+            raise ValueError(f"cannot read {spec}: {e}") from e
+    try:
+        entries = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"not valid JSON: {e}") from e
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("expected a non-empty JSON list of targets")
+
+    root, ext = os.path.splitext(MANIFEST_FILE)
+    result: list[Target] = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("container"):
+            raise ValueError(f"target without a container: {entry!r}")
+        name = str(entry.get("name") or entry["container"])
+        if not re.fullmatch(r"[A-Za-z0-9_.-]+", name):
+            raise ValueError(f"target name must be [A-Za-z0-9_.-]+: {name!r}")
+        if any(t.name == name for t in result):
+            raise ValueError(f"duplicate target name: {name!r}")
+        base = str(entry.get("base") or OPENCLAW_BASE).rstrip("/")
+        transport = str(entry.get("transport") or TRANSPORT)
+        if transport not in TRANSPORTS:
+            raise ValueError(f"target {name}: unknown transport {transport!r}")
+        host_base = entry.get("host_base")
+        if transport == "volume" and not host_base:
+            raise ValueError(f"target {name}: the volume transport needs host_base")
+        manifest_file = MANIFEST_FILE if len(entries) == 1 else f"{root}.{name}{ext or '.json'}"
+        result.append(Target(name, str(entry["container"]), base, manifest_file,
+                             transport, host_base and str(host_base).rstrip("/")))
+    return result
+
+
+def close_targets() -> None:
+    for tgt in targets:
+        tgt.close()
+
+
+atexit.register(close_targets)
+
 # ---------------------------------------------------------------------------
 # Docker helpers
 # ---------------------------------------------------------------------------
 
+class ContainerSessionError(Exception):
+    """The container transport (session or Engine API socket) is unreachable."""
+
+
+# Request loop run inside the container by ContainerSession. Each request is a
+# header line "<op> <nbytes> [path]" followed by exactly <nbytes> of payload;
+# each response is "<rc> <outbytes> <errbytes>" followed by stdout then stderr.
+# LC_ALL=C makes `read -N` count bytes rather than characters.
+_SESSION_SCRIPT = r"""
+export LC_ALL=C
+tmp=$(mktemp -d) || exit 1
+trap 'rm -rf "$tmp"' EXIT
+while IFS=' ' read -r op n path; do
+  payload=
+  if [ "$n" -gt 0 ]; then IFS= read -r -N "$n" payload || exit 1; fi
+  case "$op" in
+    exec)  bash -c "$payload" </dev/null >"$tmp/o" 2>"$tmp/e"; rc=$? ;;
+    read)  cat -- "$path" >"$tmp/o" 2>"$tmp/e"; rc=$? ;;
+    write) : >"$tmp/o"; { printf '%s' "$payload" >"$path"; } 2>"$tmp/e"; rc=$? ;;
+    untar) : >"$tmp/o"; printf '%s' "$payload" | base64 -d | tar --no-same-owner -xf - -C "$path" 2>"$tmp/e"; rc=$? ;;
+    *)     : >"$tmp/o"; echo "unknown op: $op" >"$tmp/e"; rc=127 ;;
+  esac
+  printf '%d %d %d\n' "$rc" "$(wc -c <"$tmp/o")" "$(wc -c <"$tmp/e")"
+  cat "$tmp/o" "$tmp/e"
+done
+"""
+
+
+class ContainerSession:
+    """A single long-lived `docker exec -i` multiplexing every container operation.
+
+    Operations are tuples: ("exec", cmd), ("read", path), ("write", path,
+    content) or ("untar", dest_dir, tar_bytes) — the archive travels
+    base64-encoded since the request loop can't carry NUL bytes. A batch
+    of operations is pipelined — all requests are sent before the responses
+    are read back in order. If the process has died (e.g. the container was
+    restarted) the session is re-spawned and the batch retried once.
+    """
+
+    def __init__(self, container: str) -> None:
+        self.container = container
+        self.spawns    = 0
+        self._proc: subprocess.Popen | None = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        self._proc = subprocess.Popen(
+            ["docker", "exec", "-i", self.container, "bash", "-c", _SESSION_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self.spawns += 1
+        log.debug("Started container session (pid %d)", self._proc.pid)
+
+    def close(self) -> None:
+        with self._lock:
+            self._kill()
+
+    def _kill(self) -> None:
+        if self._proc is None:
+            return
+        for stream in (self._proc.stdin, self._proc.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.wait()
+        self._proc = None
+
+    @staticmethod
+    def _encode(op: tuple) -> bytes:
+        kind = op[0]
+        if kind == "exec":
+            payload = op[1].encode("utf-8")
+            return f"exec {len(payload)}\n".encode() + payload
+        if kind == "read":
+            return f"read 0 {op[1]}\n".encode()
+        if kind == "write":
+            payload = op[2].encode("utf-8")
+            return f"write {len(payload)} {op[1]}\n".encode() + payload
+        if kind == "untar":
+            payload = base64.b64encode(op[2])
+            return f"untar {len(payload)} {op[1]}\n".encode() + payload
+        raise ValueError(f"unknown container op: {kind}")
+
+    def _read_exact(self, n: int) -> bytes:
+        data = self._proc.stdout.read(n) if n else b""
+        if len(data) != n:
+            raise ContainerSessionError("session closed mid-response")
+        return data
+
+    def _roundtrip(self, ops: list[tuple]) -> list[tuple[int, str, str]]:
+        request = b"".join(self._encode(op) for op in ops)
+        send_error: list[BaseException] = []
+
+        # Write from a helper thread so a large batch can't deadlock against
+        # the container blocking on a full stdout pipe.
+        def send() -> None:
+            try:
+                self._proc.stdin.write(request)
+                self._proc.stdin.flush()
+            except OSError as e:
+                send_error.append(e)
+
+        sender = threading.Thread(target=send, daemon=True)
+        sender.start()
+        results = []
+        try:
+            for _ in ops:
+                header = self._proc.stdout.readline()
+                if not header:
+                    raise ContainerSessionError("session exited")
+                rc, n_out, n_err = (int(x) for x in header.split())
+                out = self._read_exact(n_out).decode("utf-8", errors="replace")
+                err = self._read_exact(n_err).decode("utf-8", errors="replace")
+                results.append((rc, out, err))
+        finally:
+            sender.join()
+        if send_error:
+            raise ContainerSessionError(str(send_error[0]))
+        return results
+
+    def run(self, ops: list[tuple]) -> list[tuple[int, str, str]]:
+        """Run a pipelined batch of operations. Returns one (rc, stdout, stderr) per op."""
+        with self._lock:
+            for attempt in (1, 2):
+                if self._proc is None or self._proc.poll() is not None:
+                    self._kill()
+                    self._start()
+                try:
+                    return self._roundtrip(ops)
+                except (OSError, ValueError, ContainerSessionError) as e:
+                    self._kill()
+                    if attempt == 2:
+                        raise ContainerSessionError(str(e)) from e
+                    log.warning("Container session lost (%s) — reconnecting", e)
+        return []  # unreachable
+
+
+class SessionPool:
+    """Hands out sessions so concurrent workers don't queue on one connection.
+
+    Sessions (anything with run(ops) and close()) are created on demand by
+    factory — at most one per concurrent caller — and kept for reuse, so the
+    pool settles at SYNC_WORKERS long-lived sessions.
+    """
+
+    def __init__(self, factory) -> None:
+        self.factory = factory
+        self._free: list = []
+        self._all:  list = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                sess = self._free.pop()
+            else:
+                sess = self.factory()
+                self._all.append(sess)
+        try:
+            yield sess
+        finally:
+            with self._lock:
+                self._free.append(sess)
+
+    @property
+    def spawns(self) -> int:
+        return sum(s.spawns for s in self._all)
+
+    def close(self) -> None:
+        for sess in self._all:
+            sess.close()
+
+
+sessions = TargetAttr("sessions")
+
+
+class EngineAPIError(Exception):
+    """The Docker Engine API answered with an error status."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """http.client connection over a unix socket (kept alive between requests)."""
+
+    def __init__(self, socket_path: str, timeout: float | None = None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class EngineAPIClient:
+    """Runs container operations through the Docker Engine API (no docker CLI).
+
+    Drop-in for ContainerSession (same run(ops) contract). Requests share one
+    keep-alive connection; exec-start hijacks its connection for the
+    multiplexed output stream, so it gets a fresh one each time. Files go in
+    and out through the /archive endpoints, owned by the container's user
+    (copyUIDGID) just as `cat >` via exec would leave them.
+    """
+
+    API_VERSION = "v1.41"
+
+    def __init__(self, socket_path: str, container: str) -> None:
+        self.socket_path = socket_path
+        self.container   = container
+        self.spawns      = 0   # never spawns processes; kept for SessionPool parity
+        self.connections = 0
+        self._conn: _UnixHTTPConnection | None = None
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _request(self, method: str, path: str, body: bytes | None = None,
+                 content_type: str = "application/json") -> bytes:
+        url = f"/{self.API_VERSION}{path}"
+        headers = {"Content-Type": content_type} if body is not None else {}
+        for attempt in (1, 2):
+            if self._conn is None:
+                self._conn = _UnixHTTPConnection(self.socket_path, timeout=OP_TIMEOUT_SECS)
+                self.connections += 1
+            try:
+                self._conn.request(method, url, body=body, headers=headers)
+                resp = self._conn.getresponse()
+                data = resp.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                # A kept-alive connection may have been closed by the daemon
+                self.close()
+                if attempt == 2:
+                    raise ContainerSessionError(f"Engine API unreachable: {e}") from e
+        if resp.status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode("utf-8", errors="replace")
+            raise EngineAPIError(resp.status, message.strip())
+        return data
+
+    def _exec_start(self, exec_id: str) -> tuple[bytes, bytes]:
+        """Start an exec on a hijacked connection and demultiplex its output."""
+        body = b'{"Detach": false, "Tty": false}'
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(OP_TIMEOUT_SECS)
+        try:
+            sock.connect(self.socket_path)
+            self.connections += 1
+            sock.sendall(
+                f"POST /{self.API_VERSION}/exec/{exec_id}/start HTTP/1.1\r\n"
+                f"Host: docker\r\nContent-Type: application/json\r\n"
+                f"Connection: Upgrade\r\nUpgrade: tcp\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            stream = sock.makefile("rb")
+            status = int(stream.readline().split()[1])
+            while stream.readline() not in (b"\r\n", b"\n", b""):
+                pass  # response headers
+            if status not in (101, 200):
+                raise EngineAPIError(status, stream.read().decode("utf-8", errors="replace"))
+            out, err = [], []
+            # Frames: 1 byte stream type (1 stdout, 2 stderr), 3 pad, 4 byte size
+            while len(header := stream.read(8)) == 8:
+                size = int.from_bytes(header[4:], "big")
+                (err if header[0] == 2 else out).append(stream.read(size))
+            return b"".join(out), b"".join(err)
+        except OSError as e:
+            raise ContainerSessionError(f"Engine API unreachable: {e}") from e
+        finally:
+            sock.close()
+
+    def exec(self, cmd: str) -> tuple[int, str, str]:
+        created = json.loads(self._request(
+            "POST", f"/containers/{self.container}/exec",
+            json.dumps({"AttachStdout": True, "AttachStderr": True,
+                        "Cmd": ["bash", "-c", cmd]}).encode(),
+        ))
+        out, err = self._exec_start(created["Id"])
+        out, err = out.decode("utf-8", errors="replace"), err.decode("utf-8", errors="replace")
+        deadline = time.monotonic() + OP_TIMEOUT_SECS
+        delay = 0.01
+        while True:
+            info = json.loads(self._request("GET", f"/exec/{created['Id']}/json"))
+            if not info.get("Running") and info.get("ExitCode") is not None:
+                return info["ExitCode"], out, err
+            if time.monotonic() >= deadline:
+                # Without an exit code the command can't be taken to have worked
+                return 1, out, err + f"exec still running after {OP_TIMEOUT_SECS:g}s — exit code unknown\n"
+            time.sleep(delay)  # output is drained; the exit code lands a moment later
+            delay = min(delay * 2, 0.5)
+
+    def put_archive(self, dest: str, archive: bytes) -> None:
+        query = urllib.parse.urlencode({"path": dest, "copyUIDGID": "1"})
+        self._request("PUT", f"/containers/{self.container}/archive?{query}",
+                      archive, content_type="application/x-tar")
+
+    def read(self, path: str) -> str:
+        query = urllib.parse.urlencode({"path": path})
+        data = self._request("GET", f"/containers/{self.container}/archive?{query}")
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            member = tar.next()
+            if member is None or not member.isfile():
+                raise EngineAPIError(400, f"{path} is not a regular file")
+            return tar.extractfile(member).read().decode("utf-8", errors="replace")
+
+    def write(self, path: str, content: str) -> None:
+        data = content.encode("utf-8")
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            info = tarfile.TarInfo(posixpath.basename(path))
+            info.size, info.mode, info.mtime = len(data), 0o644, time.time()
+            tar.addfile(info, io.BytesIO(data))
+        self.put_archive(posixpath.dirname(path) or "/", buf.getvalue())
+
+    def run(self, ops: list[tuple]) -> list[tuple[int, str, str]]:
+        results = []
+        for op in ops:
+            try:
+                if op[0] == "exec":
+                    results.append(self.exec(op[1]))
+                elif op[0] == "read":
+                    results.append((0, self.read(op[1]), ""))
+                elif op[0] == "write":
+                    self.write(op[1], op[2])
+                    results.append((0, "", ""))
+                elif op[0] == "untar":
+                    self.put_archive(op[1], op[2])
+                    results.append((0, "", ""))
+                else:
+                    raise ValueError(f"unknown container op: {op[0]}")
+            except EngineAPIError as e:
+                results.append((1, "", str(e)))
+        return results
+
+
+api_clients = TargetAttr("api_clients")
+
+
+class HostVolume:
+    """Carries out container ops directly on a host directory that is mounted
+    at the target's base inside the container (transport "volume").
+
+    Container paths under base map to the same paths under host_base; symlink
+    targets and file contents stay in container terms, so the volume ends up
+    exactly as the exec path would leave it. Files are written to a temp file
+    renamed over the original (keeping its mode and owner). The fsyncs for a
+    run of consecutive writes are batched: every file, then each directory
+    once, before the renames. New files and directories take the owner of
+    host_base, as they would coming from the container's user.
+    """
+
+    MAX_PENDING = 256   # Writes held open before a batch is flushed anyway
+
+    def __init__(self, base: str, host_base: str) -> None:
+        self.base      = base
+        self.host_base = host_base
+        self._umask = os.umask(0)
+        os.umask(self._umask)
+
+    def _host(self, path: str) -> str:
+        path = posixpath.normpath(path)
+        if path == self.base or path.startswith(self.base + "/"):
+            return self.host_base + path[len(self.base):]
+        raise OSError(f"{path} is outside the volume at {self.base}")
+
+    def _chown(self, host: str, like: os.stat_result | None = None) -> None:
+        """Give a new path the owner of like (default: the volume root)."""
+        if os.geteuid() != 0:
+            return
+        st = like or os.stat(self.host_base)
+        os.lchown(host, st.st_uid, st.st_gid)
+
+    def _makedirs(self, host: str) -> None:
+        missing = []
+        while not os.path.isdir(host):
+            missing.append(host)
+            host = os.path.dirname(host)
+        for path in reversed(missing):
+            os.mkdir(path)
+            self._chown(path)
+
+    def _realpath(self, path: str) -> str:
+        """`realpath -m` of a container path, following symlinks inside the volume."""
+        resolved = "/"
+        parts = list(reversed(path.split("/")))
+        hops = 0
+        while parts:
+            part = parts.pop()
+            if part in ("", "."):
+                continue
+            if part == "..":
+                resolved = posixpath.dirname(resolved)
+                continue
+            candidate = posixpath.join(resolved, part)
+            try:
+                host = self._host(candidate)
+            except OSError:
+                host = None   # outside the volume: taken as-is
+            if host is not None and os.path.islink(host) and hops < 40:
+                hops += 1
+                link = os.readlink(host)
+                if link.startswith("/"):
+                    resolved = "/"
+                parts.extend(reversed(link.split("/")))
+            else:
+                resolved = candidate
+        return resolved
+
+    def run(self, ops: list[tuple]) -> list[tuple[int, str, str]]:
+        if not os.path.isdir(self.host_base):
+            raise ContainerSessionError(f"{self.host_base} is not mounted")
+        results: list[tuple[int, str, str]] = []
+        pending: list[tuple[int, str, str, object]] = []   # (result index, tmp, dest, file)
+        for op in ops:
+            if op[0] != "write" or len(pending) >= self.MAX_PENDING:
+                self._flush(pending, results)
+            try:
+                if op[0] == "write":
+                    pending.append((len(results), *self._stage(op[1], op[2])))
+                    results.append((0, "", ""))
+                    continue
+                handler = getattr(self, f"_op_{op[0]}", None)
+                if handler is None:
+                    results.append((126, "", f"{op[0]} ops are not available on a volume target"))
+                    continue
+                results.append(handler(*op[1:]))
+            except OSError as e:
+                results.append((1, "", str(e)))
+        self._flush(pending, results)
+        return results
+
+    def _stage(self, path: str, content: str) -> tuple[str, str, object]:
+        """Write content next to path, unsynced; _flush moves it into place."""
+        dest = self._host(path)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=f".{os.path.basename(dest)}.")
+        f = os.fdopen(fd, "wb")
+        try:
+            f.write(content.encode("utf-8"))
+            try:
+                st = os.stat(dest)
+                os.chmod(tmp, stat.S_IMODE(st.st_mode))
+                self._chown(tmp, st)
+            except FileNotFoundError:
+                os.chmod(tmp, 0o666 & ~self._umask)
+                self._chown(tmp)
+        except BaseException:
+            f.close()
+            os.unlink(tmp)
+            raise
+        return tmp, dest, f
+
+    def _flush(self, pending: list, results: list) -> None:
+        synced = []
+        for index, tmp, dest, f in pending:
+            try:
+                with f:
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, dest)
+                synced.append(os.path.dirname(dest))
+            except OSError as e:
+                results[index] = (1, "", str(e))
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp)
+        for directory in dict.fromkeys(synced):
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        pending.clear()
+
+    def _op_read(self, path: str) -> tuple[int, str, str]:
+        with open(self._host(path), "rb") as f:
+            return 0, f.read().decode("utf-8", errors="replace"), ""
+
+    def _op_untar(self, dest: str, archive: bytes) -> tuple[int, str, str]:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            members = tar.getmembers()
+            # dest may lie outside the volume (the scaffold archive unpacks at
+            # "/"), so every member is mapped onto the host on its own
+            for member in members:
+                member.name = self._host(posixpath.join(dest, member.name)).lstrip("/")
+            if hasattr(tarfile, "tar_filter"):
+                tar.extractall("/", members, filter="tar")
+            else:
+                tar.extractall("/", members)
+        for member in members:
+            self._chown("/" + member.name)
+        return 0, "", ""
+
+    def _op_rm(self, path: str) -> tuple[int, str, str]:
+        host = self._host(path)
+        if os.path.isdir(host) and not os.path.islink(host):
+            shutil.rmtree(host)
+        elif os.path.lexists(host):
+            os.unlink(host)
+        return 0, "", ""
+
+    def _op_symlink(self, target: str, link: str) -> tuple[int, str, str]:
+        host = self._host(link)
+        os.symlink(target, host)
+        self._chown(host)
+        return 0, "", ""
+
+    def _op_mkdir(self, path: str) -> tuple[int, str, str]:
+        self._makedirs(self._host(path))
+        return 0, "", ""
+
+    def _op_copy(self, src: str, dst: str) -> tuple[int, str, str]:
+        host_src, host_dst = self._host(src), self._host(dst)
+        shutil.copy2(host_src, host_dst)
+        self._chown(host_dst, os.stat(host_src))
+        return 0, "", ""
+
+    def _op_move(self, old: str, new: str) -> tuple[int, str, str]:
+        host_old, host_new = self._host(old), self._host(new)
+        if not os.path.isdir(host_old) or os.path.lexists(host_new):
+            return 1, "", ""
+        self._makedirs(os.path.dirname(host_new))
+        os.rename(host_old, host_new)
+        return 0, "", ""
+
+    def _op_commit(self, entries: list[tuple[str, str, str]]) -> tuple[int, str, str]:
+        """What _COMMIT_SCRIPT does: verify every temp file, then rename each
+        directory's files unless one of them is bad.
+        """
+        moves = [(self._host(tmp), self._host(dest), digest, posixpath.dirname(dest))
+                 for tmp, dest, digest in entries]
+        bad: dict[str, str] = {}
+        for tmp, dest, digest, directory in moves:
+            try:
+                with open(tmp, "rb") as f:
+                    matches = hashlib.sha256(f.read()).hexdigest() == digest
+            except OSError:
+                matches = False
+            if not matches:
+                bad[directory] = f"staged {os.path.basename(dest)} missing or not as written"
+            elif os.path.isdir(dest) and not os.path.islink(dest):
+                bad[directory] = f"{os.path.basename(dest)} is a directory"
+        for tmp, dest, _, directory in moves:
+            if directory in bad:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp)
+                continue
+            try:
+                with contextlib.suppress(FileNotFoundError):
+                    st = os.stat(dest)
+                    os.chmod(tmp, stat.S_IMODE(st.st_mode))
+                    self._chown(tmp, st)
+                os.replace(tmp, dest)
+            except OSError as e:
+                bad[directory] = f"could not move {os.path.basename(dest)} into place: {e}"
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp)
+        for directory in dict.fromkeys(os.path.dirname(dest) for _, dest, _, _ in moves):
+            with contextlib.suppress(OSError):
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        return int(bool(bad)), "".join(f"{d}\t{reason}\n" for d, reason in bad.items()), ""
+
+    def _op_sha256(self, path: str) -> tuple[int, str, str]:
+        host = self._host(path)
+        if not os.path.isfile(host):
+            return 1, "", ""
+        with open(host, "rb") as f:
+            return 0, f"{hashlib.sha256(f.read()).hexdigest()}  {path}\n", ""
+
+    def _op_probe(self, workspaces: list[str], files: tuple[str, ...],
+                  links: tuple[str, ...]) -> tuple[int, str, str]:
+        """The probe script's snapshot (see _PROBE_SCRIPT), taken in Python."""
+        snapshot = {}
+        for workspace in workspaces:
+            host = self._host(workspace)
+            state = {"exists": os.path.isdir(host), "files": {}, "links": {}}
+            for name in files:
+                path = os.path.join(host, name)
+                if os.path.isfile(path):
+                    with open(path, "rb") as f:
+                        state["files"][name] = hashlib.sha256(f.read()).hexdigest()
+                else:
+                    state["files"][name] = None
+            for name in links:
+                path = os.path.join(host, name)
+                if os.path.islink(path):
+                    state["links"][name] = {"target": self._realpath(f"{workspace}/{name}"), "empty": None}
+                elif os.path.isdir(path):
+                    state["links"][name] = {"target": None, "empty": not os.listdir(path)}
+                else:
+                    state["links"][name] = {"target": None, "empty": None}
+            snapshot[workspace] = state
+        return 0, json.dumps(snapshot) + "\n", ""
+
+
+def _oneshot_command(op: tuple) -> tuple[list[str], bytes | None]:
+    """The `docker exec` argv (and stdin bytes) that runs op on its own."""
+    container = target().container
+    if op[0] == "exec":
+        return ["docker", "exec", container, "bash", "-c", op[1]], None
+    if op[0] == "read":
+        return ["docker", "exec", container, "cat", "--", op[1]], None
+    if op[0] == "untar":
+        _, dest, archive = op
+        return ["docker", "exec", "-i", container,
+                "tar", "--no-same-owner", "-xf", "-", "-C", dest], archive
+    _, path, content = op
+    return ["docker", "exec", "-i", container, "bash", "-c", f"cat > {path}"], content.encode("utf-8")
+
+
+def _run_oneshot(op: tuple) -> tuple[int, str, str]:
+    """Run one operation with its own `docker exec` process (TRANSPORT "exec")."""
+    argv, stdin = _oneshot_command(op)
+    result = subprocess.run(argv, input=stdin, capture_output=True)
+    return (result.returncode,
+            result.stdout.decode("utf-8", errors="replace"),
+            result.stderr.decode("utf-8", errors="replace"))
+
+
+# Ops beyond the four every transport speaks. The docker transports run them
+# as these shell commands (lower_ops); the volume transport does them itself.
+_FS_COMMANDS: dict[str, Callable[..., str]] = {
+    "rm":      lambda path: f"rm -rf {path}",
+    "symlink": lambda target, link: f"ln -s {target} {link}",
+    "mkdir":   lambda path: f"mkdir -p {path}",
+    "copy":    lambda src, dst: f"cp -p {src} {dst}",
+    "move":    lambda old, new: (f"[ -d {old} ] && [ ! -e {new} ] && "
+                                 f"mkdir -p {posixpath.dirname(new)} && mv {old} {new}"),
+    "sha256":  lambda path: f"sha256sum {path} 2>/dev/null",
+}
+
+
+def lower_ops(ops: list[tuple]) -> tuple[list[tuple], list[int]]:
+    """Rewrite ops as exec/read/write/untar ops for the docker transports.
+
+    Returns the lowered batch and, per original op, the index of the lowered
+    op whose result answers it (a "probe" or "commit" becomes a write plus an
+    exec).
+    """
+    lowered: list[tuple] = []
+    answers: list[int] = []
+    for op in ops:
+        if op[0] == "probe":
+            lowered.extend(_probe_commands(*op[1:]))
+        elif op[0] == "commit":
+            lowered.extend(_commit_commands(*op[1:]))
+        elif op[0] in _FS_COMMANDS:
+            lowered.append(("exec", _FS_COMMANDS[op[0]](*op[1:])))
+        else:
+            lowered.append(op)
+        answers.append(len(lowered) - 1)
+    return lowered, answers
+
+
+def count_container_ops(ops: list[tuple]) -> None:
+    name = target().name
+    for op in ops:
+        CONTAINER_OPS.inc(target=name, op=op[0])
+
+
+def docker_pipeline(ops: list[tuple]) -> list[tuple[int, str, str]]:
+    """Run several container operations in order over the configured transport.
+
+    With the session transport the batch is pipelined over one session.
+    Returns one (returncode, stdout, stderr) per operation.
+    """
+    tgt = target()
+    if tgt.breaker.remaining():
+        return [(1, "", "container unreachable (circuit open)")] * len(ops)
+    if tgt.transport == "volume":
+        lowered, answers = ops, list(range(len(ops)))
+    else:
+        lowered, answers = lower_ops(ops)
+    with span("rate limit", "docker", ops=len(lowered)):
+        tgt.scheduler.acquire(len(lowered))
+    count_container_ops(lowered)
+    with docker_span(ops, lowered):
+        try:
+            if tgt.transport == "volume":
+                results = tgt.volume.run(ops)
+            elif tgt.transport == "exec":
+                results = [_run_oneshot(op) for op in lowered]
+            else:
+                pool = api_clients if tgt.transport == "api" else sessions
+                with pool.acquire() as sess:
+                    results = sess.run(lowered)
+        except ContainerSessionError as e:
+            log.error("Container session unavailable: %s", e)
+            tgt.breaker.trip(str(e))
+            return [(1, "", str(e))] * len(ops)
+    tgt.breaker.observe(results)
+    return [results[i] for i in answers]
+
+
 def docker_exec(cmd: str) -> tuple[int, str, str]:
     """Run a bash command in the OpenClaw container. Returns (returncode, stdout, stderr)."""
-    result = subprocess.run(
-        ["docker", "exec", CONTAINER, "bash", "-c", cmd],
-        capture_output=True, text=True,
-    )
-    return result.returncode, result.stdout, result.stderr
+    return docker_pipeline([("exec", cmd)])[0]
 
 
 def docker_write(path: str, content: str) -> bool:
-    """Write content to a file inside the OpenClaw container via stdin pipe."""
-    result = subprocess.run(
-        ["docker", "exec", "-i", CONTAINER, "bash", "-c", f"cat > {path}"],
-        input=content, text=True, capture_output=True,
-    )
-    if result.returncode != 0:
-        log.error("Failed to write %s: %s", path, result.stderr.strip())
+    """Write content to a file inside the OpenClaw container."""
+    rc, _, err = docker_pipeline([("write", path, content)])[0]
+    if rc != 0:
+        log.error("Failed to write %s: %s", path, err.strip())
         return False
     return True
 
 
-def docker_read_json(path: str):
-    """Read and parse a JSON file from inside the OpenClaw container."""
-    rc, out, err = docker_exec(f"cat {path} 2>/dev/null")
+def _parse_json_output(path: str, rc: int, out: str):
     if rc != 0 or not out.strip():
         return None
     try:
@@ -87,60 +1669,608 @@ def docker_read_json(path: str):
         return None
 
 
+def docker_read_json(path: str):
+    """Read and parse a JSON file from inside the OpenClaw container."""
+    rc, out, _ = docker_pipeline([("read", path)])[0]
+    return _parse_json_output(path, rc, out)
+
+
 def docker_write_json(path: str, data) -> bool:
     """Write a JSON object to a file inside the OpenClaw container."""
     content = json.dumps(data, indent=2) + "\n"
     return docker_write(path, content)
 
 
+# Sync logic that talks to the container is written as "steps": generators
+# that yield a batch of ops (the tuples docker_pipeline takes) and are sent
+# back its results. The same steps are driven by the threaded engine
+# (run_steps) and the asyncio engine (run_steps_async).
+
+def run_steps(steps: Generator):
+    """Drive a steps generator with blocking docker_pipeline calls; returns its result."""
+    try:
+        ops = next(steps)
+        while True:
+            ops = steps.send(docker_pipeline(ops))
+    except StopIteration as stop:
+        return stop.value
+
+
 # ---------------------------------------------------------------------------
-# Skills linking
+# Write cache
 # ---------------------------------------------------------------------------
 
-def ensure_skills_link(workspace: str) -> None:
-    """Ensure agent workspaces reuse the shared skills directory."""
-    target = f"{OPENCLAW_BASE}/workspace/skills"
+class WriteCache:
+    """Remembers a hash of the last content pushed to each workspace file.
+
+    Keyed by (workspace, filename). A file is only written when its rendered
+    output differs from what was last pushed successfully. The hashes of the
+    last few versions pushed before that are kept too, so a file rolled back
+    to one of them can be told apart from one edited inside the container.
+    """
+
+    HISTORY = 8   # earlier pushed hashes kept per file
+
+    def __init__(self) -> None:
+        self._hashes: dict[tuple[str, str], str] = {}
+        self._history: dict[tuple[str, str], list[str]] = {}
+        self._lock  = threading.Lock()
+        self.hits     = 0   # writes skipped because the content was unchanged
+        self.misses   = 0   # writes actually sent to the container
+        self.failures = 0   # writes the container rejected
+
+    @staticmethod
+    def _digest(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def is_current(self, workspace: str, filename: str, content: str) -> bool:
+        digest = self._digest(content)
+        with self._lock:
+            return self._hashes.get((workspace, filename)) == digest
+
+    def record(self, workspace: str, filename: str, content: str) -> None:
+        self.record_digest(workspace, filename, self._digest(content))
+
+    def record_digest(self, workspace: str, filename: str, digest: str) -> None:
+        key = (workspace, filename)
+        with self._lock:
+            previous = self._hashes.get(key)
+            self._hashes[key] = digest
+            if previous is not None and previous != digest:
+                history = [h for h in self._history.get(key, []) if h not in (previous, digest)]
+                self._history[key] = (history + [previous])[-self.HISTORY:]
+
+    def pushed(self, workspace: str, filename: str) -> str | None:
+        """Hash of the content last pushed to a file, if known."""
+        with self._lock:
+            return self._hashes.get((workspace, filename))
+
+    def forget(self, workspace: str, filename: str) -> None:
+        with self._lock:
+            self._hashes.pop((workspace, filename), None)
+
+    def pushed_earlier(self, workspace: str, filename: str, digest: str) -> bool:
+        """Whether digest is one of the versions pushed before the last one
+        (i.e. the file was rolled back to it)."""
+        with self._lock:
+            return digest in self._history.get((workspace, filename), ())
+
+    def invalidate(self, workspace: str) -> None:
+        """Forget everything pushed to a workspace (e.g. it vanished from the container)."""
+        with self._lock:
+            for key in [k for k in self._hashes if k[0] == workspace]:
+                del self._hashes[key]
+
+    def count(self, hits: int = 0, misses: int = 0, failures: int = 0) -> None:
+        with self._lock:
+            self.hits     += hits
+            self.misses   += misses
+            self.failures += failures
+        for result, n in (("skipped", hits), ("written", misses), ("failed", failures)):
+            if n:
+                FILES.inc(n, target=target().name, result=result)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.failures = 0
+
+    def snapshot(self) -> dict[str, dict[str, str]]:
+        """{workspace: {filename: hash}} — the form stored in the sync manifest."""
+        files: dict[str, dict[str, str]] = {}
+        with self._lock:
+            for (workspace, filename), digest in self._hashes.items():
+                files.setdefault(workspace, {})[filename] = digest
+        return files
+
+    def restore(self, files: dict[str, dict[str, str]]) -> None:
+        with self._lock:
+            for workspace, hashes in files.items():
+                for filename, digest in hashes.items():
+                    self._hashes[(workspace, filename)] = digest
+
+    def history_snapshot(self) -> dict[str, dict[str, list[str]]]:
+        """{workspace: {filename: [earlier hashes, oldest first]}} — stored in the sync manifest."""
+        history: dict[str, dict[str, list[str]]] = {}
+        with self._lock:
+            for (workspace, filename), digests in self._history.items():
+                history.setdefault(workspace, {})[filename] = list(digests)
+        return history
+
+    def restore_history(self, history: dict[str, dict[str, list[str]]]) -> None:
+        with self._lock:
+            for workspace, files in history.items():
+                for filename, digests in files.items():
+                    self._history[(workspace, filename)] = list(digests)[-self.HISTORY:]
+
+
+write_cache = TargetAttr("write_cache")
+
+
+class StagedCommit:
+    """A sync cycle's outputs, staged beside their destinations and moved into
+    place by commit_steps, atomically per directory.
+
+    Each file is written to a hidden temp path (.<name>.mc-sync) in its own
+    directory (a workspace, or the base for openclaw.json); commit_steps then
+    sends one "commit" op that checks every temp file staged since the last
+    commit against the sha256 of the content meant for it and renames the
+    files of each directory whose files all match over their destinations.
+    OpenClaw never sees a half-written file or a half-updated workspace, a
+    cycle that fails before a commit changes none of the files staged for it,
+    and one bad destination fails only its own directory.
+    """
+
+    def __init__(self) -> None:
+        # temp path -> (workspace, filename, sha256); a file staged again replaces its entry
+        self._staged: dict[str, tuple[str, str, str]] = {}
+        self._committed: dict[str, tuple[str, str, str]] = {}   # the same, once sent to a commit
+        self._extra: set[str] = set()   # temp paths of files outside the write cache
+        self.failed: dict[str, str] = {}   # directory -> why its files weren't committed
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def temp_path(workspace: str, filename: str) -> str:
+        return f"{workspace}/.{filename}.mc-sync"
+
+    def add(self, workspace: str, filename: str, digest: str) -> None:
+        with self._lock:
+            self._staged[self.temp_path(workspace, filename)] = (workspace, filename, digest)
+
+    @property
+    def entries(self) -> list[tuple[str, str, str, str]]:
+        """(workspace, filename, temp path, sha256) for every file staged, committed or not."""
+        with self._lock:
+            staged = {**self._committed, **self._staged}
+            return [(w, f, tmp, digest) for tmp, (w, f, digest) in staged.items()]
+
+    @property
+    def pending(self) -> list[tuple[str, str, str, str]]:
+        """The entries staged since the last commit."""
+        with self._lock:
+            return [(w, f, tmp, digest) for tmp, (w, f, digest) in self._staged.items()]
+
+    @property
+    def workspaces(self) -> set[str]:
+        return {workspace for workspace, _, _, _ in self.entries}
+
+    def commit_steps(self, extra: dict[str, str] | None = None) -> Generator:
+        """Stage extra ({path: content}) too, then commit everything staged
+        since the last commit in one batch. Returns True if every file staged
+        so far is in place; the directories whose files aren't are left in
+        failed.
+        """
+        writes = []
+        for path, content in (extra or {}).items():
+            workspace, filename = posixpath.split(path)
+            self.add(workspace, filename, WriteCache._digest(content))
+            self._extra.add(self.temp_path(workspace, filename))
+            writes.append(("write", self.temp_path(workspace, filename), content))
+        with self._lock:
+            batch, self._staged = self._staged, {}
+            self._committed.update(batch)
+        if not batch:
+            return not self.failed
+        entries = [(w, f, tmp, digest) for tmp, (w, f, digest) in batch.items()]
+        *_, (rc, out, err) = yield writes + [
+            ("commit", [(tmp, f"{w}/{f}", digest) for w, f, tmp, digest in entries]),
+        ]
+        # The commit answers with a "<directory>\t<reason>" line per directory
+        # it left alone; a failure without any means none got through
+        failed = {}
+        for line in out.splitlines():
+            directory, _, reason = line.partition("\t")
+            failed[directory] = f"commit failed: {reason}"
+        if rc != 0 and not failed:
+            reason = f"commit failed: {err.strip() or 'no response'}"
+            failed = {workspace: reason for workspace, _, _, _ in entries}
+        for directory, reason in failed.items():
+            self.failed.setdefault(directory, reason)
+        for workspace, filename, tmp, digest in entries:
+            if tmp in self._extra:
+                continue
+            if workspace in self.failed:
+                write_cache.forget(workspace, filename)
+            else:
+                write_cache.record_digest(workspace, filename, digest)
+        for directory, reason in failed.items():
+            log.error("%s: %s — its staged files were not committed", directory, reason)
+        return not self.failed
+
+
+# Run by the docker transports for a "commit" op, on a list ($list) of
+# "<sha256> <temp path> <destination>" lines: checks every temp file's hash
+# with one sha256sum run, then, directory by directory, renames the files
+# over their destinations (taking on the mode and owner of the file they
+# replace) — or, if one of a directory's files doesn't match or its
+# destination is a directory, removes that directory's temp files and
+# prints "<directory>\t<reason>" for it. Exits 1 if any directory failed.
+_COMMIT_SCRIPT = r"""
+mapfile -t lines <"$list"; rm -f -- "$list"
+declare -A want bad
+tmps=() dests=()
+for l in "${lines[@]}"; do
+  read -r h t d <<<"$l"; tmps+=("$t"); dests+=("$d"); want[$t]=$h
+done
+while read -r h t; do
+  [ "${want[$t]}" = "$h" ] && unset "want[$t]"
+done < <(printf '%s\0' "${tmps[@]}" | xargs -0 sha256sum 2>/dev/null)
+for i in "${!tmps[@]}"; do
+  t=${tmps[$i]} d=${dests[$i]}
+  if [ -n "${want[$t]+x}" ]; then
+    bad[${d%/*}]="staged ${d##*/} missing or not as written"
+  elif [ -d "$d" ] && [ ! -L "$d" ]; then
+    bad[${d%/*}]="${d##*/} is a directory"
+  fi
+done
+for i in "${!tmps[@]}"; do
+  t=${tmps[$i]} d=${dests[$i]}
+  if [ -n "${bad[${d%/*}]+x}" ]; then rm -f -- "$t"; continue; fi
+  if [ -e "$d" ]; then
+    chmod --reference="$d" -- "$t" 2>/dev/null; chown --reference="$d" -- "$t" 2>/dev/null
+  fi
+  mv -fT -- "$t" "$d" || { rm -f -- "$t"; bad[${d%/*}]="could not move ${d##*/} into place"; }
+done
+for w in "${!bad[@]}"; do printf '%s\t%s\n' "$w" "${bad[$w]}"; done
+[ ${#bad[@]} -eq 0 ]
+"""
 
-    # If already symlinked to target, do nothing
-    rc, out, _ = docker_exec(f"if [ -L {workspace}/skills ]; then readlink -f {workspace}/skills; fi")
-    if out.strip() == target:
-        return
 
-    # If skills dir exists and is not empty, leave it alone
-    rc, out, _ = docker_exec(
-        f"if [ -d {workspace}/skills ] && [ ! -L {workspace}/skills ]; then ls -A {workspace}/skills; fi"
-    )
-    if out.strip():
-        log.warning("%s/skills is not empty; leaving as-is", workspace)
-        return
+def _commit_commands(entries: list[tuple[str, str, str]]) -> list[tuple]:
+    """The write and exec ops a "commit" op stands for; the exec one answers it."""
+    listing = f"/tmp/mc-openclaw-sync-commit.{os.getpid()}.{next(_probe_ids)}"
+    return [
+        ("write", listing, "".join(f"{digest} {tmp} {dest}\n" for tmp, dest, digest in entries)),
+        ("exec", f"list={listing}\n{_COMMIT_SCRIPT}"),
+    ]
+
+
+def _write_files_steps(workspace: str, files: dict[str, str],
+                       remote: dict[str, str | None] | None = None) -> Generator:
+    """Write every file in {filename: content} that the cache says is stale,
+    pipelined to the container in one batch. Returns {filename: True if
+    written, False if the write failed, None if skipped}.
+
+    remote ({filename: sha256 or None}, from a remote state probe) is what the
+    container actually holds. With it, files already matching are skipped
+    even if the cache has never seen them, and files changed inside the
+    container since they were last pushed are detected. A file rolled back to
+    an earlier pushed version is simply rewritten; any other change was made
+    inside the container, and is left alone when MC has nothing new for the
+    file, otherwise backed up before being replaced.
+    """
+    results: dict[str, bool | None] = {}
+    pending = []
+    backups = []
+    for filename, content in files.items():
+        if remote is None or filename not in remote:
+            current = pushed = None
+            up_to_date = write_cache.is_current(workspace, filename, content)
+        else:
+            current = remote[filename]
+            pushed  = write_cache.pushed(workspace, filename)
+            up_to_date = current == WriteCache._digest(content)
+        if up_to_date:
+            write_cache.record(workspace, filename, content)
+            write_cache.count(hits=1)
+            log.debug("%s/%s unchanged — skipping write", workspace, filename)
+            results[filename] = None
+            continue
+        if current is not None and write_cache.pushed_earlier(workspace, filename, current):
+            log.info("%s/%s was rolled back to an earlier version — pushing it again",
+                     workspace, filename)
+        elif current is not None and pushed is not None and current != pushed:
+            if pushed == WriteCache._digest(content):
+                log.warning("%s/%s was modified inside the container and MC has no "
+                            "newer content — leaving it as-is", workspace, filename)
+                write_cache.count(hits=1)
+                results[filename] = None
+                continue
+            backup = f"{filename}.{time.strftime('%Y%m%d-%H%M%S')}.bak"
+            log.warning("%s/%s was modified inside the container — keeping that version "
+                        "as %s before updating it", workspace, filename, backup)
+            backups.append((filename, content, backup))
+            continue
+        pending.append((filename, content))
+
+    if backups:
+        outcomes = yield [("copy", f"{workspace}/{f}", f"{workspace}/{b}") for f, _, b in backups]
+        for (filename, content, _), (rc, _, err) in zip(backups, outcomes):
+            if rc != 0:
+                log.error("Failed to back up %s/%s — not overwriting it: %s",
+                          workspace, filename, err.strip())
+                write_cache.count(failures=1)
+                results[filename] = False
+            else:
+                pending.append((filename, content))
+    if not pending:
+        return results
+
+    # Inside a cycle the files join its staged commit; otherwise they are
+    # committed here, on their own
+    stage = target().stage
+    standalone = stage is None
+    if standalone:
+        stage = StagedCommit()
+    write_cache.count(misses=len(pending))
+    outcomes = yield [("write", StagedCommit.temp_path(workspace, f), c) for f, c in pending]
+    for (filename, content), (rc, _, err) in zip(pending, outcomes):
+        if rc != 0:
+            log.error("Failed to write %s/%s: %s", workspace, filename, err.strip())
+            write_cache.count(failures=1)
+            results[filename] = False
+            continue
+        stage.add(workspace, filename, WriteCache._digest(content))
+        results[filename] = True
+    if standalone and not (yield from stage.commit_steps()):
+        write_cache.count(failures=len(stage.entries))
+        results.update({filename: False for _, filename, _, _ in stage.entries})
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Sync manifest
+# ---------------------------------------------------------------------------
+
+# Which subagents.json fields each synced output is built from. Fields not
+# listed (status, task, skills, ...) never cause container work. Scaffold files
+# are only written when a workspace is created, so they have no entry here.
+OUTPUT_FIELDS = {
+    "SOUL.md":       ("name", "role", "description", "soul"),
+    "openclaw.json": ("name", "model"),
+}
+# Atlas's SOUL.md also lists every sub-agent, but reads only these fields
+ROSTER_FIELDS = ("name", "role")
+
+
+def _fingerprint(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def field_fingerprints(agent: dict) -> dict[str, str]:
+    """{field: hash of its value} for one agent record."""
+    return {field: _fingerprint(value) for field, value in agent.items()}
+
+
+def soul_template_for(agent: dict) -> "Template":
+    return ATLAS_SOUL_TEMPLATE if is_atlas(agent) else SOUL_TEMPLATE
+
+
+def roster_fingerprint(agents: list) -> str:
+    """Hash of the sub-agent fields Atlas's roster table is built from."""
+    return _fingerprint([[a.get(f) for f in ROSTER_FIELDS] for a in agents if not is_atlas(a)])
+
+
+class RosterDiff:
+    """How a roster differs from the last applied one, record by record.
+
+    Records are matched on their stable id (agent_key). added holds new keys,
+    changed maps keys to the set of fields that changed, renamed maps keys
+    whose agentId changed to (old name, new name), and removed maps vanished
+    keys to their old name. stale maps keys to the outputs (see
+    OUTPUT_FIELDS) that must be rebuilt.
+    """
+
+    def __init__(self) -> None:
+        self.added:   set[str] = set()
+        self.changed: dict[str, set[str]] = {}
+        self.renamed: dict[str, tuple[str, str]] = {}
+        self.removed: dict[str, str] = {}
+        self.stale:   dict[str, set[str]] = {}
+        self.forced = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.stale or self.renamed or self.removed)
 
-    # Replace empty dir with a symlink to the shared skills
-    docker_exec(f"rm -rf {workspace}/skills")
-    docker_exec(f"ln -s {target} {workspace}/skills")
-    log.info("Linked %s/skills -> %s", workspace, target)
+    def force(self, keys: set[str]) -> None:
+        """Rebuild every output of these agents, changed or not."""
+        for key in keys:
+            self.stale[key] = set(OUTPUT_FIELDS)
+        self.forced = len(keys)
 
+    def summary(self) -> str:
+        return (f"{len(self.added)} added, {len(self.changed)} changed, "
+                f"{len(self.renamed)} renamed, {len(self.removed)} removed"
+                + (f", {self.forced} forced" if self.forced else ""))
 
-def ensure_vault_link(workspace: str) -> None:
-    """Ensure agent workspaces can access the shared Obsidian vault."""
-    target = f"{OPENCLAW_BASE}/vault"
+
+class SyncManifest:
+    """The last fully applied sync, persisted to MANIFEST_FILE across restarts.
+
+    Holds, per agent record (keyed by its stable id), its name, a hash of
+    each field and the digest of the SOUL.md template it was rendered with;
+    the roster fingerprint behind Atlas's SOUL.md; and the write cache's
+    per-file output hashes, with the few pushed before them. diff() compares a roster against it, both at
+    startup and on every change.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: str) -> None:
+        self.path    = path
+        self.loaded  = False
+        self.roster: str | None = None
+        self.records: dict[str, dict] = {}
+        self.files:   dict[str, dict[str, str]] = {}
+        self.history: dict[str, dict[str, list[str]]] = {}
+
+    @staticmethod
+    def _target() -> dict:
+        return {"container": target().container, "base": target().base}
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable sync manifest %s: %s", self.path, e)
+            return False
+        if data.get("version") != self.VERSION or data.get("target") != self._target():
+            log.info("Sync manifest %s is for another version or target — ignoring", self.path)
+            return False
+        self.roster  = data.get("roster")
+        self.records = data.get("records", {})
+        self.files   = data.get("files", {})
+        self.history = data.get("history", {})
+        self.loaded  = True
+        return True
+
+    def record(self, agents: list, files: dict[str, dict[str, str]],
+               failed: set[str] = frozenset(),
+               history: dict[str, dict[str, list[str]]] | None = None) -> None:
+        """Record agents as applied, except those in failed (keys): they keep
+        their previous record, so the next diff still finds them stale.
+        """
+        if not any(is_atlas(a) and agent_key(a) in failed for a in agents):
+            self.roster = roster_fingerprint(agents)
+        records: dict[str, dict] = {}
+        for a in agents:
+            key = agent_key(a)
+            if key in failed:
+                if key in self.records:
+                    # A rename was already applied at the start of the cycle
+                    records[key] = {**self.records[key], "name": a.get("name", "")}
+                continue
+            records[key] = {
+                "name":     a.get("name", ""),
+                "fields":   field_fingerprints(a),
+                "template": soul_template_for(a).digest,
+            }
+        self.records = records
+        self.files  = files
+        if history is not None:
+            self.history = history
+        self.loaded = True
+
+    def save(self) -> None:
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": self.VERSION,
+                    "target":  self._target(),
+                    "roster":  self.roster,
+                    "records": self.records,
+                    "files":   self.files,
+                    "history": self.history,
+                }, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning("Could not save sync manifest %s: %s", self.path, e)
+
+    def diff(self, agents: list) -> RosterDiff | None:
+        """Diff a roster against the last applied sync (None if there is none)."""
+        if not self.loaded:
+            return None
+        diff = RosterDiff()
+        roster_changed = roster_fingerprint(agents) != self.roster
+        keys = set()
+        for agent in agents:
+            key = agent_key(agent)
+            keys.add(key)
+            old = self.records.get(key)
+            if old is None:
+                diff.added.add(key)
+                diff.stale[key] = set(OUTPUT_FIELDS)
+                continue
+            fields = field_fingerprints(agent)
+            changed = {f for f in fields.keys() | old["fields"].keys()
+                       if fields.get(f) != old["fields"].get(f)}
+            if changed:
+                diff.changed[key] = changed
+            if agent_id_for(old["name"]) != agent_id_for(agent.get("name", "")):
+                diff.renamed[key] = (old["name"], agent.get("name", ""))
+            outputs = {o for o, deps in OUTPUT_FIELDS.items() if changed & set(deps)}
+            if old.get("template") != soul_template_for(agent).digest:
+                outputs.add("SOUL.md")
+            if roster_changed and is_atlas(agent):
+                outputs.add("SOUL.md")
+            if outputs:
+                diff.stale[key] = outputs
+        diff.removed = {key: old["name"] for key, old in self.records.items() if key not in keys}
+        return diff
+
+
+manifest = TargetAttr("manifest")
+
+
+# ---------------------------------------------------------------------------
+# Skills linking
+# ---------------------------------------------------------------------------
+
+def _ensure_shared_link_steps(workspace: str, name: str, target: str,
+                              state: dict | None = None) -> Generator:
+    """Make {workspace}/{name} a symlink to target unless it holds real content.
+
+    state is the link's entry from a remote state probe; without it the
+    workspace is probed first.
+    """
+    link = f"{workspace}/{name}"
+    if state is None:
+        snapshot = yield from _probe_steps([workspace])
+        if not snapshot:
+            log.warning("Cannot inspect %s — leaving as-is", link)
+            return
+        state = snapshot[workspace]["links"][name]
 
     # If already symlinked to target, do nothing
-    rc, out, _ = docker_exec(f"if [ -L {workspace}/vault ]; then readlink -f {workspace}/vault; fi")
-    if out.strip() == target:
+    if state["target"] == target:
         return
 
-    # If vault dir exists and is not empty, leave it alone
-    rc, out, _ = docker_exec(
-        f"if [ -d {workspace}/vault ] && [ ! -L {workspace}/vault ]; then ls -A {workspace}/vault; fi"
-    )
-    if out.strip():
-        log.warning("%s/vault is not empty; leaving as-is", workspace)
+    # If the directory exists and is not empty, leave it alone
+    if state["empty"] is False:
+        log.warning("%s is not empty; leaving as-is", link)
         return
 
-    # Replace empty dir (or missing path) with a symlink to shared vault
-    docker_exec(f"rm -rf {workspace}/vault")
-    docker_exec(f"ln -s {target} {workspace}/vault")
-    log.info("Linked %s/vault -> %s", workspace, target)
+    # Replace empty dir (or missing path) with a symlink to the shared target
+    yield [
+        ("rm", link),
+        ("symlink", target, link),
+    ]
+    log.info("Linked %s -> %s", link, target)
+
+
+def _ensure_links_steps(workspace: str, links: dict[str, dict] | None = None) -> Generator:
+    """Steps to ensure every shared link; links is the workspace's probed link state."""
+    if links is None:
+        snapshot = yield from _probe_steps([workspace])
+        if not snapshot:
+            log.warning("Cannot inspect %s — leaving its links as-is", workspace)
+            return
+        links = snapshot[workspace]["links"]
+    for name, target in shared_links().items():
+        yield from _ensure_shared_link_steps(workspace, name, target, links[name])
+
+
+def shared_links() -> dict[str, str]:
+    """Symlinks every sub-agent workspace gets: {name: target}."""
+    return {
+        "skills": f"{target().base}/workspace/skills",
+        "vault":  f"{target().base}/vault",
+    }
 
 # ---------------------------------------------------------------------------
 # Agent mapping helpers
@@ -159,31 +2289,96 @@ def workspace_for(name: str) -> str:
     """Derive the workspace path inside the container from an MC agent name."""
     aid = agent_id_for(name)
     if aid == "main":
-        return f"{OPENCLAW_BASE}/workspace"
-    return f"{OPENCLAW_BASE}/workspace-{aid}"
+        return f"{target().base}/workspace"
+    return f"{target().base}/workspace-{aid}"
 
 
 def is_atlas(agent: dict) -> bool:
     return agent.get("name", "").strip().lower() == "atlas"
 
+
+def agent_key(agent: dict) -> str:
+    """Stable identity of an MC agent record: its id, or its name for legacy records."""
+    return agent.get("id") or agent.get("name", "")
+
 # ---------------------------------------------------------------------------
 # Content builders
 # ---------------------------------------------------------------------------
 
-def build_soul_md(agent: dict, all_agents: list) -> str:
-    """Build the SOUL.md content for any agent from MC data."""
-    name        = agent.get("name", "Unknown").strip()
-    role        = agent.get("role", "Agent").strip()
-    description = (agent.get("description") or "").strip()
-    soul        = (agent.get("soul") or "").strip()
-
-    if is_atlas(agent):
-        return _build_atlas_soul_md(agent, all_agents)
-
-    desc_block = description if description else "(No description configured.)"
-    soul_block = soul if soul else "(No personality configured.)"
-
-    return f"""---
+class Template:
+    """A workspace file template: compiled once, with rendered output memoized.
+
+    Templates use str.format-style {field} placeholders. The built-in text can
+    be overridden by a file of the same name in TEMPLATE_DIR; refresh() only
+    recompiles it when its mtime changes, and drops the memo when it does.
+    The memo keeps the MEMO_SIZE most recently used renders.
+    """
+
+    MEMO_SIZE = 1024
+
+    def __init__(self, name: str, fields: tuple[str, ...], default: str) -> None:
+        self.name    = name
+        self.fields  = fields
+        self.default = default
+        self.digest  = ""     # sha256 of the active template text
+        self._parts: list[tuple[str, str | None]] | None = None
+        self._mtime: int | None = None
+        self._memo: collections.OrderedDict[tuple, str] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _compile(self, text: str) -> list[tuple[str, str | None]]:
+        parts = [(literal, field) for literal, field, _, _ in string.Formatter().parse(text)]
+        unknown = {f for _, f in parts if f is not None} - set(self.fields)
+        if unknown:
+            raise ValueError(f"unknown field(s) {', '.join(sorted(unknown))}; "
+                             f"available: {', '.join(self.fields) or '(none)'}")
+        return parts
+
+    def refresh(self) -> None:
+        path = os.path.join(TEMPLATE_DIR, self.name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if self._parts is not None and mtime == self._mtime:
+                return
+            text = self.default
+            if mtime is not None:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        override = f.read()
+                    self._compile(override)
+                except (OSError, ValueError) as e:
+                    log.error("Ignoring template override %s: %s", path, e)
+                else:
+                    text = override
+                    log.info("Using template override %s", path)
+            elif self._mtime is not None:
+                log.info("Template override %s removed — using the built-in template", path)
+            self._parts  = self._compile(text)
+            self._mtime  = mtime
+            self.digest  = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            self._memo.clear()
+
+    def render(self, **values: str) -> str:
+        if self._parts is None:
+            self.refresh()
+        key = tuple(values[f] for f in self.fields)
+        with self._lock:
+            out = self._memo.get(key)
+            if out is not None:
+                self._memo.move_to_end(key)
+                return out
+        out = "".join(literal + (values[f] if f is not None else "") for literal, f in self._parts)
+        with self._lock:
+            self._memo[key] = out
+            if len(self._memo) > self.MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return out
+
+
+SOUL_TEMPLATE = Template("SOUL.md", ("name", "role", "desc_block", "soul_block"), """---
 summary: "Soul file for {name} — {role}"
 read_when:
   - Every session start
@@ -210,45 +2405,9 @@ You are **{name}**, the {role} agent.
 Each session, you wake up fresh. These files are your memory. Read them. Update them. They're how you persist.
 
 If you change this file, tell the user — it's your soul, and they should know.
-"""
-
-
-def _build_atlas_soul_md(agent: dict, all_agents: list) -> str:
-    """Build the rich SOUL.md for Atlas, incorporating the full agent roster."""
-    description = (agent.get("description") or "").strip()
-    soul        = (agent.get("soul") or "").strip()
-
-    # Build dynamic agent roster table from all_agents (excluding Atlas itself)
-    roster_rows = []
-    for a in all_agents:
-        aname = a.get("name", "").strip()
-        if aname.lower() == "atlas":
-            continue
-        arole = a.get("role", "").strip()
-        aid   = agent_id_for(aname)
-        # Best-effort short "use for" description from role
-        use_for_map = {
-            "research": "Finding info, verifying facts, sourcing",
-            "builder":  "Code, implementations, technical builds",
-            "planner":  "Intake, task breakdown, handoffs",
-            "designer": "UI/UX flows, wireframes, component specs",
-            "critic / evaluator": "Review, quality control, evaluation",
-            "longform copywriter": "Blog posts, articles, scripts",
-            "shortform / social copywriter": "Shortform posts, platform content",
-            "curriculum unit planning": "Unit of work design",
-            "curriculum lesson planner": "Individual lesson plans",
-            "curriculum resource creator": "Worksheets, task sheets, answer keys",
-            "scheduler": "Time blocks, milestones, weekly plans",
-        }
-        use_for = use_for_map.get(arole.lower(), arole)
-        roster_rows.append(f"| **{aname}** | `{aid}` | {arole} | {use_for} |")
+""")
 
-    roster_table = "\n".join(roster_rows) if roster_rows else "| (no sub-agents registered) | | | |"
-
-    desc_block = description if description else "(No description configured.)"
-    soul_block = soul if soul else "(No personality configured.)"
-
-    return f"""---
+ATLAS_SOUL_TEMPLATE = Template("ATLAS-SOUL.md", ("desc_block", "soul_block", "roster_table"), """---
 summary: "Soul file for Atlas — CEO / Orchestrator"
 read_when:
   - Every session start
@@ -363,33 +2522,9 @@ Ben's working style is "critical friend" — supportive but direct when somethin
 Each session, you wake up fresh. These files are your memory. Read them. Update them. They're how you persist.
 
 If you change this file, tell Ben — it's your soul, and he should know.
-"""
-
+""")
 
-def build_identity_md(agent: dict) -> str:
-    """Build IDENTITY.md content for a new agent."""
-    name  = agent.get("name", "Unknown").strip()
-    role  = agent.get("role", "Agent").strip()
-    image = agent.get("image", "").strip()
-    avatar_line = f"- **Avatar:** {image}" if image else "- **Avatar:** _(not set)_"
-
-    vibe_hint = {
-        "ceo":                       "Calm, decisive, operational. Speaks in status and decisions.",
-        "research":                  "Calm, forensic, evidence-first. Low ego.",
-        "builder":                   "Direct, practical, ship-mindset. No-nonsense.",
-        "planner":                   "Crisp, structured, slightly impatient with vagueness.",
-        "critic / evaluator":        "Blunt, precise, unemotional. Tough but fair.",
-        "designer":                  "Clear, calm, structured. Slightly opinionated about simplicity.",
-        "longform copywriter":       "Clear, confident, human. Reader-first.",
-        "shortform / social copywriter": "Fast, punchy, audience-aware. Hook-obsessed.",
-        "curriculum unit planning":  "Organised, calm, highly practical. Writes for teachers.",
-        "curriculum lesson planner": "Energetic but grounded. Practical and classroom-realistic.",
-        "curriculum resource creator": "Efficient, practical, output-focused.",
-        "scheduler":                 "Calm, firm, pragmatic. Speaks in plans and time blocks.",
-    }
-    vibe = vibe_hint.get(role.lower(), f"Focused on {role.lower()} work.")
-
-    return f"""---
+IDENTITY_TEMPLATE = Template("IDENTITY.md", ("name", "role", "vibe", "avatar_line"), """---
 summary: "Agent identity record for {name}"
 read_when:
   - Every session start
@@ -402,13 +2537,9 @@ read_when:
 - **Creature:** AI specialist agent
 - **Vibe:** {vibe}
 {avatar_line}
-"""
+""")
 
-
-def build_agents_md(agent: dict) -> str:
-    """Build a minimal AGENTS.md for a new agent workspace."""
-    name = agent.get("name", "Unknown").strip()
-    return f"""---
+AGENTS_TEMPLATE = Template("AGENTS.md", ("name",), """---
 summary: "Workspace instructions for {name}"
 read_when:
   - Every session start
@@ -434,13 +2565,9 @@ This is **{name}**'s workspace. All persistent context lives here.
 | `USER.md` | User context and preferences |
 | `TOOLS.md` | Available tools and API notes |
 | `BOOTSTRAP.md` | Startup checklist |
-"""
+""")
 
-
-def build_bootstrap_md(agent: dict) -> str:
-    """Build a minimal BOOTSTRAP.md for a new agent workspace."""
-    name = agent.get("name", "Unknown").strip()
-    return f"""---
+BOOTSTRAP_TEMPLATE = Template("BOOTSTRAP.md", ("name",), """---
 summary: "Startup checklist for {name}"
 read_when:
   - Start of every session
@@ -457,13 +2584,9 @@ On every session start, do this in order:
 5. Read `TOOLS.md` — what tools you have.
 6. Check for any tasks assigned to you via Mission Control.
 7. Begin work.
-"""
-
+""")
 
-def build_memory_md(agent: dict) -> str:
-    """Build an empty MEMORY.md for a new agent workspace."""
-    name = agent.get("name", "Unknown").strip()
-    return f"""---
+MEMORY_TEMPLATE = Template("MEMORY.md", ("name",), """---
 summary: "Long-term memory for {name}"
 read_when:
   - Every session start
@@ -472,12 +2595,9 @@ read_when:
 # MEMORY.md — What I Remember
 
 _Nothing yet. Update this file with key decisions, context, and lessons at the end of each session._
-"""
-
+""")
 
-def build_user_md() -> str:
-    """Build a minimal USER.md pointing to the main workspace's USER.md."""
-    return """---
+USER_TEMPLATE = Template("USER.md", (), """---
 summary: "User context"
 read_when:
   - Every session start
@@ -486,134 +2606,991 @@ read_when:
 # USER.md — Who I'm Working With
 
 See `/data/.openclaw/workspace/USER.md` for the primary user context file.
-"""
+""")
+
+HEARTBEAT_TEMPLATE = Template("HEARTBEAT.md", (), "# HEARTBEAT.md\n\n_(Auto-generated — configure heartbeat settings here.)_\n")
+
+TOOLS_TEMPLATE = Template("TOOLS.md", ("name",), "# TOOLS.md — {name} Tools\n\n_(Document available tools and API tokens here.)_\n")
+
+TEMPLATES = (
+    SOUL_TEMPLATE, ATLAS_SOUL_TEMPLATE, IDENTITY_TEMPLATE, AGENTS_TEMPLATE, BOOTSTRAP_TEMPLATE,
+    MEMORY_TEMPLATE, USER_TEMPLATE, HEARTBEAT_TEMPLATE, TOOLS_TEMPLATE,
+)
+
+
+def refresh_templates() -> None:
+    """Pick up added, edited or removed template overrides (one stat each)."""
+    for template in TEMPLATES:
+        template.refresh()
+
+
+# Best-effort short "use for" description in Atlas's roster, by role
+USE_FOR = {
+    "research": "Finding info, verifying facts, sourcing",
+    "builder":  "Code, implementations, technical builds",
+    "planner":  "Intake, task breakdown, handoffs",
+    "designer": "UI/UX flows, wireframes, component specs",
+    "critic / evaluator": "Review, quality control, evaluation",
+    "longform copywriter": "Blog posts, articles, scripts",
+    "shortform / social copywriter": "Shortform posts, platform content",
+    "curriculum unit planning": "Unit of work design",
+    "curriculum lesson planner": "Individual lesson plans",
+    "curriculum resource creator": "Worksheets, task sheets, answer keys",
+    "scheduler": "Time blocks, milestones, weekly plans",
+}
+
+
+# IDENTITY.md vibe line, by role
+VIBE_HINTS = {
+    "ceo":                       "Calm, decisive, operational. Speaks in status and decisions.",
+    "research":                  "Calm, forensic, evidence-first. Low ego.",
+    "builder":                   "Direct, practical, ship-mindset. No-nonsense.",
+    "planner":                   "Crisp, structured, slightly impatient with vagueness.",
+    "critic / evaluator":        "Blunt, precise, unemotional. Tough but fair.",
+    "designer":                  "Clear, calm, structured. Slightly opinionated about simplicity.",
+    "longform copywriter":       "Clear, confident, human. Reader-first.",
+    "shortform / social copywriter": "Fast, punchy, audience-aware. Hook-obsessed.",
+    "curriculum unit planning":  "Organised, calm, highly practical. Writes for teachers.",
+    "curriculum lesson planner": "Energetic but grounded. Practical and classroom-realistic.",
+    "curriculum resource creator": "Efficient, practical, output-focused.",
+    "scheduler":                 "Calm, firm, pragmatic. Speaks in plans and time blocks.",
+}
+
+
+def build_soul_md(agent: dict, all_agents: list) -> str:
+    """Build the SOUL.md content for any agent from MC data."""
+    name        = agent.get("name", "Unknown").strip()
+    role        = agent.get("role", "Agent").strip()
+    description = (agent.get("description") or "").strip()
+    soul        = (agent.get("soul") or "").strip()
+
+    if is_atlas(agent):
+        return _build_atlas_soul_md(agent, all_agents)
+
+    desc_block = description if description else "(No description configured.)"
+    soul_block = soul if soul else "(No personality configured.)"
+
+    return SOUL_TEMPLATE.render(name=name, role=role, desc_block=desc_block, soul_block=soul_block)
+
+
+def _build_atlas_soul_md(agent: dict, all_agents: list) -> str:
+    """Build the rich SOUL.md for Atlas, incorporating the full agent roster."""
+    description = (agent.get("description") or "").strip()
+    soul        = (agent.get("soul") or "").strip()
+
+    # Build dynamic agent roster table from all_agents (excluding Atlas itself)
+    roster_rows = []
+    for a in all_agents:
+        aname = a.get("name", "").strip()
+        if aname.lower() == "atlas":
+            continue
+        arole = a.get("role", "").strip()
+        aid   = agent_id_for(aname)
+        use_for = USE_FOR.get(arole.lower(), arole)
+        roster_rows.append(f"| **{aname}** | `{aid}` | {arole} | {use_for} |")
+
+    roster_table = "\n".join(roster_rows) if roster_rows else "| (no sub-agents registered) | | | |"
+
+    desc_block = description if description else "(No description configured.)"
+    soul_block = soul if soul else "(No personality configured.)"
+
+    return ATLAS_SOUL_TEMPLATE.render(desc_block=desc_block, soul_block=soul_block, roster_table=roster_table)
+
+
+def build_identity_md(agent: dict) -> str:
+    """Build IDENTITY.md content for a new agent."""
+    name  = agent.get("name", "Unknown").strip()
+    role  = agent.get("role", "Agent").strip()
+    image = agent.get("image", "").strip()
+    avatar_line = f"- **Avatar:** {image}" if image else "- **Avatar:** _(not set)_"
+    vibe = VIBE_HINTS.get(role.lower(), f"Focused on {role.lower()} work.")
+
+    return IDENTITY_TEMPLATE.render(name=name, role=role, vibe=vibe, avatar_line=avatar_line)
+
+
+def build_agents_md(agent: dict) -> str:
+    """Build a minimal AGENTS.md for a new agent workspace."""
+    return AGENTS_TEMPLATE.render(name=agent.get("name", "Unknown").strip())
+
+
+def build_bootstrap_md(agent: dict) -> str:
+    """Build a minimal BOOTSTRAP.md for a new agent workspace."""
+    return BOOTSTRAP_TEMPLATE.render(name=agent.get("name", "Unknown").strip())
+
+
+def build_memory_md(agent: dict) -> str:
+    """Build an empty MEMORY.md for a new agent workspace."""
+    return MEMORY_TEMPLATE.render(name=agent.get("name", "Unknown").strip())
+
+
+def build_user_md() -> str:
+    """Build a minimal USER.md pointing to the main workspace's USER.md."""
+    return USER_TEMPLATE.render()
+
+
+def build_scaffold_files(agent: dict) -> dict[str, str]:
+    """Return {filename: content} for every scaffold file of a new workspace."""
+    name = agent.get("name", "Unknown").strip()
+    return {
+        "IDENTITY.md":  build_identity_md(agent),
+        "AGENTS.md":    build_agents_md(agent),
+        "BOOTSTRAP.md": build_bootstrap_md(agent),
+        "MEMORY.md":    build_memory_md(agent),
+        "USER.md":      build_user_md(),
+        "HEARTBEAT.md": HEARTBEAT_TEMPLATE.render(),
+        "TOOLS.md":     TOOLS_TEMPLATE.render(name=name),
+    }
+
+# ---------------------------------------------------------------------------
+# openclaw.json model
+# ---------------------------------------------------------------------------
+
+class OpenclawConfig:
+    """Cached, indexed copy of the container's openclaw.json.
+
+    _refresh_steps reloads the document only when the remote file's hash
+    differs from what we last read or wrote. Agent changes during a sync cycle
+    are applied in memory (with dict/set indexes on agents.list[].id and
+    tools.agentToAgent.allow) and written back once by _commit_steps.
+
+    Each change is also kept as a pending operation until it is committed.
+    If a commit fails and the file changes in the container meanwhile, the
+    next refresh reads the new copy and replays the pending operations onto
+    it, so the eventual commit doesn't write a stale snapshot over the
+    container's edits.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path  = path
+        self.data: dict | None = None
+        self.pending: list[tuple] = []   # changes not yet committed, e.g. ("add", aid, name, workspace, model)
+        self._hash: str | None = None
+        self._agents_by_id: dict[str, dict] = {}
+        self._allowed: set[str] = set()
+
+    @property
+    def loaded(self) -> bool:
+        return self.data is not None
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.pending)
+
+    def _refresh_steps(self) -> Generator:
+        """Reload from the container if the remote file changed since we last
+        saw it, replaying any uncommitted changes onto the new copy."""
+        (rc, out, _), = yield [("sha256", self.path)]
+        remote_hash = out.split()[0] if rc == 0 and out.strip() else None
+        if self.loaded and remote_hash and remote_hash == self._hash:
+            if self.pending:
+                log.warning("openclaw.json has %d uncommitted change(s) from an unfinished "
+                            "cycle — keeping them", len(self.pending))
+            else:
+                log.debug("openclaw.json unchanged remotely — using cached copy")
+            return
+
+        (rc, out, _), = yield [("read", self.path)]
+        data = _parse_json_output(self.path, rc, out)
+        if not isinstance(data, dict):
+            # Pending changes stay queued for when it can be read again
+            self.data = None
+            self._hash = None
+            return
+        self.data  = data
+        self._hash = remote_hash
+        self._index()
+        pending, self.pending = self.pending, []
+        if pending:
+            log.warning("openclaw.json changed in the container with %d change(s) still "
+                        "uncommitted — applying them to the new copy", len(pending))
+            for op in pending:
+                self._apply(op)
+
+    def _index(self) -> None:
+        agents = self.data.setdefault("agents", {})
+        agents_list = agents.setdefault("list", [])
+        self._agents_by_id = {a.get("id"): a for a in agents_list}
+
+        a2a = self.data.setdefault("tools", {}).setdefault("agentToAgent", {})
+        self._allowed = set(a2a.setdefault("allow", []))
+
+    def _apply(self, op: tuple) -> None:
+        """Apply a change to the document, keeping it pending if it changed anything."""
+        kind, *args = op
+        if getattr(self, f"_{kind}")(*args):
+            self.pending.append(op)
+
+    def has_agent(self, aid: str, model: str = "") -> bool:
+        """Whether agents.list has an entry for aid (with this model, if given)."""
+        entry = self._agents_by_id.get(aid)
+        return entry is not None and (not model or entry.get("model") == model)
+
+    def add_agent(self, aid: str, name: str, workspace: str, model: str) -> None:
+        """Add an agents.list entry and agentToAgent permission if missing."""
+        self._apply(("add", aid, name, workspace, model))
+
+    def remove_agent(self, aid: str) -> None:
+        """Drop an agents.list entry and its agentToAgent permission."""
+        self._apply(("remove", aid))
+
+    def rename_agent(self, old_aid: str, aid: str, name: str, workspace: str) -> None:
+        """Move an agent's entry (keeping its other settings) and permission to a new agentId."""
+        self._apply(("rename", old_aid, aid, name, workspace))
+
+    def set_model(self, aid: str, model: str) -> None:
+        self._apply(("set_model", aid, model))
+
+    def _add(self, aid: str, name: str, workspace: str, model: str) -> bool:
+        changed = False
+        if aid in self._agents_by_id:
+            log.debug("Agent %s already in openclaw.json agents.list", aid)
+        else:
+            entry = {"id": aid, "name": name, "workspace": workspace}
+            if model:
+                entry["model"] = model
+            self.data["agents"]["list"].append(entry)
+            self._agents_by_id[aid] = entry
+            changed = True
+            log.info("Added %s to openclaw.json agents.list", name)
+
+        if aid not in self._allowed:
+            self.data["tools"]["agentToAgent"]["allow"].append(aid)
+            self._allowed.add(aid)
+            changed = True
+            log.info("Added %s to tools.agentToAgent.allow", aid)
+        return changed
+
+    def _remove(self, aid: str) -> bool:
+        changed = False
+        entry = self._agents_by_id.pop(aid, None)
+        if entry is not None:
+            self.data["agents"]["list"].remove(entry)
+            changed = True
+            log.info("Removed %s from openclaw.json agents.list", aid)
+        if aid in self._allowed:
+            self.data["tools"]["agentToAgent"]["allow"].remove(aid)
+            self._allowed.discard(aid)
+            changed = True
+            log.info("Removed %s from tools.agentToAgent.allow", aid)
+        return changed
+
+    def _rename(self, old_aid: str, aid: str, name: str, workspace: str) -> bool:
+        entry = self._agents_by_id.get(old_aid)
+        if entry is None or aid in self._agents_by_id:
+            return self._remove(old_aid)
+        del self._agents_by_id[old_aid]
+        entry.update({"id": aid, "name": name, "workspace": workspace})
+        self._agents_by_id[aid] = entry
+        allow = self.data["tools"]["agentToAgent"]["allow"]
+        if old_aid in self._allowed:
+            allow[allow.index(old_aid)] = aid
+            self._allowed.discard(old_aid)
+            self._allowed.add(aid)
+        log.info("Renamed %s to %s in openclaw.json", old_aid, aid)
+        return True
+
+    def _set_model(self, aid: str, model: str) -> bool:
+        entry = self._agents_by_id.get(aid)
+        if entry is None or entry.get("model") == model:
+            return False
+        log.info("Model change for %s: %s → %s", aid, entry.get("model"), model)
+        entry["model"] = model
+        return True
+
+    def _commit_steps(self, stage: "StagedCommit") -> Generator:
+        """Write openclaw.json if it has staged changes, committed together
+        with everything else in stage. Returns True if openclaw.json is in
+        place (see stage.failed for the rest); once a commit of it has failed,
+        the changes wait for the next cycle.
+        """
+        if not self.dirty or not self.loaded or posixpath.dirname(self.path) in stage.failed:
+            yield from stage.commit_steps()
+            return not self.dirty
+        content = json.dumps(self.data, indent=2) + "\n"
+        yield from stage.commit_steps({self.path: content})
+        if posixpath.dirname(self.path) in stage.failed:
+            log.error("Failed to update openclaw.json — %d change(s) kept for the next cycle",
+                      len(self.pending))
+            return False
+        self.pending = []
+        self._hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        log.info("openclaw.json updated")
+        return True
+
+
+openclaw_config = TargetAttr("openclaw_config")
 
 # ---------------------------------------------------------------------------
 # Sync logic
 # ---------------------------------------------------------------------------
 
-def workspace_exists(workspace: str) -> bool:
-    rc, _, _ = docker_exec(f"[ -d {workspace} ] && echo yes || echo no")
-    return False  # Will check via soul file instead
+# Files kept in step with MC on every cycle; the remote state probe hashes them
+MANAGED_FILES = ("SOUL.md",)
+
+# Prints a JSON snapshot of every workspace listed in $list (one per line):
+#   {"<workspace>": {"exists": bool,
+#                    "files": {"<managed file>": "<sha256>" | null},
+#                    "links": {"<link>": {"target": "<resolved path>" | null,
+#                                         "empty": bool | null}}}}
+# "target" is set for symlinks; "empty" for real directories. Hashes and link
+# targets are resolved with one sha256sum / realpath run for all workspaces.
+_PROBE_SCRIPT = r"""
+shopt -s nullglob dotglob
+mapfile -t ws <"$list"; rm -f -- "$list"
+q() { Q=${1//\\/\\\\}; Q=${Q//\"/\\\"}; Q="\"$Q\""; }
+hashed=() symlinks=()
+for w in "${ws[@]}"; do
+  for f in "${files[@]}"; do [ -f "$w/$f" ] && hashed+=("$w/$f"); done
+  for l in "${links[@]}"; do [ -L "$w/$l" ] && symlinks+=("$w/$l"); done
+done
+declare -A sum target
+if [ ${#hashed[@]} -gt 0 ]; then
+  while read -r h p; do sum[$p]=$h; done < <(printf '%s\0' "${hashed[@]}" | xargs -0 sha256sum)
+fi
+if [ ${#symlinks[@]} -gt 0 ]; then
+  mapfile -t resolved < <(printf '%s\0' "${symlinks[@]}" | xargs -0 realpath -m --)
+  for i in "${!symlinks[@]}"; do target[${symlinks[$i]}]=${resolved[$i]}; done
+fi
+out= sep=
+for w in "${ws[@]}"; do
+  q "$w"; out+="$sep$Q:{"; sep=,
+  if [ -d "$w" ]; then out+='"exists":true'; else out+='"exists":false'; fi
+  out+=',"files":{'; s=
+  for f in "${files[@]}"; do
+    q "$f"; h=${sum[$w/$f]}
+    if [ -n "$h" ]; then out+="$s$Q:\"$h\""; else out+="$s$Q:null"; fi; s=,
+  done
+  out+='},"links":{'; s=
+  for l in "${links[@]}"; do
+    p=$w/$l; q "$l"; out+="$s$Q:"; s=,
+    if [ -L "$p" ]; then
+      q "${target[$p]}"; out+="{\"target\":$Q,\"empty\":null}"
+    elif [ -d "$p" ]; then
+      c=("$p"/*)
+      if [ ${#c[@]} -eq 0 ]; then out+='{"target":null,"empty":true}'; else out+='{"target":null,"empty":false}'; fi
+    else
+      out+='{"target":null,"empty":null}'
+    fi
+  done
+  out+='}}'
+done
+printf '{%s}\n' "$out"
+"""
+
+_probe_ids = itertools.count()
 
 
-def soul_exists(workspace: str) -> bool:
-    rc, out, _ = docker_exec(f"[ -f {workspace}/SOUL.md ] && echo yes || echo no")
-    return out.strip() == "yes"
+def _probe_commands(workspaces: list[str], files: tuple[str, ...],
+                    links: tuple[str, ...]) -> list[tuple]:
+    """The write and exec ops a "probe" op stands for; the exec one answers it."""
+    # The list goes in as a file: a long roster would overflow a command argument
+    listing = f"/tmp/mc-openclaw-sync-probe.{os.getpid()}.{next(_probe_ids)}"
+    script = f"files=({' '.join(files)}) links=({' '.join(links)}) list={listing}\n{_PROBE_SCRIPT}"
+    return [
+        ("write", listing, "".join(f"{w}\n" for w in workspaces)),
+        ("exec", script),
+    ]
 
 
-def sync_agent(agent: dict, all_agents: list) -> None:
-    """Sync a single MC agent's data to its OpenClaw workspace."""
+def _probe_steps(workspaces: list[str], files: tuple[str, ...] = MANAGED_FILES) -> Generator:
+    if not workspaces:
+        return {}
+    (rc, out, err), = yield [("probe", workspaces, files, tuple(shared_links()))]
+    if rc != 0:
+        log.error("Remote state probe failed: %s", err.strip())
+        return None
+    try:
+        return json.loads(out)
+    except ValueError as e:
+        log.error("Remote state probe returned bad JSON: %s", e)
+        return None
+
+
+def _missing(snapshot: dict[str, dict]) -> set[str]:
+    """Workspaces in a probe snapshot that have no SOUL.md (i.e. new agents)."""
+    return {w for w, state in snapshot.items() if state["files"].get("SOUL.md") is None}
+
+
+def build_workspace_archive(workspaces: dict[str, dict[str, str]],
+                            existing: set[str] = frozenset()) -> bytes:
+    """Build one tar holding new workspaces: {workspace: {filename: content}}.
+
+    Each workspace gets its directory, memory/, every file given and — except
+    the main workspace, and those in existing, which keep theirs — the shared
+    skills/vault symlinks. Member paths are relative to / so the archive is
+    extracted with `tar -C /`.
+    """
+    now = time.time()
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w", format=tarfile.GNU_FORMAT) as tar:
+        def member(path: str, kind: bytes, mode: int) -> tarfile.TarInfo:
+            info = tarfile.TarInfo(path.lstrip("/"))
+            info.type, info.mode, info.mtime = kind, mode, now
+            return info
+
+        for workspace, files in workspaces.items():
+            tar.addfile(member(workspace, tarfile.DIRTYPE, 0o755))
+            tar.addfile(member(f"{workspace}/memory", tarfile.DIRTYPE, 0o755))
+            for filename, content in files.items():
+                data = content.encode("utf-8")
+                info = member(f"{workspace}/{filename}", tarfile.REGTYPE, 0o644)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+            if workspace != workspace_for("atlas") and workspace not in existing:
+                for name, target in shared_links().items():
+                    info = member(f"{workspace}/{name}", tarfile.SYMTYPE, 0o777)
+                    info.linkname = target
+                    tar.addfile(info)
+    return buf.getvalue()
+
+
+def _scaffold_steps(agents: list, all_agents: list, snapshot: dict[str, dict] | None = None) -> Generator:
+    """Create the workspaces of new agents, streamed in as one tar archive.
+
+    SOUL.md goes in with the scaffold files, and everything in the archive is
+    recorded in the write cache. If extraction fails the affected workspaces
+    are scaffolded file by file instead.
+
+    snapshot, a remote state probe of the agents' workspaces, tells which of
+    them already exist without a SOUL.md: those only get the scaffold files
+    they are missing, and keep their links, so what the agent wrote there
+    (MEMORY.md, ...) is never replaced.
+    """
+    workspaces: dict[str, dict[str, str]] = {}
+    existing = {workspace_for(a.get("name", "Unknown")): a for a in agents
+                if snapshot and snapshot.get(workspace_for(a.get("name", "Unknown")), {}).get("exists")}
+    present: dict[str, dict] | None = {}
+    if existing:
+        names = sorted({f for a in existing.values() for f in build_scaffold_files(a)} | {"SOUL.md"})
+        with span("probe", workspaces=len(existing)):
+            present = yield from _probe_steps(list(existing), tuple(names))
+    with span("render scaffold", workspaces=len(agents)) as sp:
+        for agent in agents:
+            name = agent.get("name", "Unknown").strip()
+            workspace = workspace_for(name)
+            # Whatever we pushed before is gone; don't let the cache skip the rebuild.
+            write_cache.invalidate(workspace)
+            files = build_scaffold_files(agent)
+            files["SOUL.md"] = build_soul_md(agent, all_agents)
+            if workspace in existing:
+                log.info("%s has no SOUL.md — adding the scaffold files it is missing", workspace)
+                # If the probe failed, SOUL.md (missing, as probed) is all it gets
+                have = (present or {}).get(workspace, {}).get("files", {"SOUL.md": None})
+                files = {f: c for f, c in files.items() if f in have and have[f] is None}
+            else:
+                log.info("New agent detected: %s — creating workspace at %s", name, workspace)
+            workspaces[workspace] = files
+
+        archive = build_workspace_archive(workspaces, set(existing))
+        sp.set(bytes=len(archive))
+    (rc, _, err), = yield [("untar", "/", archive)]
+    if rc == 0:
+        for workspace, files in workspaces.items():
+            for filename, content in files.items():
+                write_cache.record(workspace, filename, content)
+            write_cache.count(misses=len(files))
+        log.info("Created %d workspace(s) from one %d-byte archive",
+                 len(workspaces), len(archive))
+        for workspace in existing.keys() - {workspace_for("atlas")}:
+            yield from _ensure_links_steps(workspace, snapshot[workspace]["links"])
+        return
+
+    log.warning("Workspace archive failed (%s) — scaffolding file by file", err.strip())
+    for workspace, files in workspaces.items():
+        yield [("mkdir", f"{workspace}/memory")]
+        if workspace != workspace_for("atlas"):
+            yield from _ensure_links_steps(workspace, snapshot[workspace]["links"] if workspace in existing else None)
+        yield from _write_files_steps(workspace, files)
+
+
+def _retire_steps(agents: list, diff: RosterDiff) -> Generator:
+    """Apply renamed and removed agents to workspace directories and openclaw.json.
+
+    A renamed agent's workspace is moved to its new path, so its memory
+    survives; a removed agent's workspace is moved under <base>/removed
+    rather than deleted. Both lose their old openclaw.json entry. The main
+    workspace, and any agentId still used by the current roster, are left
+    alone.
+    """
+    in_use = {agent_id_for(a.get("name", "Unknown")) for a in agents}
+    stamp  = time.strftime("%Y%m%d-%H%M%S")
+    moves: list[tuple[str, str, str]] = []   # (description, old path, new path)
+
+    for old_name, new_name in diff.renamed.values():
+        old_aid, aid = agent_id_for(old_name), agent_id_for(new_name)
+        if "main" in (old_aid, aid) or old_aid in in_use:
+            log.warning("Not moving workspace for rename %s → %s: %s is still in use",
+                        old_name, new_name, old_aid)
+            continue
+        moves.append((f"{old_name} renamed to {new_name}", workspace_for(old_name), workspace_for(new_name)))
+        if openclaw_config.loaded:
+            openclaw_config.rename_agent(old_aid, aid, new_name.strip(), workspace_for(new_name))
+
+    for old_name in diff.removed.values():
+        aid = agent_id_for(old_name)
+        if aid == "main" or aid in in_use:
+            continue
+        workspace = workspace_for(old_name)
+        moves.append((f"{old_name} removed", workspace,
+                      f"{target().base}/removed/{posixpath.basename(workspace)}-{stamp}"))
+        if openclaw_config.loaded:
+            openclaw_config.remove_agent(aid)
+
+    if not moves:
+        return
+    outcomes = yield [
+        ("move", old, new) for _, old, new in moves
+    ]
+    for (what, old, new), (rc, _, err) in zip(moves, outcomes):
+        write_cache.invalidate(old)
+        if rc == 0:
+            log.info("%s — moved %s to %s", what, old, new)
+        else:
+            log.warning("%s — could not move %s to %s (missing, or the target exists)%s",
+                        what, old, new, f": {err.strip()}" if err.strip() else "")
+
+
+def stage_openclaw_entry(agent: dict, new_agent: bool) -> None:
+    """Stage an agent's openclaw.json changes: a new entry (also for an agent
+    whose entry has gone missing, e.g. with a rolled back openclaw.json), or
+    a model update.
+    """
     name      = agent.get("name", "Unknown").strip()
     aid       = agent_id_for(name)
-    workspace = workspace_for(name)
     model     = agent.get("model", "").strip()
 
-    log.debug("Syncing agent: %s → agentId=%s workspace=%s", name, aid, workspace)
-
-    soul_md = build_soul_md(agent, all_agents)
-    new_agent = not soul_exists(workspace)
-
-    if new_agent:
-        log.info("New agent detected: %s — creating workspace at %s", name, workspace)
-        docker_exec(f"mkdir -p {workspace}/memory {workspace}/skills")
-        docker_write(f"{workspace}/IDENTITY.md", build_identity_md(agent))
-        docker_write(f"{workspace}/AGENTS.md",   build_agents_md(agent))
-        docker_write(f"{workspace}/BOOTSTRAP.md", build_bootstrap_md(agent))
-        docker_write(f"{workspace}/MEMORY.md",   build_memory_md(agent))
-        docker_write(f"{workspace}/USER.md",     build_user_md())
-        docker_write(f"{workspace}/HEARTBEAT.md", "# HEARTBEAT.md\n\n_(Auto-generated — configure heartbeat settings here.)_\n")
-        docker_write(f"{workspace}/TOOLS.md",    f"# TOOLS.md — {name} Tools\n\n_(Document available tools and API tokens here.)_\n")
-        _add_agent_to_openclaw_json(aid, name, workspace, model)
+    if new_agent or (openclaw_config.loaded and not openclaw_config.has_agent(aid)):
+        _add_agent_to_openclaw_json(aid, name, workspace_for(name), model)
     else:
-        # Always update SOUL.md, and update model in openclaw.json if changed
         _update_model_in_openclaw_json_if_changed(aid, model)
 
-    # Always write SOUL.md (the key sync target)
-    if aid != "main":
-        ensure_skills_link(workspace)
-        ensure_vault_link(workspace)
 
-    if docker_write(f"{workspace}/SOUL.md", soul_md):
-        action = "created" if new_agent else "updated"
-        log.info("SOUL.md %s for %s (%s)", action, name, aid)
-    else:
+def sync_agent(agent: dict, all_agents: list, new_agent: bool | None = None,
+               state: dict | None = None) -> bool:
+    """Sync a single MC agent's data to its OpenClaw workspace; False if SOUL.md failed.
+
+    new_agent and state (the workspace's entry in a remote state probe) are
+    passed by sync_all, which has already probed every workspace and
+    scaffolded new ones in bulk; when new_agent is None it is probed here.
+    openclaw.json is shared by every agent, so its changes are staged and
+    committed by sync_all rather than here.
+    """
+    start = time.monotonic()
+    ok = False
+    try:
+        with span("sync_agent"):
+            ok = run_steps(_sync_agent_steps(agent, all_agents, new_agent, state))
+        return ok
+    finally:
+        record_agent_sync(agent, ok, time.monotonic() - start)
+
+
+def record_agent_sync(agent: dict, ok: bool, secs: float) -> None:
+    name = target().name
+    AGENT_SECONDS.observe(secs, target=name)
+    if not ok:
+        AGENT_FAILURES.inc(target=name, agent=agent.get("name", "?"))
+
+
+def _sync_agent_steps(agent: dict, all_agents: list, new_agent: bool | None,
+                      state: dict | None = None) -> Generator:
+    name      = agent.get("name", "Unknown").strip()
+    aid       = agent_id_for(name)
+    workspace = workspace_for(name)
+
+    log.debug("Syncing agent: %s → agentId=%s workspace=%s", name, aid, workspace)
+
+    with span("render SOUL.md"):
+        soul_md = build_soul_md(agent, all_agents)
+    if new_agent is None:
+        with span("probe", workspaces=1):
+            snapshot = yield from _probe_steps([workspace])
+        state = snapshot.get(workspace) if snapshot else None
+        new_agent = bool(snapshot) and workspace in _missing(snapshot)
+        if new_agent:
+            with span("scaffold", workspaces=1):
+                yield from _scaffold_steps([agent], all_agents, snapshot)
+
+    # New workspaces already got their links from the scaffold archive
+    if not new_agent and aid != "main":
+        with span("links"):
+            yield from _ensure_links_steps(workspace, state and state["links"])
+
+    # Always sync SOUL.md (the key sync target); new workspaces got it in the
+    # archive, so the probe taken before that no longer describes them
+    remote = state["files"] if state and not new_agent else None
+    with span("write SOUL.md", bytes=len(soul_md)):
+        written = (yield from _write_files_steps(workspace, {"SOUL.md": soul_md}, remote))["SOUL.md"]
+    if written and target().stage is None:
+        # Inside a cycle, it's only in place (and logged) once the cycle commits
+        log.info("SOUL.md updated for %s (%s)", name, aid)
+    elif written is False:
         log.error("Failed to sync SOUL.md for %s", name)
+    return written is not False
 
 
 def _add_agent_to_openclaw_json(aid: str, name: str, workspace: str, model: str) -> None:
-    """Add a new agent entry to openclaw.json inside the container."""
-    data = docker_read_json(OPENCLAW_JSON)
-    if not data:
+    """Stage a new agent entry (and its agentToAgent permission) in openclaw.json."""
+    if not openclaw_config.loaded:
         log.error("Could not read openclaw.json — skipping openclaw.json update for %s", name)
         return
-
-    agents_list = data.get("agents", {}).get("list", [])
-
-    # Check if already present
-    if any(a.get("id") == aid for a in agents_list):
-        log.debug("Agent %s already in openclaw.json agents.list", aid)
-    else:
-        entry = {"id": aid, "name": name, "workspace": workspace}
-        if model:
-            entry["model"] = model
-        agents_list.append(entry)
-        data["agents"]["list"] = agents_list
-        log.info("Added %s to openclaw.json agents.list", name)
-
-    # Ensure agent is in agentToAgent allow list
-    tools = data.get("tools", {})
-    a2a   = tools.get("agentToAgent", {})
-    allow = a2a.get("allow", [])
-    if aid not in allow:
-        allow.append(aid)
-        a2a["allow"] = allow
-        tools["agentToAgent"] = a2a
-        data["tools"] = tools
-        log.info("Added %s to tools.agentToAgent.allow", aid)
-
-    if docker_write_json(OPENCLAW_JSON, data):
-        log.info("openclaw.json updated for new agent %s", name)
-    else:
-        log.error("Failed to update openclaw.json for %s", name)
+    openclaw_config.add_agent(aid, name, workspace, model)
 
 
 def _update_model_in_openclaw_json_if_changed(aid: str, new_model: str) -> None:
-    """Update an existing agent's model in openclaw.json if it has changed."""
-    if not new_model:
+    """Stage an existing agent's model change in openclaw.json if it has changed."""
+    if not new_model or not openclaw_config.loaded:
         return
+    openclaw_config.set_model(aid, new_model)
 
-    data = docker_read_json(OPENCLAW_JSON)
-    if not data:
-        return
-
-    agents_list = data.get("agents", {}).get("list", [])
-    changed = False
-    for entry in agents_list:
-        if entry.get("id") == aid:
-            if entry.get("model") != new_model:
-                log.info("Model change for %s: %s → %s", aid, entry.get("model"), new_model)
-                entry["model"] = new_model
-                changed = True
-            break
-
-    if changed:
-        data["agents"]["list"] = agents_list
-        if docker_write_json(OPENCLAW_JSON, data):
-            log.info("openclaw.json model updated for %s", aid)
-        else:
-            log.error("Failed to update model in openclaw.json for %s", aid)
 
+def _begin_cycle_steps(agents: list, diff: RosterDiff | None = None) -> Generator:
+    """Shared start of a sync cycle; returns the agents that need per-agent work.
 
-def sync_all(agents: list) -> None:
-    """Sync every agent in the MC list to OpenClaw."""
-    log.info("Syncing %d agents to OpenClaw...", len(agents))
-    for agent in agents:
+    Refreshes openclaw.json, creates every new workspace from one archive and
+    stages openclaw.json changes. With diff (from SyncManifest.diff) renames
+    and removals are applied first, and the rest of the work is limited to
+    new workspaces and the agents whose outputs are stale; otherwise every
+    agent is synced.
+    """
+    if diff is None:
+        log.info("Syncing %d agents to OpenClaw...", len(agents))
+    else:
+        log.info("Reconciling %d agents with OpenClaw (%s)...", len(agents), diff.summary())
+    write_cache.reset_stats()
+    target().stage = StagedCommit()
+    target().agent_errors = {}
+    refresh_templates()
+    with span("refresh openclaw.json"):
+        yield from openclaw_config._refresh_steps()
+    if diff is not None:
+        with span("retire", renamed=len(diff.renamed), removed=len(diff.removed)):
+            yield from _retire_steps(agents, diff)
+
+    # Probe every workspace in one round-trip; create the new ones in one archive
+    with span("probe", workspaces=len(agents)):
+        snapshot = yield from _probe_steps([workspace_for(a.get("name", "Unknown")) for a in agents])
+    snapshot = snapshot or {}
+    missing = _missing(snapshot)
+    new_agents = [a for a in agents if workspace_for(a.get("name", "Unknown")) in missing]
+    if new_agents:
+        try:
+            with span("scaffold", workspaces=len(new_agents)):
+                yield from _scaffold_steps(new_agents, agents, snapshot)
+        except Exception as e:
+            log.error("Error scaffolding %d new workspace(s): %s", len(new_agents), e)
+
+    # Shared openclaw.json changes are staged here, in roster order, so the
+    # result doesn't depend on how the per-agent workers get scheduled.
+    with span("stage openclaw.json"):
+        for agent in agents:
+            new_agent = workspace_for(agent.get("name", "Unknown")) in missing
+            if diff is not None and not new_agent and agent_key(agent) not in diff.stale:
+                continue
+            try:
+                stage_openclaw_entry(agent, new_agent)
+            except Exception as e:
+                log.error("Error staging openclaw.json for %s: %s", agent.get("name", "?"), e)
+
+    work = [
+        (agent, workspace_for(agent.get("name", "Unknown")) in missing,
+         snapshot.get(workspace_for(agent.get("name", "Unknown"))))
+        for agent in agents
+        if diff is None or "SOUL.md" in diff.stale.get(agent_key(agent), ())
+        or workspace_for(agent.get("name", "Unknown")) in missing
+    ]
+    # Most urgent first: the workers pick those up first, and split_work relies on it
+    return sorted(work, key=lambda item: sync_priority(item[0], item[1], diff))
+
+
+def sync_priority(agent: dict, new_agent: bool, diff: RosterDiff | None) -> int:
+    """How urgent an agent's workspace work is (see OpScheduler)."""
+    if is_atlas(agent):
+        return PRIORITY_ROSTER
+    changed = diff.changed.get(agent_key(agent), set()) if diff is not None else None
+    if new_agent or changed is None or changed & set(OUTPUT_FIELDS["SOUL.md"]):
+        return PRIORITY_CONTENT
+    return PRIORITY_REPAIR
+
+
+def split_work(work: list[tuple], diff: RosterDiff | None) -> tuple[list[tuple], list[tuple]]:
+    """work (sorted by sync_priority) as the roster and content work, which
+    _commit_roster_steps commits, and the repair work that runs after it."""
+    n = sum(1 for agent, new_agent, _ in work if sync_priority(agent, new_agent, diff) < PRIORITY_REPAIR)
+    return work[:n], work[n:]
+
+
+def _commit_roster_steps() -> Generator:
+    """Commit openclaw.json and the files staged so far, ahead of the cycle's
+    repair work; what that stages goes in _finish_cycle_steps's commit."""
+    stage = target().stage
+    with span("commit roster", files=len(stage.pending), openclaw_json=openclaw_config.dirty):
+        yield from openclaw_config._commit_steps(stage)
+
+
+def record_cycle(ok: bool, secs: float) -> None:
+    tgt = target()
+    CYCLE_SECONDS.observe(secs, target=tgt.name)
+    CYCLES.inc(target=tgt.name, result="applied" if ok else "failed")
+    if ok:
+        record_applied()
+    else:
+        tgt.last_error = "sync cycle failed"
+
+
+def record_applied() -> None:
+    """The roster the current target last read is now fully applied: update its
+    lag, if that roster is newer than the last one measured. A no-op cycle,
+    retry or restart sync re-applying the same roster leaves the lag as it was.
+    """
+    tgt = target()
+    tgt.last_applied = time.time()
+    tgt.last_error   = None
+    if tgt.roster_mtime is not None and (tgt.lag_mtime is None or tgt.roster_mtime > tgt.lag_mtime):
+        tgt.lag_mtime = tgt.roster_mtime
+        SYNC_LAG.set(max(0.0, tgt.last_applied - tgt.roster_mtime), target=tgt.name)
+
+
+def record_outcomes(work: list[tuple], results: list[bool | None], commit_errors: dict[str, str]) -> None:
+    """Update each synced agent's last sync time and error, for the control API.
+
+    commit_errors maps workspaces whose staged files weren't committed to why.
+    """
+    tgt = target()
+    now = time.time()
+    for (agent, _, _), ok in zip(work, results):
+        if ok is None:
+            continue
+        status = tgt.agents.setdefault(agent_key(agent), {"last_sync": None, "last_error": None})
+        status["name"] = agent.get("name", "")
+        if ok:
+            status.update(last_sync=now, last_error=None)
+        else:
+            status["last_error"] = (tgt.agent_errors.get(agent.get("name", "?"))
+                                    or commit_errors.get(workspace_for(agent.get("name", "Unknown")))
+                                    or ("container unreachable" if tgt.breaker.remaining() else "sync failed"))
+
+
+def _finish_cycle_steps(agents: list, work: list[tuple], results: list[bool | None]) -> Generator:
+    """Commit the cycle's remaining staged files with openclaw.json and save
+    the manifest; returns True if the whole cycle applied.
+
+    results holds each work item's outcome (None: abandoned to a newer sync).
+    An agent whose workspace's staged files weren't committed has failed.
+    Once openclaw.json is committed, the manifest records every agent except
+    the ones that failed or were abandoned; failures are queued for retry.
+    """
+    tgt = target()
+    stage, tgt.stage = tgt.stage, None
+    stage = stage or StagedCommit()
+    with span("commit", files=len(stage.pending), openclaw_json=openclaw_config.dirty):
+        committed = yield from openclaw_config._commit_steps(stage)
+    staged: dict[str, list[str]] = {}
+    for workspace, filename, _, _ in stage.entries:
+        staged.setdefault(workspace, []).append(filename)
+    if stage.failed:
+        write_cache.count(failures=sum(len(staged.get(w, ())) for w in stage.failed))
+        results = [False if ok and workspace_for(agent.get("name", "Unknown")) in stage.failed else ok
+                   for (agent, _, _), ok in zip(work, results)]
+    for (agent, _, _), ok in zip(work, results):
+        name = agent.get("name", "Unknown").strip()
+        if ok and workspace_for(name) in staged:
+            log.info("%s updated for %s (%s)", ", ".join(staged[workspace_for(name)]), name, agent_id_for(name))
+    record_outcomes(work, results, stage.failed)
+    outcomes = {agent_key(agent): ok for (agent, _, _), ok in zip(work, results)}
+    outcomes["openclaw.json"] = committed
+    failed = {key for key, ok in outcomes.items() if not ok}
+    abandoned = results.count(None)
+    ok = committed and not failed and write_cache.failures == 0
+    if committed:
+        with span("save manifest"):
+            manifest.record(agents, write_cache.snapshot(), failed, write_cache.history_snapshot())
+            manifest.save()
+    tgt.retries.update(outcomes, {agent_key(a) for a in agents} | {"openclaw.json"})
+    if abandoned:
+        log.info("Sync superseded (%d files written, %d unchanged skipped, "
+                 "%d agents left to the newer sync).",
+                 write_cache.misses, write_cache.hits, abandoned)
+    else:
+        log.info("Sync complete (%d files written, %d unchanged skipped%s).",
+                 write_cache.misses, write_cache.hits,
+                 "" if ok else ", with errors — failed agents will be retried")
+    return ok
+
+
+def sync_all(agents: list, diff: RosterDiff | None = None,
+             superseded: Callable[[], bool] | None = None) -> bool:
+    """Sync every agent in the MC list to OpenClaw (or just what diff says changed).
+
+    Per-agent workspace work runs on up to SYNC_WORKERS threads. The roster
+    and content work (Atlas, new agents, SOUL.md changes) goes first, and is
+    committed with openclaw.json before the repair work starts, so model and
+    roster changes don't wait on it. superseded is checked before each agent:
+    once a newer roster is waiting, agents not yet started are abandoned to
+    the sync that follows; while the target's circuit breaker is open they are
+    failed without trying, for the retry queue. Returns True if the whole
+    cycle was applied.
+    """
+    start = time.monotonic()
+    tgt = target()
+    lane = op_priority.get()
+
+    def run(item: tuple[dict, bool, dict | None]) -> bool | None:
+        agent, new_agent, state = item
+        if superseded is not None and superseded():
+            return None
+        if tgt.breaker.remaining():
+            return False  # container unreachable: leave the agent to the retry
+        # Pool threads don't inherit the caller's context
+        token = log_agent.set(agent.get("name", "?"))
+        priority = op_priority.set(max(lane, sync_priority(agent, new_agent, diff)))
         try:
-            sync_agent(agent, agents)
+            with tgt.activated():
+                return sync_agent(agent, agents, new_agent=new_agent, state=state)
         except Exception as e:
             log.error("Error syncing agent %s: %s", agent.get("name", "?"), e)
-    log.info("Sync complete.")
+            return False
+        finally:
+            op_priority.reset(priority)
+            log_agent.reset(token)
+
+    with traced_cycle(agents, diff):
+        with span("begin cycle"):
+            work = run_steps(_begin_cycle_steps(agents, diff))
+        results = []
+        for n, items in enumerate(split_work(work, diff)):
+            if n and items:
+                run_steps(_commit_roster_steps())
+            if SYNC_WORKERS > 1 and len(items) > 1:
+                # map() waits for every agent; run() never raises, so failures stay isolated
+                results += tgt.executor().map(run, items)
+            else:
+                results += [run(item) for item in items]
+        with span("finish cycle"):
+            ok = run_steps(_finish_cycle_steps(agents, work, results))
+    record_cycle(ok, time.monotonic() - start)
+    return ok
+
+
+def drift_diff(agents: list, diff: RosterDiff | None, force: set[str], full: bool) -> RosterDiff | None:
+    """The drift-fixing pass that follows a sync of diff: every agent for a
+    full reconcile, otherwise the agents in force (keys), less those the sync
+    already rebuilt in full. None if there is nothing for it to do, or the sync
+    was a full one anyway (diff is None).
+    """
+    if diff is None or not (force or full):
+        return None
+    keys = {agent_key(a) for a in agents}
+    if not full:
+        keys &= force
+    keys -= {key for key, outputs in diff.stale.items() if outputs >= OUTPUT_FIELDS.keys()}
+    drift = manifest.diff(agents) if keys else None
+    if drift is not None:
+        drift.force(keys)
+    return drift
+
+
+# What makes a workspace diverge from the last sync, as logged by _divergence_steps
+_DIVERGENCE = {
+    "missing":       "missing",
+    "SOUL.md":       "SOUL.md rolled back",
+    "links":         "links broken",
+    "openclaw.json": "openclaw.json entry missing or stale",
+}
+
+
+def _divergence_steps(agents: list) -> Generator:
+    """Keys of the agents whose container state no longer matches the last
+    applied sync, found with one openclaw.json check and one remote state
+    probe; None if the probe failed.
+
+    Run on startup and once a container has (re)started, since a recreated
+    container, or a reset or rolled back volume, may have lost workspaces,
+    SOUL.md content, links or openclaw.json entries. A SOUL.md is taken to be
+    rolled back only when it matches a version pushed before the last one
+    (see WriteCache.pushed_earlier); one matching no pushed version was
+    edited inside the container, and is left alone as _write_files_steps
+    would leave it.
+    """
+    with span("refresh openclaw.json"):
+        yield from openclaw_config._refresh_steps()
+    workspaces = {agent_key(a): workspace_for(a.get("name", "Unknown")) for a in agents}
+    with span("probe", workspaces=len(workspaces)):
+        snapshot = yield from _probe_steps(list(workspaces.values()))
+    if snapshot is None:
+        return None
+    links = shared_links()
+    counts = dict.fromkeys(_DIVERGENCE, 0)
+    diverged = set()
+    for agent in agents:
+        key       = agent_key(agent)
+        workspace = workspaces[key]
+        aid       = agent_id_for(agent.get("name", "Unknown"))
+        state     = snapshot[workspace]
+        soul      = state["files"].get("SOUL.md")
+        if soul is None:
+            what = "missing"
+        elif write_cache.pushed_earlier(workspace, "SOUL.md", soul):
+            what = "SOUL.md"
+        elif aid != "main" and any(state["links"][name]["target"] != link
+                                   and state["links"][name]["empty"] is not False
+                                   for name, link in links.items()):
+            what = "links"
+        elif openclaw_config.loaded and not openclaw_config.has_agent(aid, agent.get("model", "").strip()):
+            what = "openclaw.json"
+        else:
+            continue
+        counts[what] += 1
+        diverged.add(key)
+    if diverged:
+        log.warning("%d of %d workspace(s) no longer match the last sync (%s) "
+                    "— pushing them again.", len(diverged), len(agents),
+                    ", ".join(f"{n} {_DIVERGENCE[what]}" for what, n in counts.items() if n))
+    else:
+        log.info("All %d workspace(s) still match the last sync.", len(agents))
+    return diverged
+
+
+def restart_diff(diff: RosterDiff, diverged: set[str] | None) -> bool:
+    """Add the agents the container diverges on (see _divergence_steps) to
+    diff; returns whether to fall back to a full reconcile (the check failed).
+    """
+    if diverged is None:
+        log.warning("Could not check the container for divergence — falling back to a full reconcile.")
+        return True
+    if diverged:
+        diff.force(diverged)
+    return False
+
+
+def sync_changes(agents: list, superseded: Callable[[], bool] | None = None,
+                 force: set[str] = frozenset(), full: bool = False,
+                 restarted: bool = False) -> bool:
+    """sync_all limited to what changed since the last applied sync.
+
+    With restarted (on startup, or after a container (re)start), the agents
+    whose workspaces diverge from the last sync (see _divergence_steps) are
+    rebuilt along with the changes. Forced work — rebuilding the agents in force (keys),
+    or with full a reconcile of every agent against the container — then
+    follows as a second cycle on the background lane (see drift_diff), so
+    the changes themselves aren't held up by it.
+    """
+    refresh_templates()
+    diff = manifest.diff(agents)
+    if restarted and diff is not None:
+        full = restart_diff(diff, run_steps(_divergence_steps(agents))) or full
+    ok = True
+    if diff is None or diff or len(target().retries):
+        ok = sync_all(agents, diff, superseded)
+    elif not (force or full):
+        log.info("No synced fields changed since the last applied sync — nothing to do.")
+        record_applied()
+        return True
+    drift = drift_diff(agents, diff, force, full)
+    if drift is not None and not (superseded is not None and superseded()):
+        with background_lane():
+            ok = sync_all(agents, drift, superseded) and ok
+    return ok
 
 # ---------------------------------------------------------------------------
 # File hash helper
@@ -628,57 +3605,922 @@ def file_hash(path: str) -> str | None:
         return None
 
 
+# The last parsed subagents.json and the (inode, size, mtime) it was read at,
+# so targets picking up the same save share one parse
+_roster_lock = threading.Lock()
+_roster: tuple[tuple, list] | None = None
+
+
+def load_subagents() -> tuple[float, list]:
+    """Parse subagents.json; returns its mtime and the (shared, read-only) list.
+    Raises OSError or json.JSONDecodeError.
+    """
+    global _roster
+    with open(SUBAGENTS_FILE, "r", encoding="utf-8") as f:
+        st = os.fstat(f.fileno())
+        signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+        with _roster_lock:
+            if _roster is None or _roster[0] != signature:
+                _roster = (signature, json.load(f))
+            return st.st_mtime, _roster[1]
+
+
 def read_subagents() -> list | None:
-    """Read and parse subagents.json from the Mission Control data dir."""
+    """Read and parse subagents.json from the Mission Control data dir.
+
+    Records the file's mtime on the current target, for its sync lag. The
+    returned list is shared between targets and must not be modified.
+    """
     try:
-        with open(SUBAGENTS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        target().roster_mtime, agents = load_subagents()
+        return agents
     except (OSError, json.JSONDecodeError) as e:
         log.error("Failed to read subagents.json: %s", e)
         return None
 
+# ---------------------------------------------------------------------------
+# File watching
+# ---------------------------------------------------------------------------
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_Q_OVERFLOW  = 0x00004000
+_INOTIFY_EVENT = struct.Struct("iIII")   # wd, mask, cookie, len
+
+
+class SubagentsWatcher:
+    """Blocks until subagents.json's content changes.
+
+    Uses inotify on the data directory when available, so the tmp-file +
+    rename writes from server/store.js wake us immediately. A burst of events
+    is debounced into one change, for at most DEBOUNCE_MAX_SECS, so a steady
+    stream of saves still syncs that often. Whether or not inotify is in use, the file
+    is stat-checked every POLL_SECS as a backstop (inotify misses remote
+    writes on NFS and similar), and only hashed when its stat changes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._dir, self._name = os.path.split(path)
+        self._stat = self._stat_signature()
+        self._hash = file_hash(path)
+        self._fd = self._init_inotify() if WATCH_MODE != "poll" else None
+
+    def _init_inotify(self) -> int | None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+            if libc.inotify_add_watch(fd, os.fsencode(self._dir or "."), mask) < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        except (OSError, AttributeError, TypeError) as e:
+            log.warning("inotify unavailable (%s) — falling back to stat polling", e)
+            return None
+        log.info("Watching %s with inotify (debounce %.2fs, at most %.2fs)",
+                 self._dir, DEBOUNCE_SECS, DEBOUNCE_MAX_SECS)
+        return fd
+
+    def _stat_signature(self) -> tuple | None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _wait_event(self, timeout: float) -> bool:
+        """Wait up to timeout for inotify events; True if any concern our file."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        return bool(readable) and self._drain_events()
+
+    async def _wait_event_async(self, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_reader(self._fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await asyncio.wait_for(ready, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(self._fd)
+        return self._drain_events()
+
+    def _drain_events(self) -> bool:
+        """Read pending inotify events; True if any concern our file."""
+        relevant = False
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        offset = 0
+        while offset < len(buf):
+            _, mask, _, length = _INOTIFY_EVENT.unpack_from(buf, offset)
+            offset += _INOTIFY_EVENT.size
+            name = buf[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            # Matches both the file and store.js's "<file>.tmp" staging file
+            if mask & IN_Q_OVERFLOW or name.startswith(self._name):
+                relevant = True
+        return relevant
+
+    def _content_changed(self) -> bool:
+        """Cheap stat check first; only hash the file when its stat moved."""
+        sig = self._stat_signature()
+        if sig is None:
+            log.warning("Cannot read subagents.json — will retry.")
+            return False
+        if sig == self._stat:
+            return False
+        self._stat = sig
+
+        current_hash = file_hash(self.path)
+        if current_hash is None:
+            log.warning("Cannot read subagents.json — will retry.")
+            return False
+        if current_hash == self._hash:
+            return False
+        self._hash = current_hash
+        return True
+
+    @staticmethod
+    def _debounce_timeouts() -> Iterator[float]:
+        """Quiet periods to wait out a burst with: DEBOUNCE_SECS each, cut
+        short so the burst is flushed DEBOUNCE_MAX_SECS after it began."""
+        deadline = time.monotonic() + DEBOUNCE_MAX_SECS
+        while (remaining := deadline - time.monotonic()) > 0:
+            yield min(DEBOUNCE_SECS, remaining)
+
+    def wait_for_change(self) -> None:
+        while True:
+            if self._fd is None:
+                time.sleep(POLL_SECS)
+            elif self._wait_event(POLL_SECS):
+                # Absorb the rest of the burst until it goes quiet (or runs too long)
+                for timeout in self._debounce_timeouts():
+                    if not self._wait_event(timeout):
+                        break
+            if self._content_changed():
+                return
+
+    async def wait_for_change_async(self) -> None:
+        """wait_for_change for the asyncio engine: same logic, non-blocking waits."""
+        while True:
+            if self._fd is None:
+                await asyncio.sleep(POLL_SECS)
+            elif await self._wait_event_async(POLL_SECS):
+                for timeout in self._debounce_timeouts():
+                    if not await self._wait_event_async(timeout):
+                        break
+            if self._content_changed():
+                return
+
+
+class SyncQueue:
+    """Coalesces change notifications between the watcher and the sync engine.
+
+    At most one sync runs and at most one is pending: a change that arrives
+    while a sync is already pending just joins it, since a sync reads the
+    latest subagents.json when it starts. generation counts changes, so a
+    running sync can check at safe points whether it has been superseded.
+    take() serves the threads engine and take_async() the asyncio one.
+
+    A submission can also force work the diff against the manifest wouldn't
+    do (see the control API): agents to resync regardless, or a full
+    reconcile; or ask for the container to be checked for divergence after
+    it restarted (see ContainerEvents). Forced work joins the pending sync
+    like any change, and is handed to the sync that claims it as force,
+    full and restarted.
+    """
+
+    def __init__(self, pending: bool = False, restarted: bool = False) -> None:
+        self.generation = int(pending)   # bumped by every submitted change
+        self._taken     = 0              # generation the current (or last) sync started from
+        self._done      = 0              # generation the last finished sync started from
+        self._force: set[str] = set()
+        self._full  = False
+        self._restarted = restarted
+        self.force: frozenset[str] = frozenset()   # forced agent keys claimed by the current sync
+        self.full   = False                        # whether the current sync is a full reconcile
+        self.restarted = False                     # whether it follows a container (re)start
+        self._cond  = threading.Condition()
+        self._event: asyncio.Event | None = None
+        self._loop:  asyncio.AbstractEventLoop | None = None
+
+    @property
+    def pending(self) -> bool:
+        return self.generation != self._taken
+
+    def submit(self, force: set[str] = frozenset(), full: bool = False,
+               reason: str = "subagents.json changed", restarted: bool = False) -> int:
+        """Queue a sync (forcing the given agent keys, a full reconcile, or a
+        check of the restarted container); returns the generation a sync
+        must start from to cover it.
+        """
+        with self._cond:
+            coalesced = self.pending
+            self.generation += 1
+            self._force |= force
+            self._full  |= full
+            self._restarted |= restarted
+            generation = self.generation
+            self._cond.notify_all()
+        if self._event is not None:
+            # submit() may be called from outside the event loop (the control API)
+            self._loop.call_soon_threadsafe(self._event.set)
+        if coalesced:
+            log.info("%s — folded into the pending sync.", reason)
+        else:
+            log.info("%s — sync queued.", reason)
+        return generation
+
+    def _claim(self) -> int:
+        self._taken = self.generation
+        self.force, self._force = frozenset(self._force), set()
+        self.full,  self._full  = self._full, False
+        self.restarted, self._restarted = self._restarted, False
+        return self._taken
+
+    def take(self, timeout: float | None = None) -> int | None:
+        """Wait for a pending sync and claim it; returns its generation, or
+        None if timeout seconds pass first.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.pending, timeout):
+                self.force, self.full, self.restarted = frozenset(), False, False
+                return None
+            return self._claim()
+
+    async def take_async(self, timeout: float | None = None) -> int | None:
+        if self._event is None:
+            self._event = asyncio.Event()
+            self._loop  = asyncio.get_running_loop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.pending:
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(),
+                                       None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self.force, self.full, self.restarted = frozenset(), False, False
+                return None
+        with self._cond:
+            return self._claim()
+
+    def superseded(self, generation: int) -> bool:
+        """True once a change newer than generation is waiting."""
+        return self.generation != generation
+
+    def finish(self) -> None:
+        """The claimed sync is over. If it was superseded, it may have abandoned
+        some of its work: that, forced work included, carries over to the
+        pending sync, and only that one counts as done.
+        """
+        with self._cond:
+            if self.pending:
+                self._force |= self.force
+                self._full  |= self.full
+                self._restarted |= self.restarted
+                return
+            self._done = self._taken
+            self._cond.notify_all()
+
+    def wait_done(self, generation: int, timeout: float | None = None) -> bool:
+        """Wait until a sync covering generation has finished; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._done >= generation, timeout)
+
+
+# ---------------------------------------------------------------------------
+# Asyncio engine
+# ---------------------------------------------------------------------------
+#
+# Selected with MC_SYNC_ENGINE=asyncio. Drives the same sync steps as the
+# threaded engine, but container operations are asyncio subprocesses with a
+# per-operation timeout. Syncs are serialized the same way too: a change to
+# subagents.json that arrives mid-sync joins the one pending sync (see
+# SyncQueue), and the running sync stops at its next safe point between
+# agents rather than being cancelled mid-operation.
+
+class AsyncContainerSession:
+    """asyncio counterpart of ContainerSession (same request loop and framing)."""
+
+    def __init__(self, container: str) -> None:
+        self.container = container
+        self.spawns    = 0
+        self._proc: asyncio.subprocess.Process | None = None
+        self._lock = asyncio.Lock()
+
+    async def _start(self) -> None:
+        self._proc = await asyncio.create_subprocess_exec(
+            "docker", "exec", "-i", self.container, "bash", "-c", _SESSION_SCRIPT,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self.spawns += 1
+        log.debug("Started async container session (pid %d)", self._proc.pid)
+
+    def kill(self) -> None:
+        if self._proc is not None and self._proc.returncode is None:
+            with contextlib.suppress(ProcessLookupError, RuntimeError):
+                self._proc.kill()
+        self._proc = None
+
+    async def aclose(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        if proc.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                proc.kill()
+        await proc.wait()
+
+    async def _roundtrip(self, ops: list[tuple]) -> list[tuple[int, str, str]]:
+        self._proc.stdin.write(b"".join(ContainerSession._encode(op) for op in ops))
+        results = []
+        for _ in ops:
+            header = await self._proc.stdout.readline()
+            if not header:
+                raise ContainerSessionError("session exited")
+            rc, n_out, n_err = (int(x) for x in header.split())
+            out = await self._proc.stdout.readexactly(n_out)
+            err = await self._proc.stdout.readexactly(n_err)
+            results.append((rc, out.decode("utf-8", errors="replace"),
+                            err.decode("utf-8", errors="replace")))
+        await self._proc.stdin.drain()
+        return results
+
+    async def run(self, ops: list[tuple]) -> list[tuple[int, str, str]]:
+        async with self._lock:
+            for attempt in (1, 2):
+                if self._proc is None or self._proc.returncode is not None:
+                    self.kill()
+                    await self._start()
+                try:
+                    return await self._roundtrip(ops)
+                except asyncio.CancelledError:
+                    # Timed out or cancelled mid-response: the stream is unusable
+                    self.kill()
+                    raise
+                except (OSError, ValueError, ContainerSessionError,
+                        asyncio.IncompleteReadError) as e:
+                    self.kill()
+                    if attempt == 2:
+                        raise ContainerSessionError(str(e)) from e
+                    log.warning("Container session lost (%s) — reconnecting", e)
+        return []  # unreachable
+
+
+class AsyncSessionPool:
+    """SYNC_WORKERS lazily-started AsyncContainerSessions bound to the running loop."""
+
+    def __init__(self, container: str) -> None:
+        self.container = container
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._free: asyncio.Queue | None = None
+        self._all:  list[AsyncContainerSession] = []
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Subprocess transports can't outlive the loop that created them
+            self.close()
+            self._loop = loop
+            self._all  = [AsyncContainerSession(self.container) for _ in range(max(1, SYNC_WORKERS))]
+            self._free = asyncio.Queue()
+            for sess in self._all:
+                self._free.put_nowait(sess)
+        sess = await self._free.get()
+        try:
+            yield sess
+        finally:
+            self._free.put_nowait(sess)
+
+    @property
+    def spawns(self) -> int:
+        return sum(s.spawns for s in self._all)
+
+    def close(self) -> None:
+        for sess in self._all:
+            sess.kill()
+
+    async def aclose(self) -> None:
+        """Stop every session; call from the loop that owns them before it exits."""
+        for sess in self._all:
+            await sess.aclose()
+
+
+async_sessions = TargetAttr("async_sessions")
+
+
+async def _run_oneshot_async(op: tuple) -> tuple[int, str, str]:
+    argv, stdin = _oneshot_command(op)
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    try:
+        out, err = await proc.communicate(stdin)
+    except asyncio.CancelledError:
+        with contextlib.suppress(ProcessLookupError):
+            proc.kill()
+        raise
+    return proc.returncode, out.decode("utf-8", errors="replace"), err.decode("utf-8", errors="replace")
+
+
+async def async_docker_pipeline(ops: list[tuple]) -> list[tuple[int, str, str]]:
+    """asyncio docker_pipeline. A batch may take OP_TIMEOUT_SECS per op in it;
+    on timeout every op in the batch reports rc 124.
+    """
+    tgt = target()
+    if tgt.transport in ("api", "volume"):
+        # The Engine API client and the filesystem calls are blocking
+        # (the API client's sockets carry their own timeout)
+        return await asyncio.to_thread(docker_pipeline, ops)
+    if tgt.breaker.remaining():
+        return [(1, "", "container unreachable (circuit open)")] * len(ops)
+    lowered, answers = lower_ops(ops)
+    timeout = OP_TIMEOUT_SECS * max(1, len(lowered))
+    with span("rate limit", "docker", ops=len(lowered)):
+        await tgt.scheduler.acquire_async(len(lowered))
+    count_container_ops(lowered)
+    with docker_span(ops, lowered):
+        try:
+            if tgt.transport == "exec":
+                async def one_by_one() -> list[tuple[int, str, str]]:
+                    return [await _run_oneshot_async(op) for op in lowered]
+                results = await asyncio.wait_for(one_by_one(), timeout)
+            else:
+                async with async_sessions.acquire() as sess:
+                    results = await asyncio.wait_for(sess.run(lowered), timeout)
+        except asyncio.TimeoutError:
+            log.error("Container operation timed out after %.1fs", timeout)
+            tgt.breaker.trip(f"no response in {timeout:.1f}s")
+            return [(124, "", "timed out")] * len(ops)
+        except ContainerSessionError as e:
+            log.error("Container session unavailable: %s", e)
+            tgt.breaker.trip(str(e))
+            return [(1, "", str(e))] * len(ops)
+    tgt.breaker.observe(results)
+    return [results[i] for i in answers]
+
+
+async def run_steps_async(steps: Generator):
+    """Drive a steps generator with async_docker_pipeline; returns its result."""
+    try:
+        ops = next(steps)
+        while True:
+            ops = steps.send(await async_docker_pipeline(ops))
+    except StopIteration as stop:
+        return stop.value
+
+
+async def async_sync_all(agents: list, diff: RosterDiff | None = None,
+                         superseded: Callable[[], bool] | None = None) -> bool:
+    """asyncio sync_all: up to SYNC_WORKERS agents in flight at once."""
+    start = time.monotonic()
+    limit = asyncio.Semaphore(max(1, SYNC_WORKERS))
+
+    async def run(agent: dict, new_agent: bool, state: dict | None) -> bool | None:
+        async with limit:
+            if superseded is not None and superseded():
+                return None
+            if target().breaker.remaining():
+                return False  # container unreachable: leave the agent to the retry
+            # Each task has its own context
+            log_agent.set(agent.get("name", "?"))
+            op_priority.set(max(op_priority.get(), sync_priority(agent, new_agent, diff)))
+            agent_start = time.monotonic()
+            ok = False
+            try:
+                with span("sync_agent"):
+                    ok = await run_steps_async(_sync_agent_steps(agent, agents, new_agent, state))
+            except Exception as e:
+                log.error("Error syncing agent %s: %s", agent.get("name", "?"), e)
+            finally:
+                record_agent_sync(agent, ok, time.monotonic() - agent_start)
+            return ok
+
+    with traced_cycle(agents, diff):
+        with span("begin cycle"):
+            work = await run_steps_async(_begin_cycle_steps(agents, diff))
+        results = []
+        for n, items in enumerate(split_work(work, diff)):
+            if n and items:
+                await run_steps_async(_commit_roster_steps())
+            results += await asyncio.gather(*(run(*item) for item in items))
+        with span("finish cycle"):
+            ok = await run_steps_async(_finish_cycle_steps(agents, work, results))
+    record_cycle(ok, time.monotonic() - start)
+    return ok
+
+
+async def async_sync_changes(agents: list, superseded: Callable[[], bool] | None = None,
+                             force: set[str] = frozenset(), full: bool = False,
+                             restarted: bool = False) -> bool:
+    """asyncio sync_changes."""
+    refresh_templates()
+    diff = manifest.diff(agents)
+    if restarted and diff is not None:
+        full = restart_diff(diff, await run_steps_async(_divergence_steps(agents))) or full
+    ok = True
+    if diff is None or diff or len(target().retries):
+        ok = await async_sync_all(agents, diff, superseded)
+    elif not (force or full):
+        log.info("No synced fields changed since the last applied sync — nothing to do.")
+        record_applied()
+        return True
+    drift = drift_diff(agents, diff, force, full)
+    if drift is not None and not (superseded is not None and superseded()):
+        with background_lane():
+            ok = await async_sync_all(agents, drift, superseded) and ok
+    return ok
+
+
+async def async_sync_target(tgt: Target) -> None:
+    """The asyncio sync loop for one target: apply each queued roster, and retry failures."""
+    with tgt.activated():  # the task runs in its own copy of the context
+        while True:
+            await tgt.breaker.wait_async()
+            generation = await tgt.queue.take_async(tgt.retries.wait())
+            if generation is None:
+                log.info("Retrying failed syncs.")
+                generation = tgt.queue.generation
+            agents = read_subagents()
+            if agents is None:
+                tgt.queue.finish()
+                continue
+            try:
+                await async_sync_changes(agents, lambda: tgt.queue.superseded(generation),
+                                         tgt.queue.force, tgt.queue.full, tgt.queue.restarted)
+            except Exception as e:
+                log.error("Sync failed: %s", e)
+                tgt.last_error = str(e)
+            tgt.queue.finish()
+
+
+async def main_async(watcher: "SubagentsWatcher") -> None:
+    """The watcher and per-target sync loops for the asyncio engine."""
+    async def watch() -> None:
+        while True:
+            await watcher.wait_for_change_async()
+            submit_all()
+
+    tasks = [asyncio.create_task(watch())]
+    tasks += [asyncio.create_task(async_sync_target(tgt)) for tgt in targets]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for tgt in targets:
+            await tgt.async_sessions.aclose()
+
+# ---------------------------------------------------------------------------
+# Container lifecycle events
+# ---------------------------------------------------------------------------
+
+class ContainerEvents:
+    """Follows a target's container lifecycle events (unless MC_SYNC_EVENTS=off).
+
+    A daemon thread reads `docker events` — or, with the "api" transport,
+    the Engine API's /events stream — filtered to the container's start,
+    restart and die events. A die holds the target's circuit breaker, so
+    container work pauses (and changes fold into one pending sync) rather
+    than failing op by op; a start or restart releases it and queues a sync
+    that first checks the container for divergence (see _divergence_steps).
+
+    A dropped stream is reopened, with backoff, from just after the last
+    event seen, so nothing in between is missed. Until then a hold is
+    released: the breaker's own trials find out whether the container is up.
+    """
+
+    ACTIONS = ("start", "restart", "die")
+
+    def __init__(self, tgt: Target) -> None:
+        self.tgt      = tgt
+        self.since    = time.time_ns()   # replay events from here on reconnect
+        self.failures = 0
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name=f"mc-sync-events-{self.tgt.name}", daemon=True).start()
+
+    def _run(self) -> None:
+        with self.tgt.activated():
+            log.info("Following lifecycle events of container %s", self.tgt.container)
+            while True:
+                opened = time.monotonic()
+                try:
+                    reason = self._follow_api() if self.tgt.transport == "api" else self._follow_cli()
+                except (OSError, ValueError, http.client.HTTPException, EngineAPIError) as e:
+                    reason = str(e)
+                if time.monotonic() - opened > RETRY_MAX_SECS:
+                    self.failures = 0
+                self.failures += 1
+                delay = backoff_secs(self.failures)
+                log.warning("Container event stream lost (%s) — reopening in %.1fs", reason, delay)
+                if self.tgt.breaker.held:
+                    self.tgt.breaker.release("state unknown (event stream lost)")
+                time.sleep(delay)
+
+    def _since(self) -> str:
+        return f"{self.since // 10**9}.{self.since % 10**9:09d}"
+
+    def _follow_cli(self) -> str:
+        """Handle `docker events` output until it exits; returns why it did."""
+        argv = ["docker", "events", "--format", "{{json .}}", "--since", self._since(),
+                "--filter", "type=container", "--filter", f"container={self.tgt.container}"]
+        argv += [f"--filter=event={action}" for action in self.ACTIONS]
+        proc = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True)
+        try:
+            for line in proc.stdout:
+                if line.strip():
+                    self.handle(json.loads(line))
+            err = proc.stderr.read().strip()
+        finally:
+            proc.kill()
+            proc.wait()
+        return err.splitlines()[-1] if err else f"docker events exited with {proc.returncode}"
+
+    def _follow_api(self) -> str:
+        """Handle the Engine API's /events stream until it ends; returns why it did."""
+        query = urllib.parse.urlencode({
+            "since":   self._since(),
+            "filters": json.dumps({"type": ["container"], "container": [self.tgt.container],
+                                   "event": list(self.ACTIONS)}),
+        })
+        conn = _UnixHTTPConnection(DOCKER_SOCKET)   # no timeout: the stream idles between events
+        try:
+            conn.request("GET", f"/{EngineAPIClient.API_VERSION}/events?{query}")
+            resp = conn.getresponse()
+            if resp.status >= 400:
+                raise EngineAPIError(resp.status, resp.read().decode("utf-8", errors="replace").strip())
+            for line in resp:
+                if line.strip():
+                    self.handle(json.loads(line))
+        finally:
+            conn.close()
+        return "stream ended"
+
+    def handle(self, event: dict) -> None:
+        """Act on one event (as `docker events --format '{{json .}}'` prints it)."""
+        if event.get("timeNano"):
+            self.since = int(event["timeNano"]) + 1
+        action = event.get("Action") or event.get("status")
+        if action not in self.ACTIONS:
+            return
+        CONTAINER_EVENTS.inc(target=self.tgt.name, event=action)
+        if action == "die":
+            code = event.get("Actor", {}).get("Attributes", {}).get("exitCode")
+            self.tgt.breaker.hold("stopped" + (f" (exit code {code})" if code else ""))
+            return
+        what = "started" if action == "start" else "restarted"
+        self.tgt.breaker.release(what)
+        self.tgt.queue.submit(reason=f"Container {what}", restarted=True)
+
+
+def start_container_events() -> None:
+    """Follow every target's container lifecycle events (MC_SYNC_EVENTS)."""
+    if EVENTS == "off":
+        return
+    for tgt in targets:
+        ContainerEvents(tgt).start()
+
+# ---------------------------------------------------------------------------
+# Control API
+# ---------------------------------------------------------------------------
+#
+# Served on CONTROL_LISTEN — by default a unix socket next to subagents.json,
+# which the Mission Control backend's container mounts — so the backend can
+# have a change synced the moment it saves it, rather than when the watcher
+# notices:
+#
+#   POST /sync              queue a sync of subagents.json now
+#   POST /sync/agent/<id>   the same, also rebuilding every output of agent <id>
+#   POST /reconcile         the same, followed by a full reconcile: every agent
+#                           checked against the container
+#   GET  /status            per target, the last applied sync and error; per agent,
+#                           its last sync time, last error and output hashes
+#
+# Rebuilds of agents that haven't changed, and reconciles, fix drift and run
+# on the background lane (see OpScheduler). Every request takes
+# ?target=<name> to address one target (default: all).
+# POSTs answer 202 once queued, or with ?wait=<secs>, once the sync has
+# finished (or the wait ran out) with the status of the targets.
+
+def target_status(tgt: Target) -> dict:
+    """The control API's view of one target and its agents."""
+    with tgt.activated():
+        files = tgt.write_cache.snapshot()
+        records = tgt.manifest.records
+        statuses = dict(tgt.agents)
+        agents = {}
+        for key in records.keys() | statuses.keys():
+            status = statuses.get(key, {})
+            name = status.get("name") or records.get(key, {}).get("name", "")
+            agents[key] = {
+                "name":          name,
+                "agent_id":      agent_id_for(name),
+                "workspace":     workspace_for(name),
+                "last_sync":     status.get("last_sync"),
+                "last_error":    status.get("last_error"),
+                "retry_pending": key in tgt.retries,
+                "outputs":       files.get(workspace_for(name), {}),
+            }
+        return {
+            "container":     tgt.container,
+            "base":          tgt.base,
+            "transport":     tgt.transport,
+            "last_applied":  tgt.last_applied,
+            "last_error":    tgt.last_error,
+            "sync_pending":  tgt.queue.pending,
+            "retry_pending": len(tgt.retries),
+            "container_down": tgt.breaker.held,
+            "paused_secs":   None if tgt.breaker.held else round(tgt.breaker.remaining(), 3),
+            "agents":        agents,
+        }
+
+
+class _ControlHandler(http.server.BaseHTTPRequestHandler):
+    def _reply(self, code: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _parse(self) -> tuple[str, dict[str, str], list[Target] | None]:
+        """(path, query, addressed targets — None if ?target names an unknown one)"""
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        selected = [t for t in targets if query.get("target", t.name) == t.name]
+        return url.path.rstrip("/"), query, selected or None
+
+    def do_GET(self) -> None:
+        path, _, selected = self._parse()
+        if path != "/status":
+            return self._reply(404, {"error": f"no such endpoint: GET {path}"})
+        if selected is None:
+            return self._reply(404, {"error": "unknown target"})
+        self._reply(200, {"targets": {t.name: target_status(t) for t in selected}})
+
+    def do_POST(self) -> None:
+        path, query, selected = self._parse()
+        if selected is None:
+            return self._reply(404, {"error": "unknown target"})
+        force, full = frozenset(), False
+        if path == "/sync":
+            reason = "Sync requested"
+        elif path == "/reconcile":
+            full, reason = True, "Full reconcile requested"
+        elif path.startswith("/sync/agent/"):
+            key = urllib.parse.unquote(path[len("/sync/agent/"):])
+            try:
+                _, roster = load_subagents()
+            except (OSError, json.JSONDecodeError) as e:
+                return self._reply(503, {"error": f"cannot read subagents.json: {e}"})
+            agent = next((a for a in roster if agent_key(a) == key), None)
+            if agent is None:
+                return self._reply(404, {"error": f"no agent with id {key!r} in subagents.json"})
+            force, reason = frozenset({key}), f"Sync of {agent.get('name', key)} requested"
+        else:
+            return self._reply(404, {"error": f"no such endpoint: POST {path}"})
+        try:
+            wait = float(query.get("wait", 0))
+        except ValueError:
+            return self._reply(400, {"error": "wait must be a number of seconds"})
+
+        generations = {}
+        for tgt in selected:
+            with tgt.activated():
+                generations[tgt] = tgt.queue.submit(force, full, reason)
+        if not wait:
+            return self._reply(202, {"queued": [t.name for t in selected]})
+        deadline = time.monotonic() + wait
+        done = {t.name: t.queue.wait_done(g, max(0.0, deadline - time.monotonic()))
+                for t, g in generations.items()}
+        self._reply(200, {"done": done, "targets": {t.name: target_status(t) for t in selected}})
+
+    def address_string(self) -> str:
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format: str, *args) -> None:
+        log.debug("control: " + format, *args)
+
+
+def start_control_server(listen: str) -> socketserver.BaseServer | None:
+    """Serve the control API on CONTROL_LISTEN."""
+    return serve_http(listen, _ControlHandler, "control")
+
 # ---------------------------------------------------------------------------
 # Main loop
 # ---------------------------------------------------------------------------
 
+try:
+    targets = load_targets(TARGETS_SPEC)
+except ValueError as e:
+    log.error("Invalid MC_SYNC_TARGETS: %s", e)
+    sys.exit(1)
+
+
+def submit_all() -> None:
+    """Queue a sync of the current subagents.json on every target."""
+    for tgt in targets:
+        with tgt.activated():
+            tgt.queue.submit()
+
+
+def sync_target(tgt: Target) -> None:
+    """The sync loop for one target: apply each queued roster, and retry failures.
+
+    Every target runs its own loop, so a slow or unreachable container only
+    delays its own syncs; the others keep up with subagents.json. While the
+    target's circuit breaker is open (or held while the container is down),
+    the loop waits it out, and changes arriving meanwhile fold into one
+    pending sync.
+    """
+    with tgt.activated():
+        while True:
+            tgt.breaker.wait()
+            generation = tgt.queue.take(tgt.retries.wait())
+            if generation is None:
+                log.info("Retrying failed syncs.")
+                generation = tgt.queue.generation
+            agents = read_subagents()
+            if agents is None:
+                tgt.queue.finish()
+                continue
+            try:
+                sync_changes(agents, lambda: tgt.queue.superseded(generation),
+                             tgt.queue.force, tgt.queue.full, tgt.queue.restarted)
+            except Exception as e:
+                log.error("Sync failed: %s", e)
+                tgt.last_error = str(e)
+            tgt.queue.finish()
+
+
 def main() -> None:
     log.info("mc-openclaw-sync starting.")
     log.info("Watching: %s", SUBAGENTS_FILE)
-    log.info("Container: %s", CONTAINER)
+    for tgt in targets:
+        log.info("Target %s: container %s, base %s", tgt.name, tgt.container, tgt.base)
     log.info("Poll interval: %ds", POLL_SECS)
+    if TRACE_DIR:
+        log.info("Tracing sync cycles to %s", TRACE_DIR)
 
     if not os.path.exists(SUBAGENTS_FILE):
         log.error("subagents.json not found at %s — aborting.", SUBAGENTS_FILE)
         sys.exit(1)
 
-    # Do an initial sync on startup
-    agents = read_subagents()
-    if agents is not None:
-        sync_all(agents)
-
-    last_hash = file_hash(SUBAGENTS_FILE)
-
-    while True:
-        time.sleep(POLL_SECS)
-        current_hash = file_hash(SUBAGENTS_FILE)
-
-        if current_hash is None:
-            log.warning("Cannot read subagents.json — will retry.")
-            continue
-
-        if current_hash == last_hash:
-            continue
+    # Start watching before the initial sync so edits made during it aren't lost
+    watcher = SubagentsWatcher(SUBAGENTS_FILE)
+    start_metrics_server(METRICS_LISTEN)
+    start_control_server(CONTROL_LISTEN)
+    start_container_events()
+
+    # Pick up from the last applied sync, so startup only reconciles the delta
+    for tgt in targets:
+        with tgt.activated():
+            if tgt.manifest.load():
+                tgt.write_cache.restore(tgt.manifest.files)
+                tgt.write_cache.restore_history(tgt.manifest.history)
+
+    if ENGINE == "asyncio":
+        log.info("Engine: asyncio")
+        asyncio.run(main_async(watcher))
+        return
 
-        # File changed
-        log.info("subagents.json changed — running sync.")
-        last_hash = current_hash
+    def watch() -> None:
+        while True:
+            watcher.wait_for_change()
+            submit_all()
 
-        agents = read_subagents()
-        if agents is not None:
-            sync_all(agents)
+    threading.Thread(target=watch, name="mc-sync-watch", daemon=True).start()
+    loops = [
+        threading.Thread(target=sync_target, args=(tgt,), name=f"mc-sync-{tgt.name}", daemon=True)
+        for tgt in targets
+    ]
+    for loop in loops:
+        loop.start()
+    for loop in loops:
+        loop.join()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync Mission Control's subagents.json into OpenClaw.")
+    parser.add_argument(
+        "--trace", nargs="?", const="/docker/missioncontrol/mc-openclaw-sync-traces", metavar="DIR",
+        help="write a Chrome/Perfetto trace-event file per sync cycle to DIR (default: %(const)s)",
+    )
+    args = parser.parse_args()
+    if args.trace:
+        TRACE_DIR = args.trace
     try:
         main()
     except KeyboardInterrupt:
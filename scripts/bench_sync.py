@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+bench_sync.py
+-------------
+Measures what mc-openclaw-sync cycles cost, against a stand-in for the
+container so the numbers reflect the sync logic rather than docker:
+
+  fake   an in-process fake (FakeContainer) that parses the daemon's commands
+  bash   the daemon's real session, probe and commit scripts run under the
+         local bash, against a directory standing in for the container's
+         filesystem (container paths are host paths under a temp dir)
+
+For each roster size (synthetic subagents.json files of 10 to 10,000 agents)
+it runs main()'s change path — watcher change detection, read_subagents() and
+sync_changes() — for three scenarios:
+
+  cold_start   empty workspaces, no manifest: every agent is created
+  single_edit  one agent's soul changes
+  full_edit    every agent's description changes
+
+and reports wall time, container operations (by kind), bytes sent to and read
+from the container, and the process's peak RSS. Each roster size runs in its
+own child process, so peak RSS is the high-water mark of that size's run up
+to and including the scenario.
+
+Usage:
+  python3 scripts/bench_sync.py                       # JSON on stdout
+  python3 scripts/bench_sync.py --sizes 10,100 --output bench.json
+  python3 scripts/bench_sync.py --container bash --sizes 10,100
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import posixpath
+import re
+import resource
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mc-openclaw-sync.py")
+SIZES = (10, 100, 1000, 10000)
+SCENARIOS = ("cold_start", "single_edit", "full_edit")
+
+# ---------------------------------------------------------------------------
+# Container stand-ins
+# ---------------------------------------------------------------------------
+
+def new_stats() -> dict:
+    return {"ops": {}, "bytes_sent": 0, "bytes_received": 0, "unsupported": 0}
+
+
+def count_op(stats: dict, op: tuple, result: tuple[int, str, str]) -> None:
+    """Add one op and its result to a stand-in's stats."""
+    kind = op[0]
+    stats["ops"][kind] = stats["ops"].get(kind, 0) + 1
+    if kind in ("exec", "read"):
+        stats["bytes_sent"] += len(op[1])
+    elif kind == "write":
+        stats["bytes_sent"] += len(op[1]) + len(op[2].encode())
+    elif kind == "untar":
+        stats["bytes_sent"] += len(op[1]) + len(op[2])
+    stats["bytes_received"] += len(result[1]) + len(result[2])
+
+
+class FakeContainer:
+    """An in-memory filesystem answering the ops mc-openclaw-sync sends.
+
+    Understands exactly the shell commands the daemon issues; anything else
+    fails with rc 127 and is counted in stats["unsupported"], so a benchmark
+    run against a newer daemon can't silently measure nothing.
+    """
+
+    def __init__(self) -> None:
+        self.files: dict[str, bytes] = {}
+        self.dirs:  set[str] = {"/"}
+        self.links: dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.stats = new_stats()
+
+    # -- filesystem -----------------------------------------------------------
+
+    def mkdirs(self, path: str) -> None:
+        while path not in self.dirs and path != "/":
+            self.dirs.add(path)
+            path = posixpath.dirname(path)
+
+    def resolve(self, path: str) -> str:
+        for _ in range(16):
+            if path in self.links:
+                path = posixpath.normpath(posixpath.join(posixpath.dirname(path), self.links[path]))
+                continue
+            parent = posixpath.dirname(path)
+            if parent != path:
+                real_parent = self.resolve(parent)
+                if real_parent != parent:
+                    path = posixpath.join(real_parent, posixpath.basename(path))
+                    continue
+            return path
+        return path
+
+    def is_dir(self, path: str) -> bool:
+        return self.resolve(path) in self.dirs
+
+    def is_file(self, path: str) -> bool:
+        return self.resolve(path) in self.files
+
+    def listdir(self, path: str) -> list[str]:
+        prefix = path.rstrip("/") + "/"
+        names = set()
+        for entry in (*self.files, *self.dirs, *self.links):
+            if entry.startswith(prefix):
+                names.add(entry[len(prefix):].split("/", 1)[0])
+        return sorted(names)
+
+    def remove(self, path: str) -> None:
+        prefix = path.rstrip("/") + "/"
+        self.links.pop(path, None)
+        self.files.pop(path, None)
+        self.dirs.discard(path)
+        for table in (self.files, self.links):
+            for entry in [e for e in table if e.startswith(prefix)]:
+                del table[entry]
+        self.dirs -= {d for d in self.dirs if d.startswith(prefix)}
+
+    # -- commands -------------------------------------------------------------
+
+    COMMANDS = [
+        (re.compile(r"files=\((.*)\) links=\((.*)\) list=(\S+)\n(?s:.*)$"), "probe"),
+        (re.compile(r"rm -rf (\S+)$"), "rm"),
+        (re.compile(r"ln -s (\S+) (\S+)$"), "ln"),
+        (re.compile(r"mkdir -p (\S+)$"), "mkdir"),
+        (re.compile(r"sha256sum (\S+) 2>/dev/null$"), "sha256sum"),
+        (re.compile(r"cp -p (\S+) (\S+)$"), "cp"),
+        (re.compile(r"list=(\S+)\n(?s:.*)$"), "commit"),
+    ]
+
+    def exec(self, cmd: str) -> tuple[int, str, str]:
+        for pattern, kind in self.COMMANDS:
+            match = pattern.match(cmd)
+            if match:
+                return getattr(self, f"_cmd_{kind}")(*match.groups())
+        self.stats["unsupported"] += 1
+        return 127, "", f"fake container: unsupported command: {cmd}"
+
+    def _cmd_probe(self, files, links, listing):
+        snapshot = {}
+        for w in self.files.pop(listing, b"").decode().split():
+            state = {"exists": self.is_dir(w), "files": {}, "links": {}}
+            for f in files.split():
+                data = self.files.get(self.resolve(f"{w}/{f}"))
+                state["files"][f] = hashlib.sha256(data).hexdigest() if data is not None else None
+            for name in links.split():
+                p = f"{w}/{name}"
+                if p in self.links:
+                    state["links"][name] = {"target": self.resolve(p), "empty": None}
+                elif p in self.dirs:
+                    state["links"][name] = {"target": None, "empty": not self.listdir(p)}
+                else:
+                    state["links"][name] = {"target": None, "empty": None}
+            snapshot[w] = state
+        return 0, json.dumps(snapshot, separators=(",", ":")) + "\n", ""
+
+    def _cmd_rm(self, path):
+        self.remove(path)
+        return 0, "", ""
+
+    def _cmd_ln(self, target, link):
+        self.links[link] = target
+        return 0, "", ""
+
+    def _cmd_mkdir(self, path):
+        self.mkdirs(self.resolve(path))
+        return 0, "", ""
+
+    def _cmd_sha256sum(self, path):
+        data = self.files.get(self.resolve(path))
+        if data is None:
+            return 1, "", ""
+        return 0, f"{hashlib.sha256(data).hexdigest()}  {path}\n", ""
+
+    def _cmd_cp(self, src, dest):
+        data = self.files.get(self.resolve(src))
+        if data is None:
+            return 1, "", f"cp: cannot stat '{src}'"
+        self.files[self.resolve(dest)] = data
+        return 0, "", ""
+
+    def _cmd_commit(self, listing):
+        entries = [line.split() for line in self.files.pop(listing, b"").decode().splitlines()]
+        bad = {}
+        for digest, tmp, dest in entries:
+            data = self.files.get(tmp)
+            if data is None or hashlib.sha256(data).hexdigest() != digest:
+                bad[posixpath.dirname(dest)] = f"staged {posixpath.basename(dest)} missing or not as written"
+            elif self.is_dir(dest):
+                bad[posixpath.dirname(dest)] = f"{posixpath.basename(dest)} is a directory"
+        for _, tmp, dest in entries:
+            data = self.files.pop(tmp, None)
+            if posixpath.dirname(dest) not in bad:
+                self.files[self.resolve(dest)] = data
+        return int(bool(bad)), "".join(f"{d}\t{reason}\n" for d, reason in bad.items()), ""
+
+    # -- ops ------------------------------------------------------------------
+
+    def run(self, ops: list[tuple]) -> list[tuple[int, str, str]]:
+        results = []
+        with self.lock:
+            for op in ops:
+                kind = op[0]
+                if kind == "exec":
+                    result = self.exec(op[1])
+                elif kind == "read":
+                    data = self.files.get(self.resolve(op[1]))
+                    result = (0, data.decode(), "") if data is not None else (1, "", "No such file")
+                elif kind == "write":
+                    path = self.resolve(op[1])
+                    self.mkdirs(posixpath.dirname(path))
+                    self.files[path] = op[2].encode()
+                    result = (0, "", "")
+                elif kind == "untar":
+                    result = self.untar(op[1], op[2])
+                else:
+                    result = (1, "", f"fake container: unknown op {kind}")
+                count_op(self.stats, op, result)
+                results.append(result)
+        return results
+
+    def untar(self, dest: str, data: bytes) -> tuple[int, str, str]:
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            for member in tar.getmembers():
+                path = posixpath.normpath(posixpath.join(dest, member.name))
+                if member.isdir():
+                    self.mkdirs(path)
+                elif member.issym():
+                    self.mkdirs(posixpath.dirname(path))
+                    self.links[path] = member.linkname
+                elif member.isfile():
+                    self.mkdirs(posixpath.dirname(path))
+                    self.files[path] = tar.extractfile(member).read()
+        return 0, "", ""
+
+
+class FakeSession:
+    """Stands in for ContainerSession in the daemon's SessionPool."""
+
+    spawns = 0
+
+    def __init__(self, container: FakeContainer) -> None:
+        self.container = container
+
+    def run(self, ops: list[tuple]) -> list[tuple[int, str, str]]:
+        return self.container.run(ops)
+
+    def close(self) -> None:
+        pass
+
+
+class BashContainer:
+    """The container as a directory: the daemon's own ContainerSession, with
+    its session script run by the local bash instead of `docker exec`, so
+    every op goes through the real _SESSION_SCRIPT and the exec'd scripts
+    (_PROBE_SCRIPT, _COMMIT_SCRIPT, ...) it is sent.
+
+    The target's base lies under root, so the daemon's container paths are
+    host paths there.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root  = root
+        self.base  = os.path.join(root, "data", ".openclaw")
+        self.lock  = threading.Lock()
+        self.stats = new_stats()
+
+    def target(self) -> dict:
+        return {"name": "bench", "container": "bench", "base": self.base, "transport": "session"}
+
+    def attach(self, daemon) -> None:
+        bench = self
+
+        class BashSession(daemon.ContainerSession):
+            def _start(self) -> None:
+                self._proc = subprocess.Popen(
+                    ["bash", "-c", daemon._SESSION_SCRIPT], cwd=bench.root,
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                )
+                self.spawns += 1
+
+            def run(self, ops: list[tuple]) -> list[tuple[int, str, str]]:
+                results = super().run(ops)
+                with bench.lock:
+                    for op, result in zip(ops, results):
+                        count_op(bench.stats, op, result)
+                return results
+
+        daemon.targets[0].sessions.factory = lambda: BashSession("bench")
+
+    def seed(self, openclaw_json: dict) -> None:
+        os.makedirs(os.path.join(self.base, "workspace", "skills"))
+        os.makedirs(os.path.join(self.base, "vault"))
+        with open(os.path.join(self.base, "openclaw.json"), "w", encoding="utf-8") as f:
+            json.dump(openclaw_json, f)
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+ROLES = ("Research", "Builder", "Planner", "Designer", "Critic / Evaluator", "Scheduler", "Analyst")
+
+
+def synthetic_roster(n: int) -> list[dict]:
+    """Atlas plus n - 1 sub-agents with realistically sized text fields."""
+    agents = [{
+        "id": "atlas", "name": "Atlas", "role": "CEO", "status": "idle",
+        "model": "openai/gpt-5.3-codex", "description": "Runs the team. " * 40,
+        "soul": "Calm and decisive. " * 40, "skills": ["orchestration"],
+    }]
+    for i in range(1, n):
+        agents.append({
+            "id": f"agent-{i:05d}", "name": f"Agent{i:05d}", "role": ROLES[i % len(ROLES)],
+            "status": "idle", "task": "Ready for assignment", "model": "openai/gpt-5.2",
+            "description": f"Agent {i} handles a slice of the workload. " * 20,
+            "soul": f"Agent {i} is precise and brief. " * 20, "skills": ["research", "web"],
+        })
+    return agents
+
+
+def write_atomic(path: str, agents: list) -> None:
+    """Write like server/store.js does: tmp file, then rename."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(agents, f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_daemon(workdir: str, target: dict | None = None):
+    os.environ["MC_SYNC_TRANSPORT"]    = "session"
+    os.environ["MC_SYNC_WATCH"]        = "poll"
+    os.environ["MC_SYNC_MANIFEST"]     = os.path.join(workdir, "manifest.json")
+    os.environ["MC_SYNC_TEMPLATE_DIR"] = os.path.join(workdir, "templates")
+    if target is not None:
+        os.environ["MC_SYNC_TARGETS"] = json.dumps([target])
+    else:
+        os.environ.pop("MC_SYNC_TARGETS", None)  # one target: CONTAINER / OPENCLAW_BASE
+    os.environ["MC_SYNC_OPS_PER_SEC"]  = "0"   # measure the work, not the rate limiter's pacing
+    spec = importlib.util.spec_from_file_location("mc_openclaw_sync", SCRIPT)
+    daemon = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(daemon)
+    daemon.log.setLevel("WARNING")
+    daemon.SUBAGENTS_FILE = os.path.join(workdir, "subagents.json")
+    return daemon
+
+
+INITIAL_OPENCLAW_JSON = {"agents": {"list": [{"id": "main"}]}, "tools": {"agentToAgent": {"allow": ["main"]}}}
+
+
+def run_size(n: int, mode: str = "fake") -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        if mode == "bash":
+            container = BashContainer(os.path.join(workdir, "container"))
+            daemon = load_daemon(workdir, container.target())
+            container.attach(daemon)
+            container.seed(INITIAL_OPENCLAW_JSON)
+        else:
+            daemon = load_daemon(workdir)
+            container = FakeContainer()
+            base = daemon.OPENCLAW_BASE
+            container.mkdirs(f"{base}/workspace/skills")
+            container.mkdirs(f"{base}/vault")
+            container.files[daemon.OPENCLAW_JSON] = json.dumps(INITIAL_OPENCLAW_JSON).encode()
+            daemon.targets[0].sessions.factory = lambda: FakeSession(container)
+        tgt = daemon.targets[0]
+
+        agents = synthetic_roster(n)
+        write_atomic(daemon.SUBAGENTS_FILE, [])
+        watcher = daemon.SubagentsWatcher(daemon.SUBAGENTS_FILE)
+
+        for scenario in SCENARIOS:
+            if scenario == "single_edit":
+                agents[n // 2]["soul"] += " Edited."
+            elif scenario == "full_edit":
+                for agent in agents:
+                    agent["description"] += " Edited."
+            write_atomic(daemon.SUBAGENTS_FILE, agents)
+
+            container.stats = new_stats()
+            start = time.perf_counter()
+            # main()'s change path, minus the blocking wait
+            detected = watcher._content_changed()
+            with tgt.activated():
+                ok = daemon.sync_changes(daemon.read_subagents())
+            wall = time.perf_counter() - start
+
+            results.append({
+                "agents":         n,
+                "container":      mode,
+                "scenario":       scenario,
+                "wall_secs":      round(wall, 6),
+                "detected":       detected,
+                "applied":        ok,
+                "ops_total":      sum(container.stats["ops"].values()),
+                "ops":            container.stats["ops"],
+                "bytes_sent":     container.stats["bytes_sent"],
+                "bytes_received": container.stats["bytes_received"],
+                "unsupported":    container.stats["unsupported"],
+                "files_written":  tgt.write_cache.misses,
+                "files_skipped":  tgt.write_cache.hits,
+                "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="comma-separated roster sizes (default: %(default)s)")
+    parser.add_argument("--container", choices=("fake", "bash"), default="fake",
+                        help="what plays the container (default: %(default)s)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        json.dump(run_size(args.child, args.container), sys.stdout)
+        return
+
+    results = []
+    for n in (int(s) for s in args.sizes.split(",")):
+        print(f"bench_sync: {n} agents...", file=sys.stderr)
+        out = subprocess.run([sys.executable, __file__, "--child", str(n), "--container", args.container],
+                             check=True, capture_output=True, text=True)
+        results.extend(json.loads(out.stdout))
+
+    report = {
+        "benchmark": "mc-openclaw-sync",
+        "python":    sys.version.split()[0],
+        "workers":   int(os.environ.get("MC_SYNC_WORKERS", "4")),
+        "container": args.container,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results":   results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+soak_sync.py
+------------
+Churn soak test for mc-openclaw-sync: how long a Mission Control edit takes
+to become readable in the container, under a steady stream and bursts of
+edits, and whether the container ends up matching the last roster written.
+
+Runs the daemon's real main() loop — watcher, sync queue, engine — in this
+process against a stand-in for the OpenClaw container:
+
+  dir    a directory on disk, synced through the host-volume transport
+         (works with either MC_SYNC_ENGINE)
+  fake   bench_sync.FakeContainer behind the session transport
+         (threads engine only)
+
+and replays a seeded stream of subagents.json mutations, each written the
+way server/store.js writes it (tmp file, then rename). Edits to fields that
+SOUL.md is built from carry a marker; an edit has propagated once its
+agent's SOUL.md shows that marker or a later one. Once the stream ends and
+the daemon settles, every SOUL.md and openclaw.json entry is checked against
+what the last roster renders to.
+
+Reports p50/p95/p99 propagation latency and the convergence result as JSON;
+exits 1 if the container didn't converge. Other MC_SYNC_* settings (workers,
+debounce, rate limits, engine) are passed through to the daemon.
+
+Usage:
+  python3 scripts/soak_sync.py                                  # JSON on stdout
+  python3 scripts/soak_sync.py --agents 50 --edits 500 --rate 20 --burst 5
+  python3 scripts/soak_sync.py --stand-in fake --output soak.json
+"""
+
+import argparse
+import importlib.util
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_sync import SCRIPT, FakeContainer, FakeSession, synthetic_roster, write_atomic  # noqa: E402
+
+BASE = "/data/.openclaw"
+INITIAL_OPENCLAW_JSON = {"agents": {"list": [{"id": "main"}]}, "tools": {"agentToAgent": {"allow": ["main"]}}}
+
+# Edits to these fields show up in the agent's own SOUL.md, so their latency
+# is measured; the rest only have to converge
+MEASURED = ("soul", "description", "role")
+KINDS = (*MEASURED, "model", "status")
+MARKER = re.compile(r"soak-(\d{6})")
+
+# ---------------------------------------------------------------------------
+# Stand-ins
+# ---------------------------------------------------------------------------
+
+class DirStandIn:
+    """The container's BASE as a directory, written through the volume transport."""
+
+    name = "dir"
+
+    def __init__(self, workdir: str) -> None:
+        self.root = os.path.join(workdir, "openclaw")
+        os.makedirs(os.path.join(self.root, "workspace", "skills"))
+        os.makedirs(os.path.join(self.root, "vault"))
+        with open(os.path.join(self.root, "openclaw.json"), "w", encoding="utf-8") as f:
+            json.dump(INITIAL_OPENCLAW_JSON, f)
+
+    def target(self) -> dict:
+        return {"name": "soak", "container": "soak", "base": BASE,
+                "transport": "volume", "host_base": self.root}
+
+    def attach(self, daemon) -> None:
+        pass
+
+    def read(self, path: str) -> str | None:
+        try:
+            with open(self.root + path[len(BASE):], "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def paths(self) -> list[str]:
+        return [BASE + os.path.join(d, name)[len(self.root):]
+                for d, dirs, files in os.walk(self.root) for name in files]
+
+
+class FakeStandIn:
+    """bench_sync's in-memory FakeContainer, reached through the session transport."""
+
+    name = "fake"
+
+    def __init__(self, workdir: str) -> None:
+        self.container = FakeContainer()
+        self.container.mkdirs(f"{BASE}/workspace/skills")
+        self.container.mkdirs(f"{BASE}/vault")
+        self.container.files[f"{BASE}/openclaw.json"] = json.dumps(INITIAL_OPENCLAW_JSON).encode()
+
+    def target(self) -> dict:
+        return {"name": "soak", "container": "soak", "base": BASE, "transport": "session"}
+
+    def attach(self, daemon) -> None:
+        daemon.targets[0].sessions.factory = lambda: FakeSession(self.container)
+
+    def read(self, path: str) -> str | None:
+        with self.container.lock:
+            data = self.container.files.get(self.container.resolve(path))
+        return data.decode() if data is not None else None
+
+    def paths(self) -> list[str]:
+        with self.container.lock:
+            return list(self.container.files)
+
+
+STAND_INS = {"dir": DirStandIn, "fake": FakeStandIn}
+
+# ---------------------------------------------------------------------------
+# Soak
+# ---------------------------------------------------------------------------
+
+def load_daemon(workdir: str, stand_in) -> object:
+    os.environ["MC_SYNC_TARGETS"]      = json.dumps([stand_in.target()])
+    os.environ["MC_SYNC_MANIFEST"]     = os.path.join(workdir, "manifest.json")
+    os.environ["MC_SYNC_TEMPLATE_DIR"] = os.path.join(workdir, "templates")
+    os.environ["MC_SYNC_METRICS"]      = ""
+    os.environ["MC_SYNC_CONTROL"]      = ""
+    os.environ["MC_SYNC_EVENTS"]       = "off"
+    spec = importlib.util.spec_from_file_location("mc_openclaw_sync", SCRIPT)
+    daemon = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(daemon)
+    daemon.SUBAGENTS_FILE = os.path.join(workdir, "subagents.json")
+    stand_in.attach(daemon)
+    return daemon
+
+
+def percentile(samples: list[float], p: float) -> float | None:
+    """Nearest-rank percentile of sorted samples."""
+    if not samples:
+        return None
+    return samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]
+
+
+class Propagation:
+    """Watches the stand-in for the edits still in flight and times them."""
+
+    def __init__(self, stand_in, interval: float) -> None:
+        self.stand_in  = stand_in
+        self.interval  = interval
+        self.pending: dict[str, list[tuple[int, float]]] = {}   # SOUL.md path -> [(seq, written at)]
+        self.latencies: list[float] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="soak-propagation", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def expect(self, path: str, seq: int, written_at: float) -> None:
+        with self._lock:
+            self.pending.setdefault(path, []).append((seq, written_at))
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(len(edits) for edits in self.pending.values())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                paths = list(self.pending)
+            for path in paths:
+                text = self.stand_in.read(path) or ""
+                seen = max(map(int, MARKER.findall(text)), default=0)
+                now = time.monotonic()
+                with self._lock:
+                    edits = self.pending.get(path, [])
+                    # Every roster written carries all earlier edits, so a
+                    # marker also accounts for the edits before it
+                    self.latencies.extend(now - t for seq, t in edits if seq <= seen)
+                    edits[:] = [(seq, t) for seq, t in edits if seq > seen]
+                    if not edits:
+                        del self.pending[path]
+
+
+def mutate(agent: dict, kind: str, seq: int, base: dict, rng: random.Random) -> None:
+    marker = f"soak-{seq:06d}"
+    if kind == "soul":
+        agent["soul"] = f"{base['soul']} [{marker}]"
+    elif kind == "description":
+        agent["description"] = f"{base['description']} [{marker}]"
+    elif kind == "role":
+        agent["role"] = f"{base['role']} {marker}"
+    elif kind == "model":
+        agent["model"] = rng.choice(("openai/gpt-5.2", "openai/gpt-5.3-codex", "anthropic/claude-sonnet"))
+    else:
+        agent["status"] = rng.choice(("idle", "busy", "blocked"))
+
+
+def settled(daemon, final_mtime: float) -> bool:
+    tgt = daemon.targets[0]
+    return (tgt.roster_mtime is not None and tgt.roster_mtime >= final_mtime
+            and tgt.last_applied is not None and tgt.last_error is None
+            and not tgt.queue.pending and not len(tgt.retries))
+
+
+def park(daemon, timeout: float) -> None:
+    """Stop the daemon touching workdir before it's removed: its loops never
+    return, so instead hold its circuit breaker (no sync starts after that)
+    and wait for the sync in flight, if any, to finish.
+    """
+    tgt = daemon.targets[0]
+    tgt.breaker.hold("soak over")
+    tgt.queue.wait_done(tgt.queue._taken, timeout)
+
+
+def check_convergence(daemon, stand_in, agents: list) -> list[str]:
+    """What in the stand-in doesn't match the final roster (empty if it converged)."""
+    problems = []
+    tgt = daemon.targets[0]
+    with tgt.activated():
+        for agent in agents:
+            path = f"{daemon.workspace_for(agent['name'])}/SOUL.md"
+            if stand_in.read(path) != daemon.build_soul_md(agent, agents):
+                problems.append(f"{path}: not the last roster's content")
+        try:
+            config = json.loads(stand_in.read(tgt.openclaw_json) or "")
+        except ValueError:
+            return problems + ["openclaw.json: missing or unparsable"]
+        entries = {e.get("id"): e for e in config.get("agents", {}).get("list", [])}
+        for agent in agents:
+            aid = daemon.agent_id_for(agent["name"])
+            entry = entries.get(aid)
+            if entry is None:
+                problems.append(f"openclaw.json: no entry for {aid}")
+            elif aid != "main" and entry.get("model") != agent["model"]:
+                problems.append(f"openclaw.json: {aid} has model {entry.get('model')!r}, not {agent['model']!r}")
+    problems += [f"{path}: staged file left behind" for path in stand_in.paths() if path.endswith(".mc-sync")]
+    return problems
+
+
+def soak(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    weights = dict.fromkeys(KINDS, 0.0)
+    for part in args.mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in weights:
+            raise SystemExit(f"soak_sync: unknown edit kind {kind!r} (expected one of {', '.join(KINDS)})")
+        weights[kind] = float(weight or 1)
+
+    # The daemon's threads are parked, not joined, when workdir is removed
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as workdir:
+        stand_in = STAND_INS[args.stand_in](workdir)
+        daemon = load_daemon(workdir, stand_in)
+        daemon.log.setLevel(args.log_level)
+        if args.stand_in == "fake" and daemon.ENGINE == "asyncio":
+            raise SystemExit("soak_sync: the fake stand-in only supports the threads engine")
+
+        agents = synthetic_roster(args.agents)
+        originals = [dict(a) for a in agents]
+        write_atomic(daemon.SUBAGENTS_FILE, agents)
+        threading.Thread(target=daemon.main, name="soak-daemon", daemon=True).start()
+
+        # The initial sync creates every workspace; edits start once it's applied
+        start = time.monotonic()
+        while not settled(daemon, os.stat(daemon.SUBAGENTS_FILE).st_mtime):
+            if time.monotonic() - start > args.settle:
+                raise SystemExit("soak_sync: the initial sync didn't finish")
+            time.sleep(0.05)
+        initial_secs = time.monotonic() - start
+
+        tgt = daemon.targets[0]
+        with tgt.activated():
+            souls = [f"{daemon.workspace_for(a['name'])}/SOUL.md" for a in agents]
+        propagation = Propagation(stand_in, args.poll_ms / 1000)
+        propagation.start()
+
+        # Bursts arrive at rate / burst a second, so edits average args.rate a second
+        start = time.monotonic()
+        seq = 0
+        while seq < args.edits:
+            time.sleep(rng.expovariate(args.rate / args.burst))
+            for _ in range(min(args.burst, args.edits - seq)):
+                seq += 1
+                i = rng.randrange(1, len(agents))   # Atlas's SOUL.md carries everyone's role
+                kind = rng.choices(KINDS, [weights[k] for k in KINDS])[0]
+                mutate(agents[i], kind, seq, originals[i], rng)
+                write_atomic(daemon.SUBAGENTS_FILE, agents)
+                if kind in MEASURED:
+                    propagation.expect(souls[i], seq, time.monotonic())
+                if args.burst_gap_ms:
+                    time.sleep(args.burst_gap_ms / 1000)
+        stream_secs = time.monotonic() - start
+
+        final_mtime = os.stat(daemon.SUBAGENTS_FILE).st_mtime
+        deadline = time.monotonic() + args.settle
+        while time.monotonic() < deadline and (propagation.in_flight or not settled(daemon, final_mtime)):
+            time.sleep(0.05)
+        propagation.stop()
+        problems = check_convergence(daemon, stand_in, agents)
+        daemon.log.setLevel("CRITICAL")   # the daemon thread outlives workdir
+        park(daemon, args.settle)
+
+        latencies = sorted(propagation.latencies)
+        cycles = {key[1]: int(n) for key, n in daemon.CYCLES._values.items()}
+        return {
+            "soak":         "mc-openclaw-sync",
+            "python":       sys.version.split()[0],
+            "timestamp":    time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "stand_in":     args.stand_in,
+            "engine":       daemon.ENGINE,
+            "workers":      daemon.SYNC_WORKERS,
+            "agents":       args.agents,
+            "edits":        args.edits,
+            "rate":         args.rate,
+            "burst":        args.burst,
+            "seed":         args.seed,
+            "initial_sync_secs": round(initial_secs, 6),
+            "stream_secs":  round(stream_secs, 6),
+            "latency_secs": {
+                "samples": len(latencies),
+                "p50":     percentile(latencies, 50),
+                "p95":     percentile(latencies, 95),
+                "p99":     percentile(latencies, 99),
+                "max":     latencies[-1] if latencies else None,
+                "mean":    sum(latencies) / len(latencies) if latencies else None,
+            },
+            "unpropagated": propagation.in_flight,
+            "cycles":       cycles,
+            "converged":    not problems,
+            "problems":     problems[:20],
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--stand-in", choices=sorted(STAND_INS), default="dir",
+                        help="what plays the container (default: %(default)s)")
+    parser.add_argument("--agents", type=int, default=25, help="roster size, Atlas included (default: %(default)s)")
+    parser.add_argument("--edits", type=int, default=200, help="subagents.json writes to replay (default: %(default)s)")
+    parser.add_argument("--rate", type=float, default=10.0, help="mean edits per second (default: %(default)s)")
+    parser.add_argument("--burst", type=int, default=1,
+                        help="edits written back to back per burst (default: %(default)s)")
+    parser.add_argument("--burst-gap-ms", type=float, default=0.0,
+                        help="pause between the writes of a burst (default: %(default)s)")
+    parser.add_argument("--mix", default="soul=6,description=2,role=1,model=1,status=1",
+                        help="relative weights of the edit kinds (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed (default: %(default)s)")
+    parser.add_argument("--poll-ms", type=float, default=2.0,
+                        help="how often the stand-in is checked for propagated edits (default: %(default)s)")
+    parser.add_argument("--settle", type=float, default=60.0,
+                        help="seconds to wait for the daemon to catch up (default: %(default)s)")
+    parser.add_argument("--log-level", default="WARNING", help="daemon log level (default: %(default)s)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    if args.agents < 2 or args.edits < 1 or args.rate <= 0 or args.burst < 1:
+        parser.error("need --agents >= 2, --edits >= 1, --rate > 0 and --burst >= 1")
+
+    report = soak(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    sys.exit(0 if report["converged"] else 1)
+
+
+if __name__ == "__main__":
+    main()
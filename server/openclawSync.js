@@ -0,0 +1,29 @@
+import http from 'http';
+import path from 'path';
+import { existsSync } from 'fs';
+import { DATA_DIR } from './store.js';
+
+// Control socket of mc-openclaw-sync, which runs on the host and listens next
+// to subagents.json (MC_SYNC_CONTROL there). Without it, the daemon still
+// picks changes up by watching the file — these requests only make it sooner.
+const SYNC_CONTROL_SOCKET = process.env.MC_SYNC_CONTROL_SOCKET || path.join(DATA_DIR, 'mc-openclaw-sync.sock');
+const REQUEST_TIMEOUT_MS = 2000;
+
+const postControl = (urlPath) => {
+    if (!existsSync(SYNC_CONTROL_SOCKET)) return;
+    const req = http.request({
+        socketPath: SYNC_CONTROL_SOCKET,
+        path: urlPath,
+        method: 'POST',
+        timeout: REQUEST_TIMEOUT_MS,
+    }, (res) => res.resume());
+    req.on('timeout', () => req.destroy());
+    req.on('error', (e) => console.warn(`mc-openclaw-sync: ${urlPath} failed: ${e.message}`));
+    req.end();
+};
+
+// Push a just-saved sub-agent to OpenClaw (fire-and-forget)
+export const requestAgentSync = (id) => postControl(`/sync/agent/${encodeURIComponent(id)}`);
+
+// Sync subagents.json now, e.g. after a sub-agent was deleted
+export const requestSync = () => postControl('/sync');
@@ -6,6 +6,7 @@ import { readData, writeData, readSkills, writeSkill, deleteSkill, setSkillEnabl
 import { authenticate, authorize } from './auth.js';
 import { syncCronJobs, runJobNow } from './cronRunner.js';
 import { triggerTaskStart, triggerOrchestratorRun } from './openclawGateway.js';
+import { requestAgentSync, requestSync } from './openclawSync.js';
 
 const router = express.Router();
 const requireAdmin = authorize('admin');
@@ -827,6 +828,7 @@ export const createRoutes = (broadcast) => {
         const newAgent = { id: uuidv4(), ...payload };
         subAgents.push(newAgent);
         writeData('subagents', subAgents);
+        requestAgentSync(newAgent.id);
         broadcast('subagents_update', subAgents);
         res.status(201).json(newAgent);
     });
@@ -841,6 +843,7 @@ export const createRoutes = (broadcast) => {
         if (index === -1) return res.status(404).json({ error: 'Sub-agent not found' });
         subAgents[index] = { ...subAgents[index], ...payload, id };
         writeData('subagents', subAgents);
+        requestAgentSync(id);
         broadcast('subagents_update', subAgents);
         res.json(subAgents[index]);
     });
@@ -853,6 +856,7 @@ export const createRoutes = (broadcast) => {
         subAgents = subAgents.filter((a) => a.id !== id);
         if (subAgents.length === initialLength) return res.status(404).json({ error: 'Sub-agent not found' });
         writeData('subagents', subAgents);
+        requestSync();
         broadcast('subagents_update', subAgents);
         res.json({ message: 'Sub-agent deleted' });
     });
@@ -0,0 +1,174 @@
+"""
+test_commit.py
+--------------
+Tests for mc-openclaw-sync's "commit" op, which moves a sync's staged files
+into place directory by directory: _COMMIT_SCRIPT, run by the local bash
+through the daemon's own session script (as scripts/bench_sync.py's
+BashContainer does), and HostVolume._op_commit on the "volume" transport.
+
+Usage:
+  python3 -m unittest discover -s tests
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import posixpath
+import subprocess
+import tempfile
+import unittest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mc-openclaw-sync.py")
+
+
+def digest(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class CommitTests:
+    """The commit op's behavior, on the transport a subclass sets up."""
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = os.path.join(tmp.name, "openclaw")
+        os.makedirs(self.root)
+        os.environ["MC_SYNC_TARGETS"]      = json.dumps([self.target_config()])
+        os.environ["MC_SYNC_MANIFEST"]     = os.path.join(tmp.name, "manifest.json")
+        os.environ["MC_SYNC_TEMPLATE_DIR"] = os.path.join(tmp.name, "templates")
+        os.environ["MC_SYNC_METRICS"]      = ""
+        os.environ["MC_SYNC_CONTROL"]      = ""
+        os.environ["MC_SYNC_EVENTS"]       = "off"
+        spec = importlib.util.spec_from_file_location("mc_openclaw_sync", SCRIPT)
+        self.d = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.d)
+        self.d.log.setLevel("CRITICAL")
+        self.tgt = self.d.targets[0]
+
+    def target_config(self) -> dict:
+        raise NotImplementedError
+
+    # -- helpers --------------------------------------------------------------
+
+    def path(self, relpath: str) -> str:
+        return os.path.join(self.root, relpath)
+
+    def put(self, relpath: str, content: str) -> None:
+        os.makedirs(os.path.dirname(self.path(relpath)), exist_ok=True)
+        with open(self.path(relpath), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def read(self, relpath: str) -> str:
+        with open(self.path(relpath), encoding="utf-8") as f:
+            return f.read()
+
+    def commit(self, files: dict[str, str], garbled: tuple[str, ...] = ()) -> tuple[int, dict[str, str]]:
+        """Stage files ({relpath: content}) and commit them in one op, the
+        staged copies of the files in garbled not as written. Returns the rc
+        and {failed directory (relative): reason}.
+        """
+        base = self.tgt.base
+        writes, entries = [], []
+        for relpath, content in files.items():
+            dest = f"{base}/{relpath}"
+            tmp = self.d.StagedCommit.temp_path(*posixpath.split(dest))
+            writes.append(("write", tmp, "garbled" if relpath in garbled else content))
+            entries.append((tmp, dest, digest(content)))
+        with self.tgt.activated():
+            *_, (rc, out, _) = self.d.docker_pipeline(writes + [("commit", entries)])
+        failed = {}
+        for line in out.splitlines():
+            directory, _, reason = line.partition("\t")
+            failed[posixpath.relpath(directory, base)] = reason
+        return rc, failed
+
+    def leftovers(self) -> list[str]:
+        return sorted(os.path.relpath(os.path.join(d, f), self.root)
+                      for d, _, names in os.walk(self.root) for f in names if f.endswith(".mc-sync"))
+
+    # -- tests ----------------------------------------------------------------
+
+    def test_commit_moves_every_file_into_place(self) -> None:
+        self.put("workspace-a/SOUL.md", "old a\n")
+        rc, failed = self.commit({"workspace-a/SOUL.md": "new a\n", "workspace-a/IDENTITY.md": "id a\n",
+                                  "openclaw.json": "{}\n"})
+        self.assertEqual((rc, failed), (0, {}))
+        self.assertEqual(self.read("workspace-a/SOUL.md"), "new a\n")
+        self.assertEqual(self.read("workspace-a/IDENTITY.md"), "id a\n")
+        self.assertEqual(self.read("openclaw.json"), "{}\n")
+        self.assertEqual(self.leftovers(), [])
+
+    def test_failing_directory_leaves_the_others_committed(self) -> None:
+        for name in "abc":
+            self.put(f"workspace-{name}/SOUL.md", f"old {name}\n")
+        rc, failed = self.commit({f"workspace-{name}/{f}": f"new {name} {f}\n"
+                                  for name in "abc" for f in ("SOUL.md", "IDENTITY.md")},
+                                 garbled=("workspace-b/IDENTITY.md",))
+        self.assertEqual(rc, 1)
+        self.assertEqual(list(failed), ["workspace-b"])
+        for name in "ac":
+            self.assertEqual(self.read(f"workspace-{name}/SOUL.md"), f"new {name} SOUL.md\n")
+            self.assertEqual(self.read(f"workspace-{name}/IDENTITY.md"), f"new {name} IDENTITY.md\n")
+        # None of the failed directory's files were moved, not even the good one
+        self.assertEqual(self.read("workspace-b/SOUL.md"), "old b\n")
+        self.assertFalse(os.path.exists(self.path("workspace-b/IDENTITY.md")))
+        self.assertEqual(self.leftovers(), [])
+
+    def test_hash_mismatch(self) -> None:
+        self.put("workspace-a/SOUL.md", "old\n")
+        rc, failed = self.commit({"workspace-a/SOUL.md": "new\n"}, garbled=("workspace-a/SOUL.md",))
+        self.assertEqual((rc, failed), (1, {"workspace-a": "staged SOUL.md missing or not as written"}))
+        self.assertEqual(self.read("workspace-a/SOUL.md"), "old\n")
+        self.assertEqual(self.leftovers(), [])
+
+    def test_destination_is_a_directory(self) -> None:
+        os.makedirs(self.path("workspace-a/SOUL.md"))
+        self.put("workspace-b/SOUL.md", "old b\n")
+        rc, failed = self.commit({"workspace-a/SOUL.md": "new a\n", "workspace-a/IDENTITY.md": "id a\n",
+                                  "workspace-b/SOUL.md": "new b\n"})
+        self.assertEqual((rc, failed), (1, {"workspace-a": "SOUL.md is a directory"}))
+        self.assertTrue(os.path.isdir(self.path("workspace-a/SOUL.md")))
+        self.assertFalse(os.path.exists(self.path("workspace-a/IDENTITY.md")))
+        self.assertEqual(self.read("workspace-b/SOUL.md"), "new b\n")
+        self.assertEqual(self.leftovers(), [])
+
+    def test_commit_keeps_the_mode_of_the_file_it_replaces(self) -> None:
+        self.put("workspace-a/SOUL.md", "old\n")
+        os.chmod(self.path("workspace-a/SOUL.md"), 0o600)
+        self.assertEqual(self.commit({"workspace-a/SOUL.md": "new\n"}), (0, {}))
+        self.assertEqual(os.stat(self.path("workspace-a/SOUL.md")).st_mode & 0o777, 0o600)
+
+
+class SessionCommitTest(CommitTests, unittest.TestCase):
+    """_COMMIT_SCRIPT, run through _SESSION_SCRIPT by the local bash."""
+
+    def target_config(self) -> dict:
+        return {"name": "bash", "container": "oc", "base": self.root, "transport": "session"}
+
+    def setUp(self) -> None:
+        super().setUp()
+        daemon = self.d
+
+        class BashSession(daemon.ContainerSession):
+            def _start(self) -> None:
+                self._proc = subprocess.Popen(
+                    ["bash", "-c", daemon._SESSION_SCRIPT],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                )
+                self.spawns += 1
+
+        self.tgt.sessions.factory = lambda: BashSession("oc")
+        self.addCleanup(self.tgt.sessions.close)
+
+
+class VolumeCommitTest(CommitTests, unittest.TestCase):
+    """HostVolume._op_commit: the container's filesystem mounted on the host."""
+
+    def target_config(self) -> dict:
+        return {"name": "vol", "container": "oc", "base": "/data/.openclaw", "transport": "volume",
+                "host_base": self.root}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,256 @@
+"""
+test_engine_api.py
+------------------
+Tests for mc-openclaw-sync's "api" transport (EngineAPIClient) against a
+fake Docker Engine API served on a unix socket.
+
+The fake answers the endpoints the client uses: exec create, start (a
+hijacked connection carrying the multiplexed stdout/stderr stream) and
+inspect, and the archive PUT/GET pair. Execs run under the local bash and
+archives unpack onto the local filesystem, so container paths are host
+paths under a temp dir.
+
+Usage:
+  python3 -m unittest discover -s tests
+"""
+
+import http.server
+import importlib.util
+import io
+import itertools
+import json
+import os
+import socketserver
+import subprocess
+import tarfile
+import tempfile
+import threading
+import unittest
+import urllib.parse
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mc-openclaw-sync.py")
+
+
+class FakeEngineAPI(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Just enough of the Docker Engine API for EngineAPIClient."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, frame_size: int = 3) -> None:
+        super().__init__(socket_path, _Handler)
+        self.frame_size = frame_size   # stdout/stderr go out in frames this big, interleaved
+        self.stuck = False             # report every exec as running, forever
+        self.execs: dict[str, dict] = {}
+        self.requests: list[tuple[str, str]] = []
+        self.lock = threading.Lock()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _reply(self, status: int, data: bytes = b"", content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str) -> None:
+        self._reply(status, json.dumps({"message": message}).encode())
+
+    def _route(self) -> tuple[list[str], dict[str, str]]:
+        url = urllib.parse.urlsplit(self.path)
+        with self.server.lock:
+            self.server.requests.append((self.command, url.path))
+        # /v1.41/<resource>/<id>/<action>
+        return url.path.strip("/").split("/")[1:], dict(urllib.parse.parse_qsl(url.query))
+
+    def do_POST(self) -> None:
+        parts, _ = self._route()
+        body = self._body()
+        if parts[0] == "containers" and parts[2:] == ["exec"]:
+            with self.server.lock:
+                exec_id = f"exec{len(self.server.execs)}"
+                self.server.execs[exec_id] = {"cmd": json.loads(body)["Cmd"], "inspected": 0}
+            self._reply(201, json.dumps({"Id": exec_id}).encode())
+        elif parts[0] == "exec" and parts[2:] == ["start"]:
+            run = self.server.execs.get(parts[1])
+            if run is None:
+                return self._error(404, f"No such exec instance: {parts[1]}")
+            proc = subprocess.run(run["cmd"], capture_output=True)
+            run["rc"] = proc.returncode
+            self.send_response(101)
+            self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Upgrade", "tcp")
+            self.end_headers()
+            n = self.server.frame_size
+            out = [(1, proc.stdout[i:i + n]) for i in range(0, len(proc.stdout), n)]
+            err = [(2, proc.stderr[i:i + n]) for i in range(0, len(proc.stderr), n)]
+            for pair in itertools.zip_longest(out, err):
+                for stream, data in filter(None, pair):
+                    self.wfile.write(bytes([stream, 0, 0, 0]) + len(data).to_bytes(4, "big") + data)
+            self.close_connection = True
+        else:
+            self._error(404, "page not found")
+
+    def do_GET(self) -> None:
+        parts, query = self._route()
+        if parts[0] == "exec" and parts[2:] == ["json"]:
+            run = self.server.execs[parts[1]]
+            # Report the exec as still running once, as the daemon may after the stream ends
+            run["inspected"] += 1
+            running = run["inspected"] == 1 or self.server.stuck
+            self._reply(200, json.dumps({"Running": running,
+                                         "ExitCode": None if running else run["rc"]}).encode())
+        elif parts[0] == "containers" and parts[2:] == ["archive"]:
+            path = query["path"]
+            if not os.path.lexists(path):
+                return self._error(404, f"Could not find the file {path} in container")
+            buf = io.BytesIO()
+            with tarfile.open(fileobj=buf, mode="w") as tar:
+                tar.add(path, arcname=os.path.basename(path))
+            self._reply(200, buf.getvalue(), "application/x-tar")
+        else:
+            self._error(404, "page not found")
+
+    def do_PUT(self) -> None:
+        parts, query = self._route()
+        body = self._body()
+        if parts[0] != "containers" or parts[2:] != ["archive"]:
+            return self._error(404, "page not found")
+        if not os.path.isdir(query["path"]):
+            return self._error(404, f"Could not find the file {query['path']} in container")
+        with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+            if hasattr(tarfile, "tar_filter"):
+                tar.extractall(query["path"], filter="tar")
+            else:
+                tar.extractall(query["path"])
+        self._reply(200)
+
+
+class EngineAPITransportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.root = os.path.join(cls.tmp.name, "openclaw")
+        cls.socket_path = os.path.join(cls.tmp.name, "docker.sock")
+        cls.server = FakeEngineAPI(cls.socket_path)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+        os.environ["MC_SYNC_TARGETS"] = json.dumps([
+            {"name": "api", "container": "oc", "base": cls.root, "transport": "api"},
+        ])
+        os.environ["MC_SYNC_DOCKER_SOCKET"] = cls.socket_path
+        os.environ["MC_SYNC_MANIFEST"]      = os.path.join(cls.tmp.name, "manifest.json")
+        os.environ["MC_SYNC_TEMPLATE_DIR"]  = os.path.join(cls.tmp.name, "templates")
+        os.environ["MC_SYNC_METRICS"]       = ""
+        os.environ["MC_SYNC_CONTROL"]       = ""
+        os.environ["MC_SYNC_EVENTS"]        = "off"
+        spec = importlib.util.spec_from_file_location("mc_openclaw_sync", SCRIPT)
+        cls.daemon = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(cls.daemon)
+        cls.daemon.log.setLevel("CRITICAL")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmp.cleanup()
+
+    def setUp(self) -> None:
+        self.client = self.daemon.EngineAPIClient(self.socket_path, "oc")
+        self.addCleanup(self.client.close)
+        self.dir = tempfile.mkdtemp(dir=self.tmp.name)
+
+    def test_exec_exit_code(self) -> None:
+        self.assertEqual(self.client.exec("exit 3"), (3, "", ""))
+        self.assertEqual(self.client.exec("true"), (0, "", ""))
+
+    def test_exec_still_running_fails(self) -> None:
+        self.server.stuck = True
+        self.addCleanup(setattr, self.server, "stuck", False)
+        timeout = self.daemon.OP_TIMEOUT_SECS
+        self.daemon.OP_TIMEOUT_SECS = 0.2
+        self.addCleanup(setattr, self.daemon, "OP_TIMEOUT_SECS", timeout)
+        rc, stdout, stderr = self.client.exec("echo hi")
+        self.assertEqual((rc, stdout), (1, "hi\n"))
+        self.assertIn("exit code unknown", stderr)
+
+    def test_exec_demultiplexes_stdout_and_stderr(self) -> None:
+        out = "".join(f"line {i}\n" for i in range(200))
+        rc, stdout, stderr = self.client.exec(
+            "for i in $(seq 0 199); do echo \"line $i\"; done; echo oops >&2; echo 'é' >&2; exit 1")
+        self.assertEqual((rc, stdout, stderr), (1, out, "oops\né\n"))
+
+    def test_write_and_read_through_the_archive_endpoints(self) -> None:
+        path = os.path.join(self.dir, "SOUL.md")
+        self.client.write(path, "# Soul\n\nmultibyte: ✓\n")
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "# Soul\n\nmultibyte: ✓\n")
+        self.assertEqual(self.client.read(path), "# Soul\n\nmultibyte: ✓\n")
+        self.assertIn(("PUT", "/v1.41/containers/oc/archive"), self.server.requests)
+
+    def test_archive_errors(self) -> None:
+        with self.assertRaises(self.daemon.EngineAPIError) as caught:
+            self.client.read(os.path.join(self.dir, "missing.md"))
+        self.assertEqual(caught.exception.status, 404)
+        with self.assertRaises(self.daemon.EngineAPIError):
+            self.client.read(self.dir)   # a directory, not a regular file
+        with self.assertRaises(self.daemon.EngineAPIError) as caught:
+            self.client.write(os.path.join(self.dir, "no-such-dir", "SOUL.md"), "x")
+        self.assertEqual(caught.exception.status, 404)
+
+    def test_run_ops(self) -> None:
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            data = b"scaffold\n"
+            info = tarfile.TarInfo("workspace-a/MEMORY.md")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        path = os.path.join(self.dir, "workspace-a", "MEMORY.md")
+        results = self.client.run([
+            ("untar", self.dir, buf.getvalue()),
+            ("read", path),
+            ("write", os.path.join(self.dir, "workspace-a", "SOUL.md"), "soul\n"),
+            ("exec", f"cat {self.dir}/workspace-a/SOUL.md; echo done >&2"),
+            ("read", os.path.join(self.dir, "missing.md")),
+        ])
+        self.assertEqual(results[:4], [(0, "", ""), (0, "scaffold\n", ""), (0, "", ""), (0, "soul\n", "done\n")])
+        self.assertEqual(results[4][0], 1)
+        self.assertIn("HTTP 404", results[4][2])
+
+    def test_sync_cycle(self) -> None:
+        """A full sync over the api transport: probe, scaffold, staged commit."""
+        d = self.daemon
+        os.makedirs(os.path.join(self.root, "workspace", "skills"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "vault"), exist_ok=True)
+        with open(os.path.join(self.root, "openclaw.json"), "w", encoding="utf-8") as f:
+            json.dump({"agents": {"list": [{"id": "main"}]}}, f)
+        agents = [
+            {"id": "1", "name": "Atlas", "role": "CEO", "description": "Runs things", "soul": "Lead."},
+            {"id": "2", "name": "Scout", "role": "Research", "description": "Finds things", "soul": "Look."},
+        ]
+        tgt = d.targets[0]
+        with tgt.activated():
+            self.assertTrue(d.sync_changes(agents, restarted=True))
+            agents[1]["soul"] = "Look closer."
+            self.assertTrue(d.sync_changes(agents))
+            soul = os.path.join(d.workspace_for("Scout"), "SOUL.md")
+            with open(soul, encoding="utf-8") as f:
+                self.assertEqual(f.read(), d.build_soul_md(agents[1], agents))
+        with open(os.path.join(self.root, "openclaw.json"), encoding="utf-8") as f:
+            ids = [a["id"] for a in json.load(f)["agents"]["list"]]
+        self.assertIn("scout", ids)
+        self.assertEqual([n for n in os.listdir(os.path.dirname(soul)) if n.endswith(".mc-sync")], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,266 @@
+"""
+test_volume_sync.py
+-------------------
+Tests for mc-openclaw-sync's sync cycles on the "volume" transport: the
+container's filesystem is a temp dir, mounted (as far as the daemon knows)
+at /data/.openclaw.
+
+Usage:
+  python3 -m unittest discover -s tests
+"""
+
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mc-openclaw-sync.py")
+BASE = "/data/.openclaw"
+
+
+def roster(*names: str) -> list[dict]:
+    return [{"id": name.lower(), "name": name, "role": "CEO" if name == "Atlas" else "Research",
+             "status": "idle", "model": "openai/gpt-5.2", "description": f"{name} does things.",
+             "soul": f"{name} is thorough."} for name in names]
+
+
+class VolumeSyncTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = os.path.join(tmp.name, "openclaw")
+        os.makedirs(os.path.join(self.root, "workspace", "skills"))
+        os.makedirs(os.path.join(self.root, "vault"))
+        self.write_json({"agents": {"list": [{"id": "main"}]}, "tools": {"agentToAgent": {"allow": ["main"]}}})
+
+        os.environ["MC_SYNC_TARGETS"] = json.dumps([
+            {"name": "vol", "container": "oc", "base": BASE, "transport": "volume", "host_base": self.root},
+        ])
+        os.environ["MC_SYNC_MANIFEST"]     = os.path.join(tmp.name, "manifest.json")
+        os.environ["MC_SYNC_TEMPLATE_DIR"] = os.path.join(tmp.name, "templates")
+        os.environ["MC_SYNC_METRICS"]      = ""
+        os.environ["MC_SYNC_CONTROL"]      = ""
+        os.environ["MC_SYNC_EVENTS"]       = "off"
+        self.start_daemon()
+
+    def start_daemon(self) -> None:
+        """Load a fresh copy of the daemon, picking up its manifest as main() does."""
+        spec = importlib.util.spec_from_file_location("mc_openclaw_sync", SCRIPT)
+        self.d = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.d)
+        self.d.log.setLevel("CRITICAL")
+        self.tgt = self.d.targets[0]
+        with self.tgt.activated():
+            if self.tgt.manifest.load():
+                self.tgt.write_cache.restore(self.tgt.manifest.files)
+                self.tgt.write_cache.restore_history(self.tgt.manifest.history)
+
+    # -- helpers --------------------------------------------------------------
+
+    def host(self, path: str) -> str:
+        return self.root + path[len(BASE):]
+
+    def workspace(self, name: str) -> str:
+        with self.tgt.activated():
+            return self.host(self.d.workspace_for(name))
+
+    def read(self, path: str) -> str:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def read_json(self) -> dict:
+        return json.loads(self.read(os.path.join(self.root, "openclaw.json")))
+
+    def write_json(self, data: dict) -> None:
+        with open(os.path.join(self.root, "openclaw.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def agent_ids(self) -> list[str]:
+        return [a["id"] for a in self.read_json()["agents"]["list"]]
+
+    def sync(self, agents: list, **kwargs) -> bool:
+        with self.tgt.activated():
+            return self.d.sync_changes(agents, **kwargs)
+
+    def backups(self, name: str) -> list[str]:
+        return sorted(f for f in os.listdir(self.workspace(name)) if f.endswith(".bak"))
+
+    def fail_commit(self, dest_suffix: str) -> None:
+        """Make the next commit find the staged file for dest_suffix not as written."""
+        volume = self.tgt.volume
+        commit = volume._op_commit
+
+        def failing(entries):
+            for tmp, dest, _ in entries:
+                if dest.endswith(dest_suffix):
+                    with open(volume._host(tmp), "w", encoding="utf-8") as f:
+                        f.write("garbled")
+            volume._op_commit = commit
+            return commit(entries)
+        volume._op_commit = failing
+
+    def record_commits(self) -> list[list[str]]:
+        """The destinations (relative to the base) of every commit from now on."""
+        volume = self.tgt.volume
+        commit = volume._op_commit
+        commits = []
+
+        def recording(entries):
+            commits.append(sorted(dest[len(BASE):] for _, dest, _ in entries))
+            return commit(entries)
+        volume._op_commit = recording
+        return commits
+
+    def override_template(self, name: str, text: str) -> None:
+        os.makedirs(os.environ["MC_SYNC_TEMPLATE_DIR"], exist_ok=True)
+        with open(os.path.join(os.environ["MC_SYNC_TEMPLATE_DIR"], name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    # -- openclaw.json --------------------------------------------------------
+
+    def test_roster_work_is_committed_before_repair_work(self) -> None:
+        agents = roster("Atlas", "Scout", "Echo")
+        self.assertTrue(self.sync(agents))
+        commits = self.record_commits()
+        # Scout's and Echo's SOUL.md only need re-rendering; Atlas's roster and openclaw.json change
+        self.override_template("SOUL.md", "# {name}\n\n{soul_block}\n")
+        agents += roster("Nova")
+        agents[1]["model"] = "anthropic/claude-sonnet-4"
+        self.assertTrue(self.sync(agents))
+        self.assertEqual(commits, [["/openclaw.json", "/workspace/SOUL.md"],
+                                   ["/workspace-echo/SOUL.md", "/workspace-scout/SOUL.md"]])
+        self.assertIn("nova", self.agent_ids())
+
+
+    def test_failed_openclaw_json_commit_is_replayed_onto_remote_edits(self) -> None:
+        agents = roster("Atlas", "Scout")
+        self.assertTrue(self.sync(agents))
+        agents += roster("Nova")
+        self.fail_commit("/openclaw.json")
+        self.assertFalse(self.sync(agents))
+        self.assertNotIn("nova", self.agent_ids())
+
+        # Edited in the container while the change is still pending
+        data = self.read_json()
+        data["channels"] = {"slack": {"enabled": True}}
+        self.write_json(data)
+
+        self.assertTrue(self.sync(agents))
+        data = self.read_json()
+        self.assertEqual(data["channels"], {"slack": {"enabled": True}})
+        self.assertIn("nova", self.agent_ids())
+        self.assertIn("nova", data["tools"]["agentToAgent"]["allow"])
+
+    # -- renamed and removed agents -------------------------------------------
+
+    def leave_note(self, name: str) -> str:
+        """Something the agent wrote in its workspace, to follow it around."""
+        with open(os.path.join(self.workspace(name), "notes.md"), "w", encoding="utf-8") as f:
+            f.write(f"{name} was here.\n")
+        return f"{name} was here.\n"
+
+    def removed(self) -> list[str]:
+        return sorted(os.listdir(os.path.join(self.root, "removed")))
+
+    def test_rename_moves_the_workspace_and_openclaw_json_entry(self) -> None:
+        agents = roster("Atlas", "Scout", "Echo")
+        self.assertTrue(self.sync(agents))
+        note = self.leave_note("Scout")
+        agents[1]["name"] = "Ranger"
+        with self.tgt.activated():
+            diff = self.tgt.manifest.diff(agents)
+        self.assertEqual(diff.renamed, {"scout": ("Scout", "Ranger")})
+
+        self.assertTrue(self.sync(agents))
+        self.assertFalse(os.path.exists(self.workspace("Scout")))
+        self.assertEqual(self.read(os.path.join(self.workspace("Ranger"), "notes.md")), note)
+        self.assertIn("Ranger", self.read(os.path.join(self.workspace("Ranger"), "SOUL.md")))
+        self.assertEqual(self.agent_ids(), ["main", "ranger", "echo"])
+        self.assertNotIn("scout", self.read_json()["tools"]["agentToAgent"]["allow"])
+        self.assertIn("ranger", self.read_json()["tools"]["agentToAgent"]["allow"])
+        entry = self.read_json()["agents"]["list"][1]
+        self.assertEqual((entry["name"], entry["workspace"]), ("Ranger", f"{BASE}/workspace-ranger"))
+
+    def test_removal_moves_the_workspace_aside(self) -> None:
+        agents = roster("Atlas", "Scout", "Echo")
+        self.assertTrue(self.sync(agents))
+        note = self.leave_note("Echo")
+        with self.tgt.activated():
+            diff = self.tgt.manifest.diff(agents[:2])
+        self.assertEqual(diff.removed, {"echo": "Echo"})
+
+        self.assertTrue(self.sync(agents[:2]))
+        self.assertFalse(os.path.exists(self.workspace("Echo")))
+        [moved] = self.removed()
+        self.assertTrue(moved.startswith("workspace-echo-"))
+        self.assertEqual(self.read(os.path.join(self.root, "removed", moved, "notes.md")), note)
+        self.assertEqual(self.agent_ids(), ["main", "scout"])
+        self.assertNotIn("echo", self.read_json()["tools"]["agentToAgent"]["allow"])
+
+    def test_rename_leaves_an_agent_id_still_in_use_alone(self) -> None:
+        agents = roster("Atlas", "Scout", "Echo")
+        self.assertTrue(self.sync(agents))
+        scout = self.leave_note("Scout")
+        echo = self.leave_note("Echo")
+        # Scout takes Echo's name as Echo leaves; a new agent takes Scout's
+        agents = [agents[0], {**agents[1], "name": "Echo"},
+                  {**roster("Scout")[0], "id": "scout-2", "soul": "Scout is new here."}]
+
+        self.assertTrue(self.sync(agents))
+        self.assertEqual(self.read(os.path.join(self.workspace("Scout"), "notes.md")), scout)
+        self.assertEqual(self.read(os.path.join(self.workspace("Echo"), "notes.md")), echo)
+        self.assertIn("Scout is new here.", self.read(os.path.join(self.workspace("Scout"), "SOUL.md")))
+        self.assertIn("Scout is thorough.", self.read(os.path.join(self.workspace("Echo"), "SOUL.md")))
+        self.assertFalse(os.path.exists(os.path.join(self.root, "removed")))
+        self.assertEqual(sorted(self.agent_ids()), ["echo", "main", "scout"])
+
+    def test_status_only_edit_writes_nothing(self) -> None:
+        agents = roster("Atlas", "Scout")
+        self.assertTrue(self.sync(agents))
+        agents[1]["status"] = "working"
+        with self.tgt.activated():
+            diff = self.tgt.manifest.diff(agents)
+        self.assertEqual(diff.changed, {"scout": {"status"}})
+        self.assertEqual(diff.stale, {})
+
+        commits = self.record_commits()
+        before = os.stat(os.path.join(self.root, "openclaw.json")).st_mtime_ns
+        self.assertTrue(self.sync(agents))
+        self.assertEqual(commits, [])
+        self.assertEqual(os.stat(os.path.join(self.root, "openclaw.json")).st_mtime_ns, before)
+
+    # -- SOUL.md divergence ---------------------------------------------------
+
+    def test_restart_leaves_soul_md_edited_in_container(self) -> None:
+        agents = roster("Atlas", "Scout")
+        self.assertTrue(self.sync(agents))
+        soul = os.path.join(self.workspace("Scout"), "SOUL.md")
+        with open(soul, "w", encoding="utf-8") as f:
+            f.write("# Scout\n\nEdited by the agent.\n")
+
+        self.start_daemon()
+        self.assertTrue(self.sync(agents, restarted=True))
+        self.assertEqual(self.read(soul), "# Scout\n\nEdited by the agent.\n")
+        self.assertEqual(self.backups("Scout"), [])
+
+    def test_restart_restores_soul_md_rolled_back_to_an_earlier_push(self) -> None:
+        agents = roster("Atlas", "Scout")
+        self.assertTrue(self.sync(agents))
+        soul = os.path.join(self.workspace("Scout"), "SOUL.md")
+        first = self.read(soul)
+        agents[1]["soul"] = "Scout double-checks."
+        self.assertTrue(self.sync(agents))
+        second = self.read(soul)
+        with open(soul, "w", encoding="utf-8") as f:
+            f.write(first)   # e.g. the volume was restored from an old snapshot
+
+        self.start_daemon()
+        self.assertTrue(self.sync(agents, restarted=True))
+        self.assertEqual(self.read(soul), second)
+        self.assertEqual(self.backups("Scout"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()